@@ -24,6 +24,7 @@ from mutagen.mp3 import MP3
 from mutagen.easyid3 import EasyID3
 import subprocess
 import re
+from media_cache import get_media_cache
 
 logger = logging.getLogger(__name__)
 
@@ -36,8 +37,8 @@ class AudioProcessor:
             '.mp3', '.m4a', '.aac', '.ogg', '.wav', '.flac', '.wma', '.opus'
         ]
         
-        # Cache للملفات الصوتية المعالجة مسبقاً
-        self.processed_audio_cache = {}
+        # Cache مشترك للملفات الصوتية المعالجة مسبقاً (محدود بالبايتات)
+        self.media_cache = get_media_cache()
         
         # التحقق من توفر FFmpeg
         self.ffmpeg_available = self._check_ffmpeg_availability()
@@ -485,12 +486,16 @@ class AudioProcessor:
         """معالجة المقطع الصوتي مرة واحدة لإعادة الاستخدام"""
         try:
             # إنشاء مفتاح cache
-            cache_key = f"{task_id}_{hash(audio_bytes)}_{file_name}"
+            cache_key = self._generate_cache_key(
+                audio_bytes, file_name, metadata_template, album_art_path,
+                apply_art_to_all, audio_intro_path, audio_outro_path, intro_position
+            )
             
             # التحقق من cache
-            if cache_key in self.processed_audio_cache:
+            cached_audio = self.media_cache.get(cache_key)
+            if cached_audio is not None:
                 logger.info(f"🎵 استخدام المقطع الصوتي المعالج من cache للمهمة {task_id}")
-                return self.processed_audio_cache[cache_key]
+                return cached_audio
             
             # معالجة المقطع الصوتي
             processed_audio = self.process_audio_metadata(
@@ -500,18 +505,8 @@ class AudioProcessor:
             
             if processed_audio and processed_audio != audio_bytes:
                 # حفظ في cache
-                self.processed_audio_cache[cache_key] = processed_audio
-                
-                # تنظيف cache إذا تجاوز الحجم
-                if len(self.processed_audio_cache) > 50:
-                    oldest_keys = list(self.processed_audio_cache.keys())[:10]
-                    for key in oldest_keys:
-                        del self.processed_audio_cache[key]
-                
+                self.media_cache.put(cache_key, processed_audio)
                 logger.info(f"✅ تم معالجة المقطع الصوتي وحفظه في cache للمهمة {task_id}")
-            else:
-                # حفظ الملف الأصلي في cache
-                self.processed_audio_cache[cache_key] = audio_bytes
             
             return processed_audio
             
@@ -519,14 +514,26 @@ class AudioProcessor:
             logger.error(f"خطأ في معالجة المقطع الصوتي مرة واحدة: {e}")
             return audio_bytes
     
+    def _generate_cache_key(self, audio_bytes: bytes, file_name: str, metadata_template: Dict[str, str],
+                            album_art_path: Optional[str] = None, apply_art_to_all: bool = False,
+                            audio_intro_path: Optional[str] = None, audio_outro_path: Optional[str] = None,
+                            intro_position: str = 'start') -> str:
+        """مفتاح cache: hash المحتوى + بصمة كل الإعدادات المؤثرة على الناتج"""
+        settings = {
+            'metadata_template': metadata_template,
+            'album_art_path': album_art_path,
+            'apply_art_to_all': apply_art_to_all,
+            'audio_intro_path': audio_intro_path,
+            'audio_outro_path': audio_outro_path,
+            'intro_position': intro_position,
+        }
+        return self.media_cache.make_key('audio', audio_bytes, file_name, settings)
+    
     def clear_cache(self):
         """مسح cache"""
-        self.processed_audio_cache.clear()
+        self.media_cache.clear('audio')
         logger.info("🧹 تم مسح cache المقاطع الصوتية")
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """الحصول على إحصائيات cache"""
-        return {
-            'cache_size': len(self.processed_audio_cache),
-            'cache_keys': list(self.processed_audio_cache.keys())
-        }
\ No newline at end of file
+        return self.media_cache.get_stats('audio')
\ No newline at end of file
@@ -2,12 +2,33 @@
 Database Package - يدعم SQLite و PostgreSQL
 """
 
+import threading
+
 from .database_factory import DatabaseFactory
 
+# نسخة قاعدة البيانات المشتركة على مستوى العملية (البوت + UserBot)
+_shared_database = None
+_shared_database_lock = threading.Lock()
+
 # إنشاء قاعدة البيانات الافتراضية
 def get_database():
-    """الحصول على قاعدة البيانات المناسبة"""
-    return DatabaseFactory.create_database()
+    """الحصول على قاعدة البيانات المناسبة
+
+    يتم إنشاء قاعدة البيانات وتهيئة الجداول مرة واحدة فقط،
+    وتعيد الاستدعاءات اللاحقة نفس النسخة دون أي عمليات DDL
+    """
+    global _shared_database
+    if _shared_database is None:
+        with _shared_database_lock:
+            if _shared_database is None:
+                _shared_database = DatabaseFactory.create_database()
+    return _shared_database
+
+def reset_database():
+    """إعادة تعيين النسخة المشتركة (للاختبارات أو بعد تغيير DATABASE_TYPE)"""
+    global _shared_database
+    with _shared_database_lock:
+        _shared_database = None
 
 # تصدير المصنع للاستخدام المباشر
-__all__ = ['DatabaseFactory', 'get_database']
+__all__ = ['DatabaseFactory', 'get_database', 'reset_database']
@@ -4,22 +4,65 @@ SQLite Database management for Telegram Bot System
 import sqlite3
 import logging
 import os
+import threading
 from typing import List, Dict, Optional, Tuple
-from datetime import datetime
+from datetime import datetime, timezone
+
+from .settings_cache import install_settings_invalidation, settings_cache
+from .word_filter import check_word_filters
+from .text_replacement import apply_replacement_rules
+from .sqlite_pool import SQLiteConnectionPool
 
 logger = logging.getLogger(__name__)
 
 class Database:
-    def __init__(self):
+    # Schema bootstrap runs once per database file per process
+    _schema_ready = set()
+    _schema_lock = threading.Lock()
+    # One connection pool per database file, shared by all Database instances
+    _pools: Dict[str, SQLiteConnectionPool] = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, db_path: str = 'telegram_bot.db'):
         """Initialize SQLite database connection"""
-        self.db_path = 'telegram_bot.db'
-        self.init_database()
+        self.db_path = db_path
+        self.ensure_schema()
+
+    def ensure_schema(self):
+        """Run init_database() only the first time this database file is opened"""
+        key = os.path.abspath(self.db_path)
+        if key in Database._schema_ready:
+            return
+        with Database._schema_lock:
+            if key in Database._schema_ready:
+                return
+            self.init_database()
+            Database._schema_ready.add(key)
+
+    @property
+    def pool(self) -> SQLiteConnectionPool:
+        """Connection pool for this database file"""
+        key = os.path.abspath(self.db_path)
+        pool = Database._pools.get(key)
+        if pool is None:
+            with Database._pools_lock:
+                pool = Database._pools.get(key)
+                if pool is None:
+                    pool = SQLiteConnectionPool(self.db_path)
+                    Database._pools[key] = pool
+        return pool
 
     def get_connection(self):
-        """Get SQLite database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Get SQLite database connection (reused per thread, WAL mode)"""
+        return self.pool.get_connection()
+
+    def get_pool_stats(self) -> Dict:
+        """Connection pool statistics"""
+        return self.pool.get_stats()
+
+    def close(self):
+        """Close all pooled connections for this database file"""
+        self.pool.close_all()
 
     def init_database(self):
         """Initialize database tables"""
@@ -698,6 +741,43 @@ class Database:
                     FOREIGN KEY (task_id) REFERENCES tasks (id) ON DELETE CASCADE
                 )
             ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_rate_limit_tracking_task_timestamp
+                ON rate_limit_tracking (task_id, timestamp)
+            ''')
+
+            # Sends parked by FloodWait, replayed after a restart
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS send_retry_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    task_id INTEGER NOT NULL,
+                    source_chat_id TEXT NOT NULL,
+                    source_message_id INTEGER NOT NULL,
+                    target_chat_id TEXT NOT NULL,
+                    not_before TIMESTAMP NOT NULL,
+                    attempts INTEGER DEFAULT 0,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(task_id, source_chat_id, source_message_id, target_chat_id),
+                    FOREIGN KEY (task_id) REFERENCES tasks (id) ON DELETE CASCADE
+                )
+            ''')
+
+            # Resolved chats per userbot client (InputPeer fields), reused after a restart
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS entity_cache (
+                    user_id INTEGER NOT NULL,
+                    chat_key TEXT NOT NULL,
+                    peer_type TEXT NOT NULL,
+                    peer_id INTEGER NOT NULL,
+                    access_hash INTEGER,
+                    title TEXT,
+                    chat_type TEXT,
+                    resolved_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, chat_key)
+                )
+            ''')
 
             # Task text formatting settings table
             cursor.execute('''
@@ -1568,55 +1648,25 @@ class Database:
 
     def is_message_allowed_by_word_filter(self, task_id: int, message_text: str):
         """Check if message is allowed by word filters"""
-        if not message_text:
-            return True  # No text to filter
-
-        settings = self.get_task_word_filter_settings(task_id)
-
-        # Check whitelist first (if enabled)
-        if settings['whitelist']['enabled']:
-            whitelist_words = self.get_filter_words(task_id, 'whitelist')
-            if whitelist_words:  # If whitelist has words
-                # Message must contain at least one whitelisted word/phrase
-                message_lower = message_text.lower()
-                found_match = False
-
-                for word_data in whitelist_words:
-                    word = word_data[2]  # word_or_phrase from tuple
-                    is_case_sensitive = word_data[3]  # is_case_sensitive from tuple
-
-                    if is_case_sensitive:
-                        if word in message_text:
-                            found_match = True
-                            break
-                    else:
-                        if word.lower() in message_lower:
-                            found_match = True
-                            break
-
-                if not found_match:
-                    logger.info(f"🚫 الرسالة محظورة: لا تحتوي على كلمات من القائمة البيضاء")
-                    return False
-
-        # Check blacklist (if enabled)
-        if settings['blacklist']['enabled']:
-            blacklist_words = self.get_filter_words(task_id, 'blacklist')
-            message_lower = message_text.lower()
+        is_allowed, matched_phrase = self.check_word_filter(task_id, message_text)
+        return is_allowed
 
-            for word_data in blacklist_words:
-                word = word_data[2]  # word_or_phrase from tuple
-                is_case_sensitive = word_data[3]  # is_case_sensitive from tuple
+    def check_word_filter(self, task_id: int, message_text: str):
+        """Check word filters and return (is_allowed, matched phrase)
 
-                if is_case_sensitive:
-                    if word in message_text:
-                        logger.info(f"🚫 الرسالة محظورة: تحتوي على كلمة محظورة '{word}'")
-                        return False
-                else:
-                    if word.lower() in message_lower:
-                        logger.info(f"🚫 الرسالة محظورة: تحتوي على كلمة محظورة '{word}'")
-                        return False
+        Filter lists are compiled once into Aho-Corasick matchers and cached
+        with the task settings snapshot until a filter word or setting changes.
+        """
+        if not message_text:
+            return True, None  # No text to filter
 
-        return True  # Message is allowed
+        is_allowed, matched_phrase = check_word_filters(settings_cache.get(self, task_id), message_text)
+        if not is_allowed:
+            if matched_phrase:
+                logger.info(f"🚫 الرسالة محظورة: تحتوي على كلمة محظورة '{matched_phrase}'")
+            else:
+                logger.info(f"🚫 الرسالة محظورة: لا تحتوي على كلمات من القائمة البيضاء")
+        return is_allowed, matched_phrase
 
     def add_multiple_filter_words(self, task_id: int, filter_type: str, words_list: list):
         """Add multiple words to a filter"""
@@ -1829,47 +1879,15 @@ class Database:
             return added_count
 
     def apply_text_replacements(self, task_id: int, message_text: str):
-        """Apply text replacements to message text"""
-        if not message_text or not self.is_text_replacement_enabled(task_id):
-            return message_text
+        """Apply text replacements to message text
 
-        replacements = self.get_text_replacements(task_id)
-        if not replacements:
+        All rules of the task are compiled into a single regex (cached with the
+        task settings snapshot) and applied in one pass over the text.
+        """
+        if not message_text:
             return message_text
 
-        modified_text = message_text
-        replacement_count = 0
-
-        for replacement in replacements:
-            find_text = replacement['find_text']
-            replace_text = replacement['replace_text']
-            is_case_sensitive = replacement['is_case_sensitive']
-            is_whole_word = replacement['is_whole_word']
-
-            if is_whole_word:
-                # Use word boundary matching
-                import re
-                pattern = r'\b' + re.escape(find_text) + r'\b'
-                flags = 0 if is_case_sensitive else re.IGNORECASE
-
-                old_text = modified_text
-                modified_text = re.sub(pattern, replace_text, modified_text, flags=flags)
-                if old_text != modified_text:
-                    replacement_count += 1
-            else:
-                # Simple text replacement
-                if is_case_sensitive:
-                    if find_text in modified_text:
-                        modified_text = modified_text.replace(find_text, replace_text)
-                        replacement_count += 1
-                else:
-                    # Case insensitive replacement
-                    import re
-                    pattern = re.escape(find_text)
-                    old_text = modified_text
-                    modified_text = re.sub(pattern, replace_text, modified_text, flags=re.IGNORECASE)
-                    if old_text != modified_text:
-                        replacement_count += 1
+        modified_text, replacement_count = apply_replacement_rules(settings_cache.get(self, task_id), message_text)
 
         if replacement_count > 0:
             logger.info(f"✅ تم تطبيق {replacement_count} استبدال على الرسالة للمهمة {task_id}")
@@ -4016,6 +4034,137 @@ class Database:
             logger.error(f"خطأ في فحص حد الرسائل: {e}")
             return False
 
+    def save_rate_limit_snapshot(self, state: Dict[int, List[float]]):
+        """Replace rate_limit_tracking with the in-memory limiter windows (task_id -> unix timestamps)"""
+        rows = [
+            (task_id, datetime.fromtimestamp(stamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3])
+            for task_id, stamps in state.items() for stamp in stamps
+        ]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM rate_limit_tracking')
+            cursor.executemany('''
+                INSERT INTO rate_limit_tracking (task_id, timestamp) VALUES (?, ?)
+            ''', rows)
+            conn.commit()
+
+    def load_rate_limit_snapshot(self) -> Dict[int, List[float]]:
+        """Load rate limiter windows saved by save_rate_limit_snapshot"""
+        state: Dict[int, List[float]] = {}
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT task_id, timestamp FROM rate_limit_tracking ORDER BY timestamp')
+            for task_id, value in cursor.fetchall():
+                stamp = datetime.fromisoformat(str(value)).replace(tzinfo=timezone.utc).timestamp()
+                state.setdefault(task_id, []).append(stamp)
+        return state
+
+    def save_send_retry(self, user_id: int, task_id: int, source_chat_id: str, source_message_id: int,
+                        target_chat_id: str, wait_seconds: float, attempts: int = 1, last_error: str = None):
+        """Queue (or update) a send that hit FloodWait so it survives a restart"""
+        not_before = datetime.fromtimestamp(datetime.now(timezone.utc).timestamp() + wait_seconds, timezone.utc)
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO send_retry_queue
+                    (user_id, task_id, source_chat_id, source_message_id, target_chat_id, not_before, attempts, last_error)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, task_id, str(source_chat_id), source_message_id, str(target_chat_id),
+                      not_before.strftime('%Y-%m-%d %H:%M:%S'), attempts, last_error))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"خطأ في حفظ إعادة الإرسال: {e}")
+
+    def delete_send_retry(self, task_id: int, source_chat_id: str, source_message_id: int, target_chat_id: str):
+        """Remove a queued send once it was delivered or given up"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM send_retry_queue
+                    WHERE task_id = ? AND source_chat_id = ? AND source_message_id = ? AND target_chat_id = ?
+                ''', (task_id, str(source_chat_id), source_message_id, str(target_chat_id)))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"خطأ في حذف إعادة الإرسال: {e}")
+
+    def get_send_retries(self, user_id: int = None) -> List[Dict]:
+        """Queued sends (oldest first) with the seconds left before each may be retried"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                query = '''
+                    SELECT user_id, task_id, source_chat_id, source_message_id, target_chat_id,
+                           not_before, attempts, last_error
+                    FROM send_retry_queue
+                '''
+                params = ()
+                if user_id is not None:
+                    query += ' WHERE user_id = ?'
+                    params = (user_id,)
+                cursor.execute(query + ' ORDER BY id', params)
+                rows = cursor.fetchall()
+
+            now = datetime.now(timezone.utc).timestamp()
+            retries = []
+            for row in rows:
+                not_before = datetime.fromisoformat(str(row[5])).replace(tzinfo=timezone.utc).timestamp()
+                retries.append({
+                    'user_id': row[0],
+                    'task_id': row[1],
+                    'source_chat_id': row[2],
+                    'source_message_id': row[3],
+                    'target_chat_id': row[4],
+                    'wait_seconds': max(0.0, not_before - now),
+                    'attempts': row[6],
+                    'last_error': row[7],
+                })
+            return retries
+        except Exception as e:
+            logger.error(f"خطأ في جلب قائمة إعادة الإرسال: {e}")
+            return []
+
+    def save_cached_entity(self, user_id: int, chat_key: str, peer_type: str, peer_id: int,
+                           access_hash: Optional[int], title: str, chat_type: str, resolved_at: float):
+        """Persist one resolved chat of a userbot client"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO entity_cache
+                (user_id, chat_key, peer_type, peer_id, access_hash, title, chat_type, resolved_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, chat_key, peer_type, peer_id, access_hash, title, chat_type, resolved_at))
+            conn.commit()
+
+    def get_cached_entities(self, user_id: int) -> List[Dict]:
+        """Resolved chats saved for a userbot client"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT chat_key, peer_type, peer_id, access_hash, title, chat_type, resolved_at
+                FROM entity_cache WHERE user_id = ?
+            ''', (user_id,))
+            return [
+                {
+                    'chat_key': row[0],
+                    'peer_type': row[1],
+                    'peer_id': row[2],
+                    'access_hash': row[3],
+                    'title': row[4],
+                    'chat_type': row[5],
+                    'resolved_at': row[6],
+                }
+                for row in cursor.fetchall()
+            ]
+
+    def delete_cached_entity(self, user_id: int, chat_key: str):
+        """Forget a resolved chat that Telegram no longer accepts"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM entity_cache WHERE user_id = ? AND chat_key = ?', (user_id, chat_key))
+            conn.commit()
+
     def cleanup_old_rate_limit_tracking(self, hours_old: int = 24):
         """Clean up old rate limit tracking records"""
         try:
@@ -4277,6 +4426,19 @@ class Database:
                     'language': 'ar'
                 }
     
+    def get_task_timezone(self, task_id: int) -> str:
+        """Timezone of the task owner (user_settings), default Asia/Riyadh"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT us.timezone
+                FROM tasks t
+                LEFT JOIN user_settings us ON us.user_id = t.user_id
+                WHERE t.id = ?
+            ''', (task_id,))
+            result = cursor.fetchone()
+            return (result[0] if result else None) or 'Asia/Riyadh'
+
     def create_user_settings(self, user_id):
         """Create default user settings"""
         with self.get_connection() as conn:
@@ -4594,7 +4756,7 @@ class Database:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT id, message_text, media_hash, media_type, timestamp
+                    SELECT id, message_text, media_hash, media_type, timestamp, text_signature, media_phash
                     FROM message_duplicates
                     WHERE task_id = ? AND timestamp > ?
                     ORDER BY timestamp DESC
@@ -4608,7 +4770,9 @@ class Database:
                         'message_text': row[1],
                         'media_hash': row[2],
                         'media_type': row[3],
-                        'timestamp': row[4]
+                        'timestamp': row[4],
+                        'text_signature': row[5],
+                        'media_phash': row[6]
                     })
                 
                 logger.debug(f"🔍 تم العثور على {len(messages)} رسالة حديثة لفحص التكرار للمهمة {task_id}")
@@ -4633,20 +4797,35 @@ class Database:
             logger.error(f"خطأ في تتبع الرسالة لفحص التكرار: {e}")
             return None
 
-    def store_message_for_duplicate_check(self, task_id: int, message_text: str, media_hash: str, media_type: str, timestamp: int):
-        """Store message for future duplicate checking"""
+    def store_message_for_duplicate_check(self, task_id: int, message_text: str, media_hash: str, media_type: str, timestamp: int,
+                                          text_signature: Optional[bytes] = None, media_phash: Optional[int] = None) -> Optional[int]:
+        """Store message for future duplicate checking (with its MinHash signature and perceptual hash)"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    INSERT INTO message_duplicates (task_id, message_text, media_hash, media_type, timestamp)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (task_id, message_text, media_hash, media_type, timestamp))
+                    INSERT INTO message_duplicates (task_id, message_text, media_hash, media_type, timestamp, text_signature, media_phash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (task_id, message_text, media_hash, media_type, timestamp, text_signature, media_phash))
                 conn.commit()
                 logger.debug(f"💾 تم حفظ الرسالة لفحص التكرار المستقبلي للمهمة {task_id}")
+                return cursor.lastrowid
                 
         except Exception as e:
             logger.error(f"خطأ في حفظ الرسالة لفحص التكرار: {e}")
+            return None
+
+    def update_duplicate_signatures(self, rows: list):
+        """Backfill MinHash signatures: rows of (text_signature, message_id)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    UPDATE message_duplicates SET text_signature = ? WHERE id = ?
+                ''', rows)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"خطأ في حفظ توقيعات فحص التكرار: {e}")
 
     def update_message_timestamp_for_duplicate(self, message_id: int, timestamp: int):
         """Update message timestamp when duplicate is found"""
@@ -4682,6 +4861,18 @@ class Database:
                     )
                 ''')
                 
+                # Compact MinHash signature of the text (near-duplicate index)
+                try:
+                    cursor.execute('ALTER TABLE message_duplicates ADD COLUMN text_signature BLOB')
+                except Exception:
+                    pass  # Column already exists
+                
+                # 64-bit perceptual hash of the media thumbnail (signed INTEGER)
+                try:
+                    cursor.execute('ALTER TABLE message_duplicates ADD COLUMN media_phash INTEGER')
+                except Exception:
+                    pass  # Column already exists
+                
                 # Create index for faster lookups
                 cursor.execute('''
                     CREATE INDEX IF NOT EXISTS idx_message_duplicates_task_timestamp 
@@ -5640,3 +5831,61 @@ class Database:
                 return dict(result)
             return None
 
+
+
+# Settings writers used by the bot: each call drops the cached settings
+# snapshot of the affected task so the userbot picks up the change
+SETTINGS_WRITERS = (
+    'create_task', 'create_task_with_multiple_sources_targets', 'delete_task',
+    'update_task_status', 'update_task_forward_mode', 'update_task_publishing_mode',
+    'add_task_source', 'add_task_target', 'remove_task_source', 'remove_task_target',
+    'migrate_task_to_new_structure',
+    'set_task_media_filter', 'set_all_media_filters', 'reset_task_media_filters',
+    'set_word_filter_status', 'set_word_filter_enabled', 'add_word_to_filter',
+    'add_multiple_filter_words', 'remove_word_from_filter', 'remove_word_from_filter_by_id',
+    'clear_filter_words',
+    'set_text_replacement_enabled', 'add_text_replacement', 'add_multiple_text_replacements',
+    'remove_text_replacement', 'clear_text_replacements',
+    'update_header_settings', 'update_footer_settings', 'update_inline_buttons_enabled',
+    'add_inline_button', 'clear_inline_buttons',
+    'update_forwarding_settings', 'toggle_link_preview', 'toggle_pin_message',
+    'toggle_silent_notifications', 'toggle_auto_delete', 'toggle_sync_edit',
+    'toggle_sync_delete', 'toggle_split_album', 'toggle_publishing_mode',
+    'set_publishing_mode', 'set_auto_delete_time',
+    'toggle_advanced_filter', 'update_advanced_filter_setting',
+    'set_day_filter', 'set_all_day_filters', 'add_day_filter', 'remove_day_filter',
+    'set_working_hours_mode', 'set_working_hour_schedule', 'set_all_working_hours',
+    'toggle_working_hour', 'set_working_hours', 'update_working_hours', 'set_working_hour',
+    'add_language_filter', 'toggle_language_filter', 'remove_language_filter',
+    'set_language_filter_mode', 'clear_language_filters',
+    'add_admin_filter', 'add_admin_filter_with_previous_permission', 'update_admin_signature',
+    'bulk_update_admin_permissions', 'toggle_admin_filter', 'remove_admin_filter',
+    'clear_admin_filters_for_source',
+    'update_text_cleaning_setting', 'add_text_cleaning_keyword', 'remove_text_cleaning_keyword',
+    'clear_text_cleaning_keywords', 'add_multiple_text_cleaning_keywords',
+    'add_text_cleaning_keywords',
+    'update_duplicate_settings', 'update_duplicate_text_check', 'update_duplicate_media_check',
+    'update_duplicate_setting', 'update_duplicate_threshold', 'update_duplicate_time_window',
+    'set_duplicate_settings',
+    'set_button_filter_mode', 'set_inline_button_filter', 'set_forwarded_filter_mode',
+    'set_forwarded_message_filter',
+    'update_text_formatting_settings', 'toggle_text_formatting',
+    'save_character_limit_settings', 'update_character_limit_settings',
+    'update_character_limit_values', 'toggle_character_limit', 'toggle_character_limit_mode',
+    'cycle_character_limit_mode',
+    'save_rate_limit_settings', 'update_rate_limit_settings', 'toggle_rate_limit',
+    'save_forwarding_delay_settings', 'update_forwarding_delay_settings',
+    'toggle_forwarding_delay',
+    'save_sending_interval_settings', 'update_sending_interval_settings',
+    'toggle_sending_interval',
+    'update_translation_settings', 'toggle_translation',
+    'update_user_timezone', 'update_user_language',
+    'update_watermark_settings', 'toggle_watermark_media_type', 'toggle_watermark',
+    'update_watermark_text', 'update_watermark_image', 'update_watermark_position',
+    'update_watermark_media_settings',
+    'update_audio_metadata_enabled', 'update_audio_metadata_template', 'set_album_art_settings',
+    'set_audio_merge_settings', 'set_audio_quality_settings', 'update_audio_metadata_setting',
+    'update_audio_template_setting', 'reset_audio_template_settings',
+)
+
+install_settings_invalidation(Database, SETTINGS_WRITERS)
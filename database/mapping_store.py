@@ -0,0 +1,318 @@
+"""
+Message mapping store - مخزن تطابق الرسائل لمزامنة التعديل والحذف
+
+بديل مخصص لجدول message_mappings:
+- معرفات المحادثات أعداد صحيحة ومفتاح أساسي مركب WITHOUT ROWID
+  (task_id, source_chat_id, source_message_id, target_chat_id) فالبحث يقرأ الفهرس مباشرة
+- الإدراج مجمع في الذاكرة ويكتب بدفعات executemany في معاملة واحدة
+- جلب تطابقات قائمة كاملة من الرسائل المحذوفة باستعلام واحد
+- حذف التطابقات الأقدم من MAPPING_RETENTION_DAYS تلقائياً
+- صيغة ثنائية مضغوطة اختيارية (MAPPING_STORE_COMPACT): صف واحد لكل رسالة مصدر
+  وجميع أهدافها في BLOB بحجم 12 بايت لكل هدف
+
+يستخدم ملف SQLite الخاص بالبوت، أو MAPPING_STORE_PATH عند استخدام PostgreSQL.
+"""
+
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .sqlite_pool import SQLiteConnectionPool
+
+logger = logging.getLogger(__name__)
+
+MAPPING_STORE_PATH = os.getenv('MAPPING_STORE_PATH', 'message_mappings.db')
+MAPPING_STORE_COMPACT = os.getenv('MAPPING_STORE_COMPACT', 'false').lower() in ('1', 'true', 'yes')
+MAPPING_RETENTION_DAYS = float(os.getenv('MAPPING_RETENTION_DAYS', '30'))  # 0 keeps mappings forever
+MAPPING_BATCH_SIZE = int(os.getenv('MAPPING_BATCH_SIZE', '50'))
+MAPPING_FLUSH_INTERVAL = float(os.getenv('MAPPING_FLUSH_INTERVAL', '2'))
+PRUNE_INTERVAL = 3600
+
+# Compact format: (target chat id int64, target message id int32) per target
+_TARGET = struct.Struct('<qi')
+# SQLite's default limit of host parameters per statement is 999
+_IN_CHUNK = 500
+
+MappingRow = Tuple[int, int, int, int, int]
+
+
+def to_chat_id(chat_id) -> Optional[int]:
+    """Integer chat id, None for values that are not numeric (e.g. an unresolved @username)"""
+    try:
+        return int(str(chat_id).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def pack_targets(targets: Iterable[Tuple[int, int]]) -> bytes:
+    return b''.join(_TARGET.pack(chat_id, message_id) for chat_id, message_id in targets)
+
+
+def unpack_targets(blob: bytes) -> List[Tuple[int, int]]:
+    return [tuple(values) for values in _TARGET.iter_unpack(blob or b'')]
+
+
+class MessageMappingStore:
+    """source message -> target messages, per task, with batched writes and TTL retention"""
+
+    def __init__(self, db=None, path: str = MAPPING_STORE_PATH, compact: bool = MAPPING_STORE_COMPACT,
+                 retention_days: float = MAPPING_RETENTION_DAYS, batch_size: int = MAPPING_BATCH_SIZE,
+                 flush_interval: float = MAPPING_FLUSH_INTERVAL):
+        pool = getattr(db, 'pool', None)
+        self.pool = pool if isinstance(pool, SQLiteConnectionPool) else SQLiteConnectionPool(path)
+        self.compact = compact
+        self.retention_seconds = retention_days * 86400
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._buffer: List[MappingRow] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self._last_prune = 0.0
+        self.written = 0
+        self.flushes = 0
+        self.pruned = 0
+        self.init_store()
+
+    @property
+    def table(self) -> str:
+        return 'message_map_packed' if self.compact else 'message_map'
+
+    def init_store(self):
+        """Create the mapping table and copy the legacy message_mappings rows the first time"""
+        try:
+            with self.pool.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+                tables = {row[0] for row in cursor.fetchall()}
+
+                if self.compact:
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS message_map_packed (
+                            task_id INTEGER NOT NULL,
+                            source_chat_id INTEGER NOT NULL,
+                            source_message_id INTEGER NOT NULL,
+                            targets BLOB NOT NULL,
+                            created_at INTEGER NOT NULL,
+                            PRIMARY KEY (task_id, source_chat_id, source_message_id)
+                        ) WITHOUT ROWID
+                    ''')
+                else:
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS message_map (
+                            task_id INTEGER NOT NULL,
+                            source_chat_id INTEGER NOT NULL,
+                            source_message_id INTEGER NOT NULL,
+                            target_chat_id INTEGER NOT NULL,
+                            target_message_id INTEGER NOT NULL,
+                            created_at INTEGER NOT NULL,
+                            PRIMARY KEY (task_id, source_chat_id, source_message_id, target_chat_id)
+                        ) WITHOUT ROWID
+                    ''')
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.table}_created_at ON {self.table} (created_at)')
+                conn.commit()
+
+            if self.table not in tables and 'message_mappings' in tables:
+                self._import_legacy()
+        except Exception as e:
+            logger.error(f"❌ خطأ في تهيئة مخزن تطابق الرسائل: {e}")
+
+    def _import_legacy(self):
+        with self.pool.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT task_id, source_chat_id, source_message_id, target_chat_id, target_message_id,
+                       CAST(strftime('%s', created_at) AS INTEGER)
+                FROM message_mappings
+            ''')
+            rows = []
+            for task_id, source_chat_id, source_message_id, target_chat_id, target_message_id, created_at in cursor.fetchall():
+                source_chat_id, target_chat_id = to_chat_id(source_chat_id), to_chat_id(target_chat_id)
+                if source_chat_id is not None and target_chat_id is not None:
+                    rows.append((task_id, source_chat_id, source_message_id, target_chat_id, target_message_id,
+                                 created_at or int(time.time())))
+        if rows:
+            self._write(rows)
+            logger.info(f"📦 تم نقل {len(rows)} تطابق رسالة من message_mappings")
+
+    # ===== Writes =====
+
+    def add(self, task_id: int, source_chat_id, source_message_id: int, target_chat_id, target_message_id: int):
+        """Buffer one mapping; written with the next batch"""
+        self.add_many([(task_id, source_chat_id, source_message_id, target_chat_id, target_message_id)])
+
+    def add_many(self, rows: Iterable[Tuple]):
+        """Buffer mappings (task_id, source_chat_id, source_message_id, target_chat_id, target_message_id)"""
+        with self._lock:
+            for task_id, source_chat_id, source_message_id, target_chat_id, target_message_id in rows:
+                source_id, target_id = to_chat_id(source_chat_id), to_chat_id(target_chat_id)
+                if source_id is None or target_id is None:
+                    logger.warning(f"⚠️ تجاهل تطابق بمعرف محادثة غير رقمي: {source_chat_id} → {target_chat_id}")
+                    continue
+                self._buffer.append((task_id, source_id, source_message_id, target_id, target_message_id))
+            due = len(self._buffer) >= self.batch_size or time.time() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered mappings in one transaction"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.time()
+        if rows:
+            now = int(time.time())
+            try:
+                self._write([row + (now,) for row in rows])
+                self.flushes += 1
+            except Exception as e:
+                logger.error(f"❌ خطأ في حفظ تطابق الرسائل: {e}")
+        self.maybe_prune()
+
+    def _write(self, rows: Sequence[Tuple]):
+        with self.pool.get_connection() as conn:
+            cursor = conn.cursor()
+            if not self.compact:
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO message_map
+                    (task_id, source_chat_id, source_message_id, target_chat_id, target_message_id, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
+            else:
+                # Merge the new targets into each source message's blob
+                grouped: Dict[Tuple[int, int, int], Dict[int, int]] = {}
+                created: Dict[Tuple[int, int, int], int] = {}
+                for task_id, source_chat_id, source_message_id, target_chat_id, target_message_id, created_at in rows:
+                    key = (task_id, source_chat_id, source_message_id)
+                    grouped.setdefault(key, {})[target_chat_id] = target_message_id
+                    created[key] = created_at
+                existing = self._read_packed(cursor, grouped.keys())
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO message_map_packed
+                    (task_id, source_chat_id, source_message_id, targets, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [
+                    key + (pack_targets({**dict(existing.get(key, [])), **targets}.items()), created[key])
+                    for key, targets in grouped.items()
+                ])
+            conn.commit()
+        self.written += len(rows)
+
+    @staticmethod
+    def _read_packed(cursor, keys: Iterable[Tuple[int, int, int]]) -> Dict[Tuple[int, int, int], List[Tuple[int, int]]]:
+        found = {}
+        for task_id, source_chat_id, source_message_id in keys:
+            cursor.execute('''
+                SELECT targets FROM message_map_packed
+                WHERE task_id = ? AND source_chat_id = ? AND source_message_id = ?
+            ''', (task_id, source_chat_id, source_message_id))
+            row = cursor.fetchone()
+            if row is not None:
+                found[(task_id, source_chat_id, source_message_id)] = unpack_targets(row[0])
+        return found
+
+    # ===== Lookups =====
+
+    def get_targets(self, task_id: int, source_chat_id, source_message_id: int) -> List[Tuple[int, int]]:
+        """(target_chat_id, target_message_id) of one source message"""
+        return self.get_targets_bulk(task_id, source_chat_id, [source_message_id]).get(source_message_id, [])
+
+    def get_targets_bulk(self, task_id: int, source_chat_id,
+                         source_message_ids: Iterable[int]) -> Dict[int, List[Tuple[int, int]]]:
+        """source_message_id -> [(target_chat_id, target_message_id)] for a list of ids in one query"""
+        source_id = to_chat_id(source_chat_id)
+        ids = list(dict.fromkeys(source_message_ids))
+        if source_id is None or not ids:
+            return {}
+        self.flush()
+
+        found: Dict[int, List[Tuple[int, int]]] = {}
+        try:
+            with self.pool.get_connection() as conn:
+                cursor = conn.cursor()
+                for start in range(0, len(ids), _IN_CHUNK):
+                    chunk = ids[start:start + _IN_CHUNK]
+                    placeholders = ','.join('?' * len(chunk))
+                    if self.compact:
+                        cursor.execute(f'''
+                            SELECT source_message_id, targets FROM message_map_packed
+                            WHERE task_id = ? AND source_chat_id = ? AND source_message_id IN ({placeholders})
+                        ''', (task_id, source_id, *chunk))
+                        for source_message_id, blob in cursor.fetchall():
+                            found[source_message_id] = unpack_targets(blob)
+                    else:
+                        cursor.execute(f'''
+                            SELECT source_message_id, target_chat_id, target_message_id FROM message_map
+                            WHERE task_id = ? AND source_chat_id = ? AND source_message_id IN ({placeholders})
+                        ''', (task_id, source_id, *chunk))
+                        for source_message_id, target_chat_id, target_message_id in cursor.fetchall():
+                            found.setdefault(source_message_id, []).append((target_chat_id, target_message_id))
+        except Exception as e:
+            logger.error(f"❌ خطأ في جلب تطابق الرسائل: {e}")
+        return found
+
+    def delete_sources(self, task_id: int, source_chat_id, source_message_ids: Iterable[int]) -> int:
+        """Forget the mappings of deleted source messages"""
+        source_id = to_chat_id(source_chat_id)
+        ids = list(dict.fromkeys(source_message_ids))
+        if source_id is None or not ids:
+            return 0
+        self.flush()
+
+        deleted = 0
+        try:
+            with self.pool.get_connection() as conn:
+                cursor = conn.cursor()
+                for start in range(0, len(ids), _IN_CHUNK):
+                    chunk = ids[start:start + _IN_CHUNK]
+                    cursor.execute(f'''
+                        DELETE FROM {self.table}
+                        WHERE task_id = ? AND source_chat_id = ? AND source_message_id IN ({','.join('?' * len(chunk))})
+                    ''', (task_id, source_id, *chunk))
+                    deleted += cursor.rowcount
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ خطأ في حذف تطابق الرسائل: {e}")
+        return deleted
+
+    # ===== Retention =====
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete mappings older than the retention period"""
+        if self.retention_seconds <= 0:
+            return 0
+        cutoff = int((time.time() if now is None else now) - self.retention_seconds)
+        try:
+            with self.pool.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'DELETE FROM {self.table} WHERE created_at < ?', (cutoff,))
+                deleted = cursor.rowcount
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ خطأ في تنظيف تطابق الرسائل القديم: {e}")
+            return 0
+        if deleted > 0:
+            self.pruned += deleted
+            logger.info(f"🧹 تم حذف {deleted} تطابق رسالة أقدم من فترة الاحتفاظ")
+        return deleted
+
+    def maybe_prune(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._last_prune = now
+            self.prune(now)
+
+    def get_stats(self) -> Dict[str, object]:
+        with self.pool.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT COUNT(*) FROM {self.table}')
+            rows = cursor.fetchone()[0]
+        return {
+            'format': 'compact' if self.compact else 'rows',
+            'rows': rows,
+            'buffered': len(self._buffer),
+            'written': self.written,
+            'flushes': self.flushes,
+            'pruned': self.pruned,
+        }
@@ -0,0 +1,270 @@
+"""
+Per-task settings snapshot cache - ذاكرة مؤقتة لإعدادات المهام
+
+يقوم UserBot بقراءة أكثر من 20 جدول إعدادات لكل رسالة يتم توجيهها.
+هذه الوحدة تحمل جميع إعدادات المهمة دفعة واحدة في TaskSettingsSnapshot
+وتحتفظ بها في الذاكرة حتى يقوم البوت بتعديل أي إعداد لنفس المهمة.
+
+The bot and the userbot run in the same process, so a process-wide cache
+with version counters is enough: every bot-side write bumps the task
+version and the next read reloads the snapshot.
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds a snapshot with a failed loader is reused before all loaders run again
+PARTIAL_SNAPSHOT_TTL = float(os.getenv('SETTINGS_PARTIAL_SNAPSHOT_TTL', '30'))
+
+
+# (snapshot attribute, db method, extra args) - the method is called as method(task_id, *extra args);
+# backends may provide an awaitable async_<method> variant used by load_async
+SNAPSHOT_LOADERS: Tuple[Tuple[str, str, tuple], ...] = (
+    ('message_settings', 'get_message_settings', ()),
+    ('forwarding_settings', 'get_forwarding_settings', ()),
+    ('inline_buttons', 'get_inline_buttons', ()),
+    ('text_cleaning_settings', 'get_text_cleaning_settings', ()),
+    ('text_cleaning_keywords', 'get_text_cleaning_keywords', ()),
+    ('text_formatting_settings', 'get_text_formatting_settings', ()),
+    ('text_replacement_enabled', 'is_text_replacement_enabled', ()),
+    ('text_replacements', 'get_text_replacements', ()),
+    ('translation_settings', 'get_translation_settings', ()),
+    ('watermark_settings', 'get_watermark_settings', ()),
+    ('audio_metadata_settings', 'get_audio_metadata_settings', ()),
+    ('audio_template_settings', 'get_audio_template_settings', ()),
+    ('media_filters', 'get_task_media_filters', ()),
+    ('word_filter_settings', 'get_task_word_filter_settings', ()),
+    ('whitelist_words', 'get_filter_words', ('whitelist',)),
+    ('blacklist_words', 'get_filter_words', ('blacklist',)),
+    ('advanced_filters_settings', 'get_advanced_filters_settings', ()),
+    ('inline_button_filter_setting', 'get_inline_button_filter_setting', ()),
+    ('forwarded_message_filter_setting', 'get_forwarded_message_filter_setting', ()),
+    ('admin_filters', 'get_admin_filters', ()),
+    ('duplicate_settings', 'get_duplicate_settings', ()),
+    ('language_filters', 'get_language_filters', ()),
+    ('day_filters', 'get_day_filters', ()),
+    ('working_hours', 'get_working_hours', ()),
+    ('timezone', 'get_task_timezone', ()),
+    ('character_limit_settings', 'get_character_limit_settings', ()),
+    ('rate_limit_settings', 'get_rate_limit_settings', ()),
+    ('forwarding_delay_settings', 'get_forwarding_delay_settings', ()),
+    ('sending_interval_settings', 'get_sending_interval_settings', ()),
+)
+
+
+class TaskSettingsSnapshot:
+    """Read-only view of every settings table for one task"""
+
+    def __init__(self, task_id: int, version: Tuple[int, int], values: Dict[str, Any], complete: bool = True):
+        self.task_id = task_id
+        self.version = version
+        self.values = values
+        self.complete = complete
+        self.loaded_at = time.time()
+        self._compiled: Dict[str, Any] = {}
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        """Complete snapshots stay valid until a write; partial ones only for PARTIAL_SNAPSHOT_TTL"""
+        if self.complete:
+            return True
+        return (time.time() if now is None else now) - self.loaded_at < PARTIAL_SNAPSHOT_TTL
+
+    @staticmethod
+    def _load_values(db, task_id: int, loaders) -> Tuple[Dict[str, Any], bool]:
+        """Run sync loaders: (values, complete)"""
+        values: Dict[str, Any] = {}
+        complete = True
+        for name, method_name, extra in loaders:
+            try:
+                values[name] = getattr(db, method_name)(task_id, *extra)
+            except AttributeError:
+                # The active backend does not implement this table
+                values[name] = None
+            except Exception as e:
+                logger.error(f"خطأ في تحميل الإعداد {name} للمهمة {task_id}: {e}")
+                values[name] = None
+                complete = False
+        return values, complete
+
+    @classmethod
+    def load(cls, db, task_id: int, version: Tuple[int, int]) -> 'TaskSettingsSnapshot':
+        """Load all settings of a task in a single pass"""
+        values, complete = cls._load_values(db, task_id, SNAPSHOT_LOADERS)
+        return cls(task_id, version, values, complete)
+
+    @classmethod
+    async def load_async(cls, db, task_id: int, version: Tuple[int, int]) -> 'TaskSettingsSnapshot':
+        """Load from an event loop: async_<method> variants are awaited, the sync
+        getters run together in one executor call so they never block the loop"""
+        async_loaders = [loader for loader in SNAPSHOT_LOADERS if hasattr(db, f'async_{loader[1]}')]
+        sync_loaders = [loader for loader in SNAPSHOT_LOADERS if loader not in async_loaders]
+
+        pending = None
+        if sync_loaders:
+            pending = asyncio.get_running_loop().run_in_executor(
+                None, cls._load_values, db, task_id, sync_loaders)
+
+        values: Dict[str, Any] = {}
+        complete = True
+        results = await asyncio.gather(*(
+            getattr(db, f'async_{method_name}')(task_id, *extra) for _, method_name, extra in async_loaders
+        ), return_exceptions=True)
+        for (name, _, _), result in zip(async_loaders, results):
+            if isinstance(result, Exception):
+                logger.error(f"خطأ في تحميل الإعداد {name} للمهمة {task_id}: {result}")
+                result = None
+                complete = False
+            values[name] = result
+
+        if pending is not None:
+            sync_values, sync_complete = await pending
+            values.update(sync_values)
+            complete = complete and sync_complete
+        return cls(task_id, version, values, complete)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """Return a settings group, or default if it is missing/empty"""
+        value = self.values.get(name)
+        return default if value is None else value
+
+    def compiled(self, name: str, builder: Callable[['TaskSettingsSnapshot'], Any]) -> Any:
+        """Build a derived structure (matcher, regex...) once per snapshot
+
+        A settings write replaces the snapshot, so compiled structures are
+        rebuilt automatically when the underlying settings change.
+        """
+        if name not in self._compiled:
+            self._compiled[name] = builder(self)
+        return self._compiled[name]
+
+    def __getattr__(self, name: str) -> Any:
+        values = self.__dict__.get('values')
+        if values is not None and name in values:
+            return values[name]
+        raise AttributeError(name)
+
+
+class TaskSettingsCache:
+    """Process-wide cache of TaskSettingsSnapshot objects keyed by task id"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: Dict[int, TaskSettingsSnapshot] = {}
+        self._task_versions: Dict[int, int] = {}
+        self._global_version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def current_version(self, task_id: int) -> Tuple[int, int]:
+        """(global version, task version) pair a valid snapshot must carry"""
+        return self._global_version, self._task_versions.get(task_id, 0)
+
+    def _lookup(self, task_id: int) -> Tuple[Optional[TaskSettingsSnapshot], Tuple[int, int]]:
+        """(valid cached snapshot or None, version a reload must carry)"""
+        with self._lock:
+            version = self.current_version(task_id)
+            snapshot = self._snapshots.get(task_id)
+            if snapshot is not None and snapshot.version == version and snapshot.is_fresh():
+                self.hits += 1
+                return snapshot, version
+            self.misses += 1
+            return None, version
+
+    def _publish(self, task_id: int, version: Tuple[int, int], snapshot: TaskSettingsSnapshot):
+        with self._lock:
+            # Only publish if no write happened while loading; a partial snapshot
+            # (one loader failed) is kept briefly so a persistent failure does
+            # not reload every settings table for each message
+            if self.current_version(task_id) == version:
+                self._snapshots[task_id] = snapshot
+
+    def get(self, db, task_id: int) -> TaskSettingsSnapshot:
+        """Return the cached snapshot for a task, reloading it if stale"""
+        snapshot, version = self._lookup(task_id)
+        if snapshot is None:
+            # Load outside the lock: DB I/O must not block other tasks' lookups
+            snapshot = TaskSettingsSnapshot.load(db, task_id, version)
+            self._publish(task_id, version, snapshot)
+        return snapshot
+
+    async def get_async(self, db, task_id: int) -> TaskSettingsSnapshot:
+        """get() for coroutines: a reload never runs blocking DB calls on the event loop"""
+        snapshot, version = self._lookup(task_id)
+        if snapshot is None:
+            snapshot = await TaskSettingsSnapshot.load_async(db, task_id, version)
+            self._publish(task_id, version, snapshot)
+        return snapshot
+
+    def invalidate(self, task_id: Optional[int] = None):
+        """Drop one task's snapshot, or every snapshot when task_id is None"""
+        with self._lock:
+            self.invalidations += 1
+            if task_id is None:
+                self._global_version += 1
+                self._snapshots.clear()
+            else:
+                self._task_versions[task_id] = self._task_versions.get(task_id, 0) + 1
+                self._snapshots.pop(task_id, None)
+
+    def clear(self):
+        """Forget every snapshot and reset statistics"""
+        with self._lock:
+            self._snapshots.clear()
+            self._global_version += 1
+            self.hits = self.misses = self.invalidations = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        """Cache statistics for monitoring"""
+        with self._lock:
+            return {
+                'cached_tasks': len(self._snapshots),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+
+
+# Shared by the bot (writes) and the userbot (reads)
+settings_cache = TaskSettingsCache()
+
+
+def invalidates_task_settings(method: Callable) -> Callable:
+    """Decorator: drop the cached snapshot after a settings write
+
+    If the method has a ``task_id`` parameter only that task is invalidated,
+    otherwise (e.g. writes keyed by a row id or a user id) every snapshot is.
+    """
+    try:
+        parameters = list(inspect.signature(method).parameters)
+    except (TypeError, ValueError):
+        parameters = []
+    task_index = parameters.index('task_id') if 'task_id' in parameters else None
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        result = method(*args, **kwargs)
+        task_id = kwargs.get('task_id')
+        if task_id is None and task_index is not None and task_index < len(args):
+            task_id = args[task_index]
+        settings_cache.invalidate(task_id)
+        return result
+
+    wrapper.invalidates_task_settings = True
+    return wrapper
+
+
+def install_settings_invalidation(cls, method_names: Iterable[str]):
+    """Wrap the given write methods of a database class with invalidation"""
+    for name in method_names:
+        method = cls.__dict__.get(name)
+        if method is None or getattr(method, 'invalidates_task_settings', False):
+            continue
+        setattr(cls, name, invalidates_task_settings(method))
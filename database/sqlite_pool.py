@@ -0,0 +1,115 @@
+"""
+SQLite connection pool - مجمع اتصالات SQLite
+
+يحتفظ باتصال واحد لكل Thread بدلاً من فتح اتصال جديد لكل استعلام.
+كل اتصال يتم إعداده مرة واحدة بوضع WAL وإعدادات الأداء المناسبة
+حتى يتمكن البوت و UserBot من القراءة والكتابة بالتوازي دون "database is locked".
+"""
+import logging
+import sqlite3
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS: Tuple[Tuple[str, object], ...] = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),          # ms
+    ('mmap_size', 256 * 1024 * 1024),  # 256 MB
+    ('cache_size', -20000),          # negative = KiB -> ~20 MB page cache
+    ('temp_store', 'MEMORY'),
+)
+
+
+class SQLiteConnectionPool:
+    """Thread-aware pool: one configured sqlite3 connection per thread"""
+
+    def __init__(self, db_path: str, pragmas: Tuple[Tuple[str, object], ...] = DEFAULT_PRAGMAS,
+                 timeout: float = 30.0):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # thread ident -> (thread, connection), used for stats and cleanup of dead threads
+        self._connections: Dict[int, Tuple[threading.Thread, sqlite3.Connection]] = {}
+        self.created = 0
+        self.reused = 0
+        self.reconnects = 0
+        self.closed_stale = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # check_same_thread=False only so the pool can close connections of
+        # finished threads; each connection is still used by a single thread
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            try:
+                conn.execute(f'PRAGMA {name}={value}')
+            except sqlite3.DatabaseError as e:
+                logger.warning(f"⚠️ تعذر تطبيق PRAGMA {name}: {e}")
+        return conn
+
+    @staticmethod
+    def _is_open(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.total_changes
+            return True
+        except sqlite3.ProgrammingError:
+            return False
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, creating it on first use"""
+        conn: Optional[sqlite3.Connection] = getattr(self._local, 'conn', None)
+        if conn is not None:
+            if self._is_open(conn):
+                self.reused += 1
+                return conn
+            # A caller closed the pooled connection explicitly
+            self.reconnects += 1
+
+        conn = self._connect()
+        self._local.conn = conn
+        thread = threading.current_thread()
+        with self._lock:
+            self.created += 1
+            # First: a new thread can reuse the ident of a dead one and would hide its connection
+            self._close_dead_threads()
+            self._connections[thread.ident] = (thread, conn)
+        return conn
+
+    def _close_dead_threads(self):
+        """Close connections owned by threads that have exited (lock held)"""
+        for ident, (thread, conn) in list(self._connections.items()):
+            if not thread.is_alive():
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                del self._connections[ident]
+                self.closed_stale += 1
+
+    def close_all(self):
+        """Close every pooled connection (e.g. at shutdown)"""
+        with self._lock:
+            for _, conn in self._connections.values():
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+    def get_stats(self) -> Dict[str, object]:
+        """Pool statistics for monitoring"""
+        with self._lock:
+            open_connections = sum(1 for _, conn in self._connections.values() if self._is_open(conn))
+            return {
+                'db_path': self.db_path,
+                'open_connections': open_connections,
+                'created': self.created,
+                'reused': self.reused,
+                'reconnects': self.reconnects,
+                'closed_stale': self.closed_stale,
+            }
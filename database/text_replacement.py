@@ -0,0 +1,82 @@
+"""
+Compiled text replacement engine - محرك الاستبدال النصي المترجم
+
+تُجمع كل قواعد الاستبدال للمهمة في تعبير نمطي واحد (alternation) مع جدول
+بحث للنص البديل، فيتم الاستبدال بمرور واحد على النص بدلاً من re.sub لكل قاعدة.
+يُبنى المحرك مرة واحدة لكل نسخة من إعدادات المهمة ويعاد بناؤه عند تعديل القواعد.
+
+Longer phrases win over shorter ones starting at the same position, and the
+output of one rule is never re-scanned by another rule.
+"""
+import re
+from typing import Iterable, List, Optional, Tuple
+
+
+class TextReplacementEngine:
+    """All replacement rules of a task compiled into one regex"""
+
+    def __init__(self, replacements: Iterable):
+        rules: List[Tuple[str, str, bool, bool]] = []
+        for entry in replacements or []:
+            find_text = entry['find_text']
+            if not find_text:
+                continue
+            rules.append((find_text, entry['replace_text'] or '',
+                          bool(entry['is_case_sensitive']), bool(entry['is_whole_word'])))
+
+        # Longest first so "New York City" is not shadowed by "New York";
+        # for equal lengths the more specific (case-sensitive / whole-word) rule wins
+        rules.sort(key=lambda rule: (len(rule[0]), rule[2], rule[3]), reverse=True)
+
+        alternatives = []
+        self._replacements: List[str] = []
+        for find_text, replace_text, is_case_sensitive, is_whole_word in rules:
+            pattern = re.escape(find_text)
+            if is_whole_word:
+                pattern = r'\b' + pattern + r'\b'
+            if not is_case_sensitive:
+                pattern = '(?i:' + pattern + ')'
+            alternatives.append('(' + pattern + ')')
+            self._replacements.append(replace_text)
+
+        self.size = len(alternatives)
+        self._pattern = re.compile('|'.join(alternatives)) if alternatives else None
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def apply(self, text: str) -> Tuple[str, int]:
+        """Replace every match in one pass: (new text, number of replacements)"""
+        if not text or self._pattern is None:
+            return text, 0
+
+        replacements = self._replacements
+        count = 0
+
+        def substitute(match):
+            nonlocal count
+            count += 1
+            return replacements[match.lastindex - 1]
+
+        return self._pattern.sub(substitute, text), count
+
+
+def get_text_replacement_engine(settings) -> Optional[TextReplacementEngine]:
+    """Compiled engine of a task (None when replacement is disabled or empty)"""
+    def build(snapshot):
+        if not snapshot.get('text_replacement_enabled', False):
+            return None
+        engine = TextReplacementEngine(snapshot.get('text_replacements', []))
+        return engine if engine else None
+
+    return settings.compiled('text_replacement_engine', build)
+
+
+def apply_replacement_rules(settings, message_text: str) -> Tuple[str, int]:
+    """Apply a task's replacement rules: (new text, number of replacements)"""
+    if not message_text:
+        return message_text, 0
+    engine = get_text_replacement_engine(settings)
+    if engine is None:
+        return message_text, 0
+    return engine.apply(message_text)
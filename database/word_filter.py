@@ -0,0 +1,166 @@
+"""
+Compiled word filter matcher - مطابقة كلمات القائمة البيضاء/السوداء
+
+بدلاً من البحث عن كل كلمة في النص على حدة (O(كلمات × نص)) يتم بناء
+آلة Aho-Corasick واحدة لكل قائمة عند تغيرها، ثم يُفحص النص بمرور خطي واحد
+مع معرفة العبارة التي تطابقت.
+
+Case-insensitive entries are matched on a normalized form of the text:
+casefold + Arabic normalization (diacritics, tatweel, alef/ya/ta marbuta
+variants). Case-sensitive entries only ignore diacritics and tatweel.
+"""
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Tashkeel (fathatan .. sukun), superscript alef, Quranic marks, tatweel
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06dc\u06df-\u06e8\u06ea-\u06ed\u0640]')
+
+_ARABIC_LETTER_FOLDS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    'ة': 'ه',
+})
+
+
+def strip_arabic_marks(text: str) -> str:
+    """حذف التشكيل والتطويل"""
+    return _ARABIC_MARKS.sub('', text)
+
+
+def normalize_text(text: str) -> str:
+    """تطبيع غير حساس لحالة الأحرف مع توحيد أشكال الحروف العربية"""
+    return strip_arabic_marks(text).casefold().translate(_ARABIC_LETTER_FOLDS)
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher (one linear scan per text)"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        # patterns: (key to match, phrase to report)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Optional[str]] = [None]
+        self.size = 0
+
+        for key, phrase in patterns:
+            if not key:
+                continue
+            state = 0
+            for char in key:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(None)
+                state = next_state
+            if self._output[state] is None:
+                self._output[state] = phrase
+                self.size += 1
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                # Inherit the output of the longest proper suffix that is a pattern
+                if self._output[next_state] is None:
+                    self._output[next_state] = self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Optional[str]:
+        """Return the first phrase found in the text, or None"""
+        if not self.size:
+            return None
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+
+
+class WordFilterMatcher:
+    """Compiled form of one filter list (whitelist or blacklist)"""
+
+    def __init__(self, words: Iterable):
+        sensitive = []
+        insensitive = []
+        for entry in words or []:
+            # (id, filter_id, word_or_phrase, is_case_sensitive) or a dict-like row
+            if isinstance(entry, (tuple, list)):
+                word, is_case_sensitive = entry[2], entry[3]
+            else:
+                word, is_case_sensitive = entry['word_or_phrase'], entry['is_case_sensitive']
+            if not word:
+                continue
+            if is_case_sensitive:
+                sensitive.append((strip_arabic_marks(word), word))
+            else:
+                insensitive.append((normalize_text(word), word))
+
+        self._sensitive = AhoCorasick(sensitive)
+        self._insensitive = AhoCorasick(insensitive)
+        self.size = self._sensitive.size + self._insensitive.size
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def search(self, text: str) -> Optional[str]:
+        """العبارة المطابقة في النص (أو None)"""
+        if not text or not self.size:
+            return None
+        if self._sensitive.size:
+            match = self._sensitive.search(strip_arabic_marks(text))
+            if match is not None:
+                return match
+        if self._insensitive.size:
+            return self._insensitive.search(normalize_text(text))
+        return None
+
+
+def get_word_filter_matchers(settings) -> Tuple[WordFilterMatcher, WordFilterMatcher]:
+    """(whitelist, blacklist) matchers, compiled once per settings snapshot"""
+    return settings.compiled('word_filter_matchers', lambda snapshot: (
+        WordFilterMatcher(snapshot.get('whitelist_words', [])),
+        WordFilterMatcher(snapshot.get('blacklist_words', [])),
+    ))
+
+
+def check_word_filters(settings, message_text: str) -> Tuple[bool, Optional[str]]:
+    """Apply a task's word filters: (allowed, matched phrase)
+
+    For a blocked message the phrase is the blacklisted one; for an allowed
+    message it is the whitelisted phrase that let it through (if any).
+    """
+    if not message_text:
+        return True, None
+
+    filter_settings = settings.get('word_filter_settings', {})
+    whitelist, blacklist = get_word_filter_matchers(settings)
+    matched = None
+
+    if filter_settings.get('whitelist', {}).get('enabled') and whitelist:
+        matched = whitelist.search(message_text)
+        if matched is None:
+            return False, None
+
+    if filter_settings.get('blacklist', {}).get('enabled') and blacklist:
+        blocked = blacklist.search(message_text)
+        if blocked is not None:
+            return False, blocked
+
+    return True, matched
@@ -0,0 +1,265 @@
+"""
+ذاكرة مؤقتة مشتركة للوسائط المعالجة - Shared Media Cache
+
+ذاكرة LRU محدودة بعدد البايتات (وليس بعدد العناصر) تستخدمها العلامة المائية
+والوسوم الصوتية، مع طبقة قرص اختيارية تنقل إليها العناصر المطرودة من الذاكرة.
+
+Features:
+- Byte budget for RAM (MEDIA_CACHE_MAX_MB)
+- Optional disk tier (MEDIA_CACHE_DIR, MEDIA_CACHE_DISK_MAX_MB), reused across restarts
+- Stable keys: content hash + settings fingerprint (no task_id, no Python hash())
+- Hit / miss / eviction counters
+- get_async / put_async keep hashing and disk I/O off the event loop
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MEDIA_CACHE_MAX_BYTES = int(float(os.getenv('MEDIA_CACHE_MAX_MB', '256')) * 1024 * 1024)
+# Empty = no disk tier
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', '')
+MEDIA_CACHE_DISK_MAX_BYTES = int(float(os.getenv('MEDIA_CACHE_DISK_MAX_MB', '2048')) * 1024 * 1024)
+
+CACHE_FILE_SUFFIX = '.media'
+
+
+def content_hash(data: bytes) -> str:
+    """hash ثابت للمحتوى (لا يتغير بين العمليات بعكس hash())"""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def settings_fingerprint(settings: Any) -> str:
+    """بصمة الإعدادات التي تؤثر على ناتج المعالجة"""
+    encoded = json.dumps(settings, sort_keys=True, default=str, ensure_ascii=False).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=10).hexdigest()
+
+
+class MediaCache:
+    """LRU cache of processed media bounded by bytes, with an optional disk tier"""
+
+    def __init__(self, max_bytes: int = MEDIA_CACHE_MAX_BYTES, disk_dir: Optional[str] = MEDIA_CACHE_DIR or None,
+                 disk_max_bytes: int = MEDIA_CACHE_DISK_MAX_BYTES, max_item_bytes: Optional[int] = None):
+        self.max_bytes = max(0, max_bytes)
+        # A single item may not take more than half of the RAM budget
+        self.max_item_bytes = max_item_bytes if max_item_bytes is not None else self.max_bytes // 2
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes if disk_dir else 0
+        self._memory: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._disk: 'OrderedDict[str, int]' = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spills = 0
+
+        if self.disk_dir:
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(namespace: str, data: bytes, file_name: str, settings: Any) -> str:
+        """مفتاح: النوع + hash المحتوى + بصمة الإعدادات + امتداد الملف"""
+        extension = os.path.splitext(file_name or '')[1].lower().lstrip('.') or 'bin'
+        return f"{namespace}-{content_hash(data)}-{settings_fingerprint(settings)}-{extension}"
+
+    # ===== disk tier =====
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + CACHE_FILE_SUFFIX)
+
+    def _load_disk_index(self):
+        """فهرسة ملفات القرص الموجودة من تشغيل سابق (الأقدم أولاً)"""
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(CACHE_FILE_SUFFIX):
+                    path = os.path.join(self.disk_dir, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, name[:-len(CACHE_FILE_SUFFIX)], stat.st_size))
+            for _, key, size in sorted(entries):
+                self._disk[key] = size
+                self.disk_bytes += size
+            self._trim_disk()
+            if self._disk:
+                logger.info(f"💾 تم تحميل فهرس ذاكرة الوسائط من القرص: {len(self._disk)} ملف")
+        except Exception as e:
+            logger.error(f"خطأ في تهيئة مجلد ذاكرة الوسائط {self.disk_dir}: {e}")
+            self.disk_dir = None
+            self.disk_max_bytes = 0
+
+    def _write_disk(self, key: str, data: bytes) -> bool:
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return False
+        path = self._disk_path(key)
+        try:
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"خطأ في كتابة ملف ذاكرة الوسائط: {e}")
+            return False
+        if key in self._disk:
+            self.disk_bytes -= self._disk.pop(key)
+        self._disk[key] = len(data)
+        self.disk_bytes += len(data)
+        self._trim_disk()
+        return True
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر قراءة ملف ذاكرة الوسائط {key}: {e}")
+            self._remove_disk(key)
+            return None
+
+    def _remove_disk(self, key: str):
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self.disk_bytes -= size
+        try:
+            os.unlink(self._disk_path(key))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر حذف ملف ذاكرة الوسائط {key}: {e}")
+
+    def _trim_disk(self):
+        while self._disk and self.disk_bytes > self.disk_max_bytes:
+            key = next(iter(self._disk))
+            self._remove_disk(key)
+            self.evictions += 1
+
+    # ===== memory tier =====
+
+    def _trim_memory(self):
+        while self._memory and self.memory_bytes > self.max_bytes:
+            key, data = self._memory.popitem(last=False)
+            self.memory_bytes -= len(data)
+            if key not in self._disk and self._write_disk(key, data):
+                self.spills += 1
+            elif key not in self._disk:
+                self.evictions += 1
+
+    # ===== public API =====
+
+    def get(self, key: str) -> Optional[bytes]:
+        """قراءة عنصر (يحدّث ترتيب LRU)"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return data
+
+            if key in self._disk:
+                data = self._read_disk(key)
+                if data is not None:
+                    self._disk.move_to_end(key)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    # Small items move back to RAM, large ones stay on disk
+                    if len(data) <= self.max_item_bytes:
+                        self._memory[key] = data
+                        self.memory_bytes += len(data)
+                        self._trim_memory()
+                    return data
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, data: bytes):
+        """حفظ عنصر؛ العناصر الكبيرة تذهب للقرص مباشرة (أو لا تحفظ بدون قرص)"""
+        if data is None:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self.memory_bytes -= len(old)
+
+            if len(data) > self.max_item_bytes:
+                if not self._write_disk(key, data):
+                    logger.info(f"📦 الملف أكبر من حد ذاكرة الوسائط ({len(data)} bytes) - لن يتم حفظه")
+                return
+
+            self._memory[key] = data
+            self.memory_bytes += len(data)
+            self._trim_memory()
+
+    async def get_async(self, key: str) -> Optional[bytes]:
+        """get() في Thread منفصل (قد تقرأ من القرص)"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    async def put_async(self, key: str, data: bytes):
+        """put() في Thread منفصل (قد تكتب إلى القرص)"""
+        await asyncio.get_running_loop().run_in_executor(None, self.put, key, data)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._memory.keys() | self._disk.keys())
+
+    def clear(self, namespace: Optional[str] = None):
+        """مسح كل العناصر أو عناصر نوع واحد (watermark / audio)"""
+        with self._lock:
+            prefix = f"{namespace}-" if namespace else ''
+            for key in [key for key in self._memory if key.startswith(prefix)]:
+                self.memory_bytes -= len(self._memory.pop(key))
+            for key in [key for key in self._disk if key.startswith(prefix)]:
+                self._remove_disk(key)
+
+    def get_stats(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """إحصائيات الذاكرة"""
+        with self._lock:
+            prefix = f"{namespace}-" if namespace else ''
+            keys = [key for key in self._memory.keys() | self._disk.keys() if key.startswith(prefix)]
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(keys),
+                'memory_entries': len(self._memory),
+                'memory_bytes': self.memory_bytes,
+                'max_bytes': self.max_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self.disk_bytes,
+                'disk_max_bytes': self.disk_max_bytes,
+                'disk_dir': self.disk_dir,
+                'hits': self.hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'spills': self.spills,
+            }
+
+
+_shared_cache: Optional[MediaCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_media_cache() -> MediaCache:
+    """الذاكرة المشتركة بين معالج العلامة المائية ومعالج الصوت"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = MediaCache()
+    return _shared_cache
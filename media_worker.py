@@ -0,0 +1,292 @@
+"""
+خدمة عمال معالجة الوسائط - Media Worker Service
+
+تنقل معالجة العلامة المائية والوسوم الصوتية (OpenCV / FFmpeg) من حلقة أحداث
+Telethon إلى مجمع عمليات منفصل، حتى لا يتجمد UserBot لجميع المستخدمين
+أثناء معالجة فيديو طويل.
+
+Features:
+- ProcessPoolExecutor awaited via run_in_executor
+- Job IDs with status tracking
+- Per-job timeouts and cancellation
+- Concurrency cap per media type (video / image / audio)
+"""
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Number of worker processes (0 = run jobs in a thread pool instead)
+MEDIA_WORKERS = int(os.getenv('MEDIA_WORKERS', str(min(4, os.cpu_count() or 1))))
+# 'spawn' avoids forking the bot/userbot threads and their locks
+MEDIA_WORKER_START_METHOD = os.getenv('MEDIA_WORKER_START_METHOD', 'spawn')
+
+DEFAULT_CONCURRENCY = {
+    'video': int(os.getenv('MEDIA_VIDEO_CONCURRENCY', '1')),
+    'image': int(os.getenv('MEDIA_IMAGE_CONCURRENCY', '2')),
+    'audio': int(os.getenv('MEDIA_AUDIO_CONCURRENCY', '2')),
+}
+
+DEFAULT_TIMEOUTS = {
+    'video': float(os.getenv('MEDIA_VIDEO_TIMEOUT', '600')),
+    'image': float(os.getenv('MEDIA_IMAGE_TIMEOUT', '60')),
+    'audio': float(os.getenv('MEDIA_AUDIO_TIMEOUT', '180')),
+}
+
+
+class MediaJobError(Exception):
+    """Media job failed, timed out or was cancelled"""
+
+
+class MediaJob:
+    """A single media processing job"""
+
+    def __init__(self, job_id: str, media_type: str, timeout: Optional[float]):
+        self.job_id = job_id
+        self.media_type = media_type
+        self.timeout = timeout
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'media_type': self.media_type,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+# ===== Functions executed inside the worker processes =====
+
+_worker_processors: Dict[str, Any] = {}
+
+
+def _get_worker_processor(kind: str):
+    """One processor instance per worker process, created on first use"""
+    processor = _worker_processors.get(kind)
+    if processor is None:
+        if kind == 'watermark':
+            from watermark_processor import WatermarkProcessor
+            processor = WatermarkProcessor()
+        else:
+            from audio_processor import AudioProcessor
+            processor = AudioProcessor()
+        _worker_processors[kind] = processor
+    return processor
+
+
+def run_watermark_job(media_bytes: bytes, file_name: str, watermark_settings: dict) -> bytes:
+    """Apply the watermark (worker process side, no caching)"""
+    processor = _get_worker_processor('watermark')
+    if not watermark_settings.get('enabled', False):
+        return media_bytes
+    media_type = processor.get_media_type_from_file(file_name)
+    if not processor.should_apply_watermark(media_type, watermark_settings):
+        return media_bytes
+    return processor.process_media_with_watermark(media_bytes, file_name, watermark_settings) or media_bytes
+
+
+def run_audio_job(audio_bytes: bytes, file_name: str, metadata_template: Dict[str, str],
+                  album_art_path: Optional[str], apply_art_to_all: bool,
+                  audio_intro_path: Optional[str], audio_outro_path: Optional[str],
+                  intro_position: str) -> bytes:
+    """Apply audio tags / merge segments (worker process side, no caching)"""
+    processor = _get_worker_processor('audio')
+    return processor.process_audio_metadata(
+        audio_bytes, file_name, metadata_template, album_art_path,
+        apply_art_to_all, audio_intro_path, audio_outro_path, intro_position
+    ) or audio_bytes
+
+
+# ===== Service used from the event loop =====
+
+class MediaWorkerService:
+    """Runs CPU/IO heavy media jobs outside the event loop"""
+
+    def __init__(self, max_workers: int = MEDIA_WORKERS, concurrency: Optional[Dict[str, int]] = None,
+                 timeouts: Optional[Dict[str, float]] = None, start_method: str = MEDIA_WORKER_START_METHOD):
+        self.max_workers = max_workers
+        self.concurrency = dict(DEFAULT_CONCURRENCY, **(concurrency or {}))
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.start_method = start_method
+        self.jobs: Dict[str, MediaJob] = {}
+        self._executor = None
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._ids = itertools.count(1)
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.pool_restarts = 0
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.max_workers > 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.uses_processes:
+                try:
+                    context = multiprocessing.get_context(self.start_method)
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+                    logger.info(f"🏭 تم تشغيل مجمع عمليات الوسائط ({self.max_workers} عامل)")
+                except Exception as e:
+                    logger.warning(f"⚠️ تعذر إنشاء مجمع العمليات، استخدام Threads بدلاً منه: {e}")
+                    self.max_workers = 0
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(self.concurrency.values()),
+                                                    thread_name_prefix='media-worker')
+        return self._executor
+
+    def _get_limit(self, media_type: str) -> asyncio.Semaphore:
+        limit = self._limits.get(media_type)
+        if limit is None:
+            limit = asyncio.Semaphore(max(1, self.concurrency.get(media_type, 1)))
+            self._limits[media_type] = limit
+        return limit
+
+    @staticmethod
+    def _shutdown_executor(executor):
+        """shutdown() without waiting; cancel_futures is only available on Python 3.9+"""
+        if sys.version_info >= (3, 9):
+            executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            executor.shutdown(wait=False)
+
+    def _restart_pool(self, executor, reason: str):
+        """Replace a pool that is broken or running a stuck job
+
+        A single worker process cannot be killed without breaking the whole pool,
+        so the other jobs running on it fail with BrokenProcessPool and are
+        retried once on the new pool (see _execute).
+        """
+        if executor is not self._executor or not isinstance(executor, ProcessPoolExecutor):
+            return
+        self._executor = None
+        self.pool_restarts += 1
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            try:
+                process.terminate()
+            except Exception:
+                pass
+        self._shutdown_executor(executor)
+        logger.warning(f"♻️ تم إعادة تشغيل مجمع عمليات الوسائط ({reason})")
+
+    def submit(self, media_type: str, func: Callable, *args, timeout: Optional[float] = None) -> str:
+        """Schedule a job and return its ID (must be called from the event loop)"""
+        job_id = f"{media_type}-{next(self._ids)}"
+        job = MediaJob(job_id, media_type, timeout if timeout is not None else self.timeouts.get(media_type))
+        job.task = asyncio.get_running_loop().create_task(self._execute(job, func, args))
+        self.jobs[job_id] = job
+        return job_id
+
+    async def _execute(self, job: MediaJob, func: Callable, args: tuple):
+        async with self._get_limit(job.media_type):
+            job.status = 'running'
+            job.started_at = time.time()
+            try:
+                result = await self._run_in_pool(job, func, args)
+                job.status = 'done'
+                self.completed += 1
+                return result
+            except asyncio.TimeoutError:
+                job.status = 'timeout'
+                self.timed_out += 1
+                logger.error(f"⏰ انتهت مهلة مهمة الوسائط {job.job_id} ({job.timeout} ثانية)")
+                raise MediaJobError(f"job {job.job_id} timed out")
+            except asyncio.CancelledError:
+                job.status = 'cancelled'
+                self.cancelled += 1
+                raise
+            except Exception as e:
+                job.status = 'failed'
+                self.failed += 1
+                logger.error(f"خطأ في مهمة الوسائط {job.job_id}: {e}")
+                raise MediaJobError(str(e)) from e
+            finally:
+                job.finished_at = time.time()
+
+    async def _run_in_pool(self, job: MediaJob, func: Callable, args: tuple):
+        """Run the job; retry it once if the pool broke under it (crash or another job's restart)"""
+        for attempt in range(2):
+            executor = self._get_executor()
+            future = asyncio.get_running_loop().run_in_executor(executor, func, *args)
+            try:
+                return await asyncio.wait_for(future, timeout=job.timeout)
+            except asyncio.TimeoutError:
+                # The worker is still busy with the stuck job
+                self._restart_pool(executor, f"انتهت مهلة المهمة {job.job_id}")
+                raise
+            except BrokenProcessPool:
+                self._restart_pool(executor, "توقف عامل بشكل مفاجئ")
+                if attempt:
+                    raise
+                logger.warning(f"🔁 إعادة محاولة مهمة الوسائط {job.job_id} على المجمع الجديد")
+
+    async def wait(self, job_id: str):
+        """Wait for a job and return its result (raises MediaJobError on failure)"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise MediaJobError(f"unknown job {job_id}")
+        try:
+            return await job.task
+        except asyncio.CancelledError:
+            if job.status == 'cancelled':
+                raise MediaJobError(f"job {job_id} was cancelled")
+            raise
+        finally:
+            self.jobs.pop(job_id, None)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job"""
+        job = self.jobs.get(job_id)
+        if job is None or job.task is None or job.task.done():
+            return False
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            self.cancelled += 1
+        job.task.cancel()
+        logger.info(f"🛑 تم إلغاء مهمة الوسائط {job_id}")
+        return True
+
+    async def run(self, media_type: str, func: Callable, *args, timeout: Optional[float] = None):
+        """Submit a job and wait for its result"""
+        job_id = self.submit(media_type, func, *args, timeout=timeout)
+        return await self.wait(job_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Worker statistics"""
+        return {
+            'mode': 'process' if self.uses_processes else 'thread',
+            'max_workers': self.max_workers,
+            'concurrency': dict(self.concurrency),
+            'jobs': [job.to_dict() for job in self.jobs.values()],
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'cancelled': self.cancelled,
+            'pool_restarts': self.pool_restarts,
+        }
+
+    def shutdown(self):
+        """Cancel pending jobs and stop the workers"""
+        for job in list(self.jobs.values()):
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        if self._executor is not None:
+            self._shutdown_executor(self._executor)
+            self._executor = None
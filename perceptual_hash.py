@@ -0,0 +1,171 @@
+"""
+Perceptual media hashing - البصمة الإدراكية للصور والفيديو
+
+يحسب بصمة 64 بت (dHash أو pHash) من الصورة المصغرة للوسائط بدلاً من معرف
+Telegram، حتى تكتشف نفس الصورة المعاد رفعها من قناة أخرى. البصمات تقارن
+بمسافة Hamming عبر فهرس متعدد الأجزاء (multi-index hashing): تقسم البصمة
+إلى d+1 جزء، وأي بصمتين بينهما d بت مختلفة على الأكثر تتطابقان في جزء واحد
+على الأقل، فيتم فحص المرشحين من الجداول فقط.
+
+Enabled with DUPLICATE_PERCEPTUAL_HASH=1; requires Pillow for decoding.
+"""
+import io
+import logging
+import math
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = None
+    PIL_AVAILABLE = False
+
+PERCEPTUAL_HASH_ENABLED = os.getenv('DUPLICATE_PERCEPTUAL_HASH', '0').lower() in ('1', 'true', 'yes')
+PERCEPTUAL_HASH_ALGORITHM = os.getenv('DUPLICATE_PERCEPTUAL_HASH_ALGORITHM', 'dhash')  # 'dhash' or 'phash'
+# Maximum differing bits for two media to count as the same image
+PERCEPTUAL_HASH_DISTANCE = int(os.getenv('DUPLICATE_PERCEPTUAL_HASH_DISTANCE', '6'))
+
+HASH_BITS = 64
+_SIGN_BIT = 1 << (HASH_BITS - 1)
+
+_PHASH_SIZE = 32
+_PHASH_LOW = 8
+# DCT-II basis for the 8 lowest frequencies of a 32-sample row
+_DCT_BASIS = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * _PHASH_SIZE)) for x in range(_PHASH_SIZE)]
+    for u in range(_PHASH_LOW)
+]
+
+
+def dhash_from_pixels(pixels: Sequence[int]) -> int:
+    """dHash of a 9x8 grayscale grid (row-major): one bit per horizontal gradient"""
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def phash_from_pixels(pixels: Sequence[int]) -> int:
+    """pHash of a 32x32 grayscale grid: sign of the 8x8 low-frequency DCT against its median"""
+    size = _PHASH_SIZE
+    # Separable DCT: rows first (only the 8 needed coefficients), then columns
+    rows = []
+    for y in range(size):
+        line = pixels[y * size:(y + 1) * size]
+        rows.append([sum(b * p for b, p in zip(basis, line)) for basis in _DCT_BASIS])
+    coefficients = []
+    for v in range(_PHASH_LOW):
+        for u in range(_PHASH_LOW):
+            coefficients.append(sum(_DCT_BASIS[v][y] * rows[y][u] for y in range(size)))
+
+    # Skip the DC term when computing the median (it only reflects brightness)
+    median = sorted(coefficients[1:])[(len(coefficients) - 1) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+def image_hash(image_bytes: bytes, algorithm: str = PERCEPTUAL_HASH_ALGORITHM) -> Optional[int]:
+    """64-bit perceptual hash of an encoded image (thumbnail), or None"""
+    if not PIL_AVAILABLE or not image_bytes:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            gray = image.convert('L')
+            if algorithm == 'phash':
+                return phash_from_pixels(list(gray.resize((_PHASH_SIZE, _PHASH_SIZE), Image.LANCZOS).getdata()))
+            return dhash_from_pixels(list(gray.resize((9, 8), Image.LANCZOS).getdata()))
+    except Exception as e:
+        logger.warning(f"⚠️ تعذر حساب البصمة الإدراكية: {e}")
+        return None
+
+
+def hamming_distance(hash1: int, hash2: int) -> int:
+    return bin((hash1 ^ hash2) & ((1 << HASH_BITS) - 1)).count('1')
+
+
+def to_signed(value: int) -> int:
+    """Unsigned 64-bit hash -> SQLite INTEGER"""
+    return value - (1 << HASH_BITS) if value & _SIGN_BIT else value
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def select_thumbnail(sizes: Iterable, min_side: int = 90):
+    """Smallest downloadable thumbnail with at least min_side pixels
+
+    Stripped/cached inline sizes (no w/h) are skipped; falls back to the largest one.
+    """
+    candidates = [size for size in (sizes or []) if getattr(size, 'w', 0) and getattr(size, 'h', 0)]
+    if not candidates:
+        return None
+    candidates.sort(key=lambda size: size.w * size.h)
+    for size in candidates:
+        if min(size.w, size.h) >= min_side:
+            return size
+    return candidates[-1]
+
+
+class HammingIndex:
+    """Multi-index hashing: exact lookup of ids within max_distance bits"""
+
+    def __init__(self, max_distance: int = PERCEPTUAL_HASH_DISTANCE):
+        self.max_distance = max(0, min(max_distance, HASH_BITS - 1))
+        chunks = self.max_distance + 1
+        width, extra = divmod(HASH_BITS, chunks)
+        self._chunks: List[Tuple[int, int]] = []  # (shift, mask)
+        shift = 0
+        for i in range(chunks):
+            bits = width + (1 if i < extra else 0)
+            self._chunks.append((shift, (1 << bits) - 1))
+            shift += bits
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in self._chunks]
+        self._hashes: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _keys(self, value: int):
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            yield table, (value >> shift) & mask
+
+    def add(self, item_id: int, value: int):
+        self.remove(item_id)
+        self._hashes[item_id] = value
+        for table, key in self._keys(value):
+            table.setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id: int):
+        value = self._hashes.pop(item_id, None)
+        if value is None:
+            return
+        for table, key in self._keys(value):
+            ids = table.get(key)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del table[key]
+
+    def search(self, value: int) -> List[Tuple[int, int]]:
+        """(item_id, distance) pairs within max_distance, nearest first"""
+        candidates: Set[int] = set()
+        for table, key in self._keys(value):
+            ids = table.get(key)
+            if ids:
+                candidates.update(ids)
+        results = []
+        for item_id in candidates:
+            distance = hamming_distance(value, self._hashes[item_id])
+            if distance <= self.max_distance:
+                results.append((item_id, distance))
+        results.sort(key=lambda item: item[1])
+        return results
@@ -1,23 +1,92 @@
 """
 مساعد لإرسال الملفات مع اسم مخصص في Telethon
 يحل مشكلة إرسال البيانات الخام (bytes) مع اسم ملف صحيح
+ويرفع الوسائط المعالجة مرة واحدة فقط لكل الأهداف (upload once, send many)
 """
+import asyncio
+import hashlib
 import io
 import logging
-from typing import Union, Optional
+from typing import Any, Dict, Union, Optional
 
 logger = logging.getLogger(__name__)
 
+try:
+    from telethon.errors import FloodWaitError, SlowModeWaitError
+    # Telegram asked to wait: the caller parks the target, an immediate re-upload would just flood again
+    WAIT_ERRORS = (FloodWaitError, SlowModeWaitError)
+except ImportError:
+    WAIT_ERRORS = ()
+
+
+class MediaUploadCache:
+    """ذاكرة رفع لكل رسالة: الملف يُرفع مرة واحدة ثم يعاد استخدامه لباقي الأهداف
+
+    المفتاح هو hash المحتوى، والقيمة هي وسائط الرسالة المرسلة أول مرة
+    (أو InputFile الناتج عن upload_file)، فلا يعيد Telethon رفع الملف لكل هدف.
+    """
+
+    def __init__(self):
+        self._handles: Dict[str, Any] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._digests: Dict[int, tuple] = {}
+        self.uploads = 0
+        self.reuses = 0
+
+    def content_key(self, file_data: bytes) -> str:
+        """hash المحتوى (يحسب مرة واحدة لنفس كائن bytes)"""
+        cached = self._digests.get(id(file_data))
+        if cached is not None and cached[0] is file_data:
+            return cached[1]
+        digest = hashlib.sha256(file_data).hexdigest()
+        self._digests[id(file_data)] = (file_data, digest)
+        return digest
+
+    def lock(self, key: str) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    def get(self, key: str):
+        return self._handles.get(key)
+
+    def remember(self, key: str, handle):
+        if handle is not None:
+            self._handles[key] = handle
+
+    def forget(self, key: str):
+        self._handles.pop(key, None)
+
+    @staticmethod
+    def media_handle(sent_message):
+        """وسائط الرسالة المرسلة (قابلة لإعادة الإرسال بدون رفع)"""
+        if isinstance(sent_message, list):
+            sent_message = sent_message[0] if sent_message else None
+        return getattr(sent_message, 'media', None)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'entries': len(self._handles), 'uploads': self.uploads, 'reuses': self.reuses}
+
+
 class TelethonFileSender:
     """مساعد لإرسال الملفات مع أسماء صحيحة"""
     
     @staticmethod
-    async def send_file_with_name(client, entity, file_data: Union[bytes, any], filename: str, **kwargs):
+    async def send_file_with_name(client, entity, file_data: Union[bytes, any], filename: str,
+                                  upload_cache: Optional[MediaUploadCache] = None, **kwargs):
         """
         إرسال ملف مع اسم مخصص
         يحل مشكلة Telethon مع البيانات الخام والأسماء المخصصة
+        upload_cache: ذاكرة رفع مشتركة بين أهداف نفس الرسالة لتجنب إعادة الرفع
         """
         try:
+            # رفع مرة واحدة وإعادة الاستخدام لباقي الأهداف
+            if isinstance(file_data, bytes) and upload_cache is not None:
+                return await TelethonFileSender._send_cached(client, entity, file_data, filename,
+                                                             upload_cache, **kwargs)
+
             # إذا كانت البيانات هي bytes، استخدم BytesIO مع name attribute
             if isinstance(file_data, bytes):
                 logger.info(f"📤 إرسال ملف bytes مع اسم: {filename}")
@@ -38,7 +107,11 @@ class TelethonFileSender:
                 logger.info(f"📤 إرسال ملف عادي مع اسم: {filename}")
                 return await client.send_file(entity, file_data, file_name=filename, **kwargs)
                 
+        except WAIT_ERRORS:
+            raise
         except Exception as e:
+            if upload_cache is not None and isinstance(file_data, bytes):
+                upload_cache.forget(upload_cache.content_key(file_data))
             logger.error(f"❌ خطأ في إرسال الملف {filename}: {e}")
             import traceback
             logger.error(f"❌ تفاصيل الخطأ: {traceback.format_exc()}")
@@ -55,4 +128,30 @@ class TelethonFileSender:
                     return await client.send_file(entity, file_data, **kwargs)
             except Exception as e2:
                 logger.error(f"❌ فشل حتى في الإرسال البديل: {e2}")
-                raise e
\ No newline at end of file
+                raise e
+
+    @staticmethod
+    async def _send_cached(client, entity, file_data: bytes, filename: str,
+                           upload_cache: MediaUploadCache, **kwargs):
+        """إرسال باستخدام ذاكرة الرفع: أول هدف يرفع الملف، والباقي يعيدون استخدام الوسائط"""
+        key = upload_cache.content_key(file_data)
+
+        handle = upload_cache.get(key)
+        if handle is None:
+            # الأهداف المتزامنة تنتظر انتهاء الرفع الأول بدلاً من رفع نسخ إضافية
+            async with upload_cache.lock(key):
+                handle = upload_cache.get(key)
+                if handle is None:
+                    logger.info(f"📤 رفع الملف مرة واحدة: {filename} ({len(file_data)} bytes)")
+                    file_stream = io.BytesIO(file_data)
+                    file_stream.name = filename
+                    result = await client.send_file(entity, file_stream, **kwargs)
+                    upload_cache.uploads += 1
+                    # وسائط الرسالة المرسلة تحتفظ بخصائص الفيديو/الصورة؛ بدونها لا نخزن شيئاً
+                    # (رفع InputFile هنا يعني رفع نفس البيانات مرة ثانية)
+                    upload_cache.remember(key, upload_cache.media_handle(result))
+                    return result
+
+        upload_cache.reuses += 1
+        logger.info(f"♻️ إعادة استخدام الملف المرفوع مسبقاً: {filename}")
+        return await client.send_file(entity, handle, **kwargs)
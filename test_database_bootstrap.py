@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+اختبار أداء تهيئة قاعدة البيانات
+Regression benchmark: schema DDL must run once per process, never per message
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+
+DDL_PREFIXES = ('CREATE', 'ALTER', 'DROP')
+MESSAGES = 200
+
+
+class TracingDatabase(Database):
+    """Database that records every DDL statement sent to SQLite"""
+
+    ddl_statements = []
+
+    def get_connection(self):
+        conn = super().get_connection()
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    @classmethod
+    def _trace(cls, statement):
+        if statement.lstrip().upper().startswith(DDL_PREFIXES):
+            cls.ddl_statements.append(statement)
+
+
+def _simulate_message(db_path, task_id):
+    """Per-message pattern of the old filter helpers: construct + query"""
+    db = TracingDatabase(db_path)
+    db.get_task_media_filters(task_id)
+    db.is_message_allowed_by_word_filter(task_id, 'نص تجريبي')
+    db.get_message_settings(task_id)
+    db.get_forwarding_settings(task_id)
+
+
+def test_schema_bootstrap_runs_once():
+    """تهيئة الجداول تتم مرة واحدة فقط لكل ملف قاعدة بيانات"""
+    print("🔍 اختبار تهيئة الجداول مرة واحدة")
+    db_path = os.path.join(tempfile.mkdtemp(), 'bootstrap_test.db')
+
+    db = TracingDatabase(db_path)
+    bootstrap_ddl = len(TracingDatabase.ddl_statements)
+    assert bootstrap_ddl > 0
+
+    task_id = db.create_task(1, '-1001111111111', 'مصدر', '-1002222222222', 'هدف')
+    TracingDatabase.ddl_statements.clear()
+
+    start = time.perf_counter()
+    for _ in range(MESSAGES):
+        _simulate_message(db_path, task_id)
+    elapsed = time.perf_counter() - start
+
+    assert TracingDatabase.ddl_statements == [], TracingDatabase.ddl_statements[:3]
+    print(f"✅ {bootstrap_ddl} عملية DDL عند التهيئة، 0 عملية DDL خلال {MESSAGES} رسالة")
+    print(f"⏱️ {elapsed / MESSAGES * 1000:.2f} ms لكل رسالة")
+
+
+def test_explicit_init_still_available():
+    """يمكن استدعاء init_database يدوياً عند الحاجة"""
+    print("🔍 اختبار الاستدعاء اليدوي لـ init_database")
+    db_path = os.path.join(tempfile.mkdtemp(), 'explicit_init.db')
+    db = TracingDatabase(db_path)
+
+    TracingDatabase.ddl_statements.clear()
+    db.init_database()
+    assert TracingDatabase.ddl_statements
+    print("✅ init_database يعمل يدوياً")
+
+
+def test_shared_handle_is_reused():
+    """get_database تعيد نفس النسخة في كل استدعاء"""
+    print("🔍 اختبار النسخة المشتركة لقاعدة البيانات")
+    from database import get_database, reset_database
+
+    # العمل في مجلد مؤقت حتى لا يتم تعديل telegram_bot.db الخاص بالمشروع
+    original_dir = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        assert get_database() is get_database()
+    finally:
+        reset_database()
+        os.chdir(original_dir)
+    print("✅ النسخة المشتركة يعاد استخدامها")
+
+
+if __name__ == "__main__":
+    print("🏁 اختبار أداء تهيئة قاعدة البيانات")
+    print("=" * 50)
+
+    test_schema_bootstrap_runs_once()
+    test_explicit_init_still_available()
+    test_shared_handle_is_reused()
+
+    print("\n🎉 تم الانتهاء من اختبار تهيئة قاعدة البيانات!")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+اختبار فهرس كشف الرسائل المتشابهة
+Test the MinHash/LSH near-duplicate index and its persisted signatures
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from userbot_service.duplicate_index import (
+    DuplicateIndexManager, NearDuplicateIndex, jaccard, text_signature, unpack_signature
+)
+
+
+def test_lsh_matches_exact_jaccard():
+    """الفهرس يعطي نفس نتيجة المقارنة الخطية"""
+    print("🔍 اختبار مطابقة LSH لنسبة Jaccard الدقيقة")
+
+    base = "breaking news the central bank raised interest rates by half a point today"
+    texts = [f"{base} update {i}" for i in range(5)]
+    texts += [f"unrelated message number {i} about football results and weather" for i in range(200)]
+
+    index = NearDuplicateIndex(threshold=0.8, window_seconds=3600)
+    for entry_id, text in enumerate(texts):
+        words, signature = text_signature(text)
+        index.add(entry_id, 1000 + entry_id, words, signature)
+
+    query = base + " update 9"
+    words, signature = text_signature(query)
+    found = index.find_text(words, signature)
+
+    exact = [(i, jaccard(words, text_signature(t)[0])) for i, t in enumerate(texts)]
+    expected = max((item for item in exact if item[1] >= 0.8), key=lambda item: item[1])
+    assert found is not None and abs(found[1] - expected[1]) < 1e-9
+
+    words, signature = text_signature("completely different text with no overlap at all")
+    assert index.find_text(words, signature) is None
+    print(f"✅ LSH يطابق المقارنة الدقيقة (أشرطة={index.bands}×{index.rows})")
+
+
+def test_window_expiry_and_media():
+    """انتهاء النافذة الزمنية وتطابق الوسائط"""
+    print("🔍 اختبار النافذة الزمنية والوسائط")
+
+    index = NearDuplicateIndex(threshold=0.9, window_seconds=100)
+    words, signature = text_signature("hello world")
+    index.add(1, 10, words, signature, media_hash='photo-1')
+    index.add(2, 50, frozenset(), (), media_hash='photo-2')
+
+    assert index.find_media('photo-1') == 1
+    index.touch(1, 200)  # refreshed by a duplicate
+    assert index.expire(100) == 1  # only entry 2 expires
+    assert index.find_media('photo-2') is None
+    assert index.find_text(words, signature)[0] == 1
+    print("✅ النافذة الزمنية والوسائط تعمل")
+
+
+def test_manager_persists_signatures():
+    """التوقيعات تحفظ في قاعدة البيانات ويعاد بناء الفهرس منها"""
+    print("🔍 اختبار حفظ التوقيعات وإعادة البناء")
+
+    db = Database(os.path.join(tempfile.mkdtemp(), 'duplicate_index_test.db'))
+    task_id = db.create_task(1, '-1001111111111', 'مصدر', '-1002222222222', 'هدف')
+    now = int(time.time())
+
+    manager = DuplicateIndexManager(db)
+    text = "مرحبا بكم في قناة الأخبار العاجلة اليوم"
+    assert manager.check_and_store(task_id, text, '', '', 0.8, 24, True, False, now=now) is None
+    match = manager.check_and_store(task_id, text + " اليوم", '', '', 0.8, 24, True, False, now=now + 5)
+    assert match is not None and match['reason'] == 'text'
+
+    rows = db.get_recent_messages_for_duplicate_check(task_id, now - 10)
+    assert len(rows) == 1 and rows[0]['timestamp'] == now + 5
+    assert unpack_signature(rows[0]['text_signature']) == text_signature(text)[1]
+
+    # restart: index rebuilt from stored signatures
+    restarted = DuplicateIndexManager(db)
+    match = restarted.check_and_store(task_id, text, '', '', 0.8, 24, True, False, now=now + 10)
+    assert match is not None and match['id'] == rows[0]['id']
+    assert restarted.get_stats() == {task_id: 1}
+    print("✅ التوقيعات محفوظة والفهرس يعاد بناؤه")
+
+
+if __name__ == "__main__":
+    print("🗂️ اختبار فهرس التكرار")
+    print("=" * 50)
+
+    test_lsh_matches_exact_jaccard()
+    test_window_expiry_and_media()
+    test_manager_persists_signatures()
+
+    print("\n🎉 تم الانتهاء من اختبار فهرس التكرار!")
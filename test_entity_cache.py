@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+اختبار ذاكرة كيانات المحادثات لكل عميل
+Test entity/InputPeer caching, TTL refresh, prewarming and persistence across restarts
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from userbot_service import entity_cache
+from userbot_service.entity_cache import EntityCache
+
+
+class FakeClient:
+    """Telethon-like client that counts get_entity round-trips"""
+
+    def __init__(self):
+        self.lookups = []
+
+    async def get_entity(self, chat):
+        self.lookups.append(chat)
+        if chat == '@missing':
+            raise ValueError('No user has "missing" as username')
+        channel_id = getattr(chat, 'channel_id', None) or abs(chat) % 10 ** 10
+        return SimpleNamespace(id=channel_id, title=f'قناة {channel_id}', broadcast=True, access_hash=42)
+
+    async def get_input_entity(self, entity):
+        return SimpleNamespace(channel_id=entity.id, access_hash=entity.access_hash)
+
+
+def test_resolve_once_per_client():
+    """الحل مرة واحدة لكل عميل ومحادثة"""
+    print("🔍 اختبار الحل مرة واحدة")
+
+    async def run():
+        cache = EntityCache()
+        client = FakeClient()
+        first = await cache.resolve(1, client, '-1002222222222')
+        second = await cache.resolve(1, client, -1002222222222)
+        await cache.resolve(2, client, -1002222222222)  # another client resolves on its own
+        return cache, client, first, second
+
+    cache, client, first, second = asyncio.run(run())
+    assert first is second
+    assert first.chat_type == 'channel' and first.title == 'قناة 2222222222'
+    assert first.input_peer.channel_id == 2222222222
+    assert client.lookups == [-1002222222222, -1002222222222]  # ints, never digit strings
+    assert cache.get_stats() == {'entities': 2, 'hits': 1, 'misses': 2}
+    print("✅ الحل مرة واحدة يعمل")
+
+
+def test_stale_entry_refreshed_in_background():
+    """الإدخال المنتهي يعاد فوراً ويحدث في الخلفية"""
+    print("🔍 اختبار التحديث في الخلفية")
+
+    async def run():
+        cache = EntityCache(ttl=0)
+        client = FakeClient()
+        first = await cache.resolve(1, client, -1002222222222)
+        stale = await cache.resolve(1, client, -1002222222222)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return first, stale, cache.get(1, -1002222222222), client.lookups
+
+    first, stale, refreshed, lookups = asyncio.run(run())
+    assert stale is first  # the send did not wait
+    assert refreshed is not first
+    assert len(lookups) == 2 and lookups[1].channel_id == 2222222222  # refreshed by InputPeer
+    print("✅ التحديث في الخلفية يعمل")
+
+
+def test_prewarm_and_restart():
+    """التسخين المسبق والاستعادة بعد إعادة التشغيل"""
+    print("🔍 اختبار التسخين والحفظ")
+
+    original_builder = entity_cache.build_input_peer
+    entity_cache.build_input_peer = lambda peer_type, peer_id, access_hash: SimpleNamespace(
+        channel_id=peer_id, access_hash=access_hash)
+    try:
+        db = Database(os.path.join(tempfile.mkdtemp(), 'entity_cache_test.db'))
+
+        async def run():
+            client = FakeClient()
+            cache = EntityCache(db)
+            await cache.prewarm(1, client, ['-1001111111111', '-1002222222222', '-1001111111111', '@missing'])
+
+            restarted = EntityCache(db)
+            restarted_client = FakeClient()
+            entry = await restarted.resolve(1, restarted_client, '-1001111111111')
+            restarted.invalidate(1, '-1002222222222')
+            return client.lookups, entry, restarted_client.lookups
+
+        lookups, entry, restarted_lookups = asyncio.run(run())
+        assert lookups == [-1001111111111, -1002222222222, '@missing']
+        assert entry.title == 'قناة 1111111111' and entry.input_peer.access_hash == 42
+        assert restarted_lookups == []  # no round-trip after the restart
+        assert [row['chat_key'] for row in db.get_cached_entities(1)] == ['-1001111111111']
+        assert db.get_cached_entities(2) == []
+    finally:
+        entity_cache.build_input_peer = original_builder
+    print("✅ التسخين والحفظ يعملان")
+
+
+if __name__ == "__main__":
+    print("🗂️ اختبار ذاكرة كيانات المحادثات")
+    print("=" * 50)
+
+    test_resolve_once_per_client()
+    test_stale_entry_refreshed_in_background()
+    test_prewarm_and_restart()
+
+    print("\n🎉 تم الانتهاء من اختبار ذاكرة الكيانات!")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+اختبار تجميع رسائل وضع التوجيه
+Test coalescing forward-mode messages into one forward_messages call per target
+"""
+
+import asyncio
+import os
+import sys
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from userbot_service.forward_batcher import ForwardBatcher, can_batch, media_copy_flags
+
+
+def _recorder(calls, name):
+    async def send(ids):
+        calls.append((name, list(ids)))
+    return send
+
+
+def test_messages_coalesced_per_key():
+    """الرسائل خلال النافذة ترسل باستدعاء واحد لكل هدف"""
+    print("🔍 اختبار تجميع الرسائل")
+
+    async def run():
+        batcher = ForwardBatcher(window=0.05)
+        calls = []
+        for message_id in (1, 2, 3):
+            batcher.add(('u', 'a'), message_id, _recorder(calls, 'a'))
+            batcher.add(('u', 'b'), message_id, _recorder(calls, 'b'))
+        assert calls == []
+        await asyncio.sleep(0.1)
+        batcher.add(('u', 'a'), 4, _recorder(calls, 'a'))  # after the window: a new batch
+        await batcher.flush()
+        return calls, batcher.get_stats()
+
+    calls, stats = asyncio.run(run())
+    assert sorted(calls[:2]) == [('a', [1, 2, 3]), ('b', [1, 2, 3])]
+    assert calls[2] == ('a', [4])
+    assert stats == {'pending_batches': 0, 'batches_sent': 3, 'messages_batched': 7, 'api_calls_saved': 4}
+    print("✅ التجميع يعمل")
+
+
+def test_max_size_and_order():
+    """الدفعة الممتلئة ترسل فوراً والدفعات ترسل بالترتيب"""
+    print("🔍 اختبار الحد الأقصى والترتيب")
+
+    async def run():
+        batcher = ForwardBatcher(window=10, max_size=2)
+        calls = []
+
+        async def slow_send(ids):
+            await asyncio.sleep(0.05 if ids[0] == 1 else 0)
+            calls.append(list(ids))
+
+        for message_id in (1, 2, 3, 4, 5):
+            batcher.add('key', message_id, slow_send)
+        await asyncio.sleep(0.1)
+        sent_before_flush = list(calls)
+        await batcher.flush(lambda key: key == 'key')
+        return sent_before_flush, calls
+
+    before, calls = asyncio.run(run())
+    assert before == [[1, 2], [3, 4]]  # the second batch waited for the slower first one
+    assert calls == [[1, 2], [3, 4], [5]]
+    print("✅ الحد الأقصى والترتيب يعملان")
+
+
+def test_flush_only_matching_keys():
+    """flush يرسل دفعات الهدف المطلوب فقط"""
+    print("🔍 اختبار flush لهدف محدد")
+
+    async def run():
+        batcher = ForwardBatcher(window=10)
+        calls = []
+        batcher.add((1, 'a'), 1, _recorder(calls, 'a'))
+        batcher.add((1, 'b'), 1, _recorder(calls, 'b'))
+        await batcher.flush(lambda key: key[1] == 'a')
+        pending = batcher.get_stats()['pending_batches']
+        await batcher.flush()
+        return calls, pending
+
+    calls, pending = asyncio.run(run())
+    assert pending == 1
+    assert calls == [('a', [1]), ('b', [1])]
+    print("✅ flush لهدف محدد يعمل")
+
+
+class FakeMessage:
+    def __init__(self, media=None, grouped_id=None):
+        self.media = media
+        self.grouped_id = grouped_id
+
+
+def test_media_copied_by_forward_mode_not_batched():
+    """الوسائط التي تحتاج نسخاً (حذف التعليق أو تقسيم الألبوم) لا تجمع أبداً"""
+    print("🔍 اختبار استثناء الوسائط المنسوخة من التجميع")
+
+    photo, text = FakeMessage(media='photo'), FakeMessage()
+    remove_caption = {'remove_caption': True}
+    split_album = {'split_album_enabled': True}
+
+    assert can_batch(photo, 'forward', False, {}, {})
+    assert not can_batch(photo, 'forward', False, remove_caption, {})
+    assert not can_batch(photo, 'forward', False, {}, split_album)
+    assert media_copy_flags(photo, remove_caption, split_album) == (True, True)
+    # the settings only change how media is sent
+    assert can_batch(text, 'forward', False, remove_caption, split_album)
+    assert media_copy_flags(text, remove_caption, split_album) == (False, False)
+
+    assert not can_batch(text, 'copy', False, {}, {})
+    assert not can_batch(text, 'forward', True, {}, {})
+    assert not can_batch(text, 'forward', False, {}, {}, sending_interval=5)
+    assert not can_batch(FakeMessage(media='photo', grouped_id=7), 'forward', False, {}, {})
+    print("✅ الوسائط المنسوخة ترسل بدون تجميع")
+
+
+if __name__ == "__main__":
+    print("📦 اختبار تجميع رسائل التوجيه")
+    print("=" * 50)
+
+    test_messages_coalesced_per_key()
+    test_max_size_and_order()
+    test_flush_only_matching_keys()
+    test_media_copied_by_forward_mode_not_batched()
+
+    print("\n🎉 تم الانتهاء من اختبار تجميع التوجيه!")
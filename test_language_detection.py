@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+اختبار كشف لغة الرسالة
+Test script-based language detection for the language filter languages
+"""
+
+import os
+import sys
+import tempfile
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from userbot_service.language_detection import LanguageDetector, NGramLanguageModel
+
+
+SAMPLES = {
+    'ar': "مرحبا بكم في قناتنا الإخبارية، نتمنى لكم يوما سعيدا",
+    'fa': "سلام، امروز هوا خیلی خوب است و ما به پارک می‌رویم",
+    'ur': "یہ ایک اچھا دن ہے اور ہم باہر جا رہے ہیں",
+    'en': "The weather is nice today and we are going to the park",
+    'es': "¿Dónde está la estación? El niño quiere ir con su mamá",
+    'fr': "Le garçon est allé à l'école avec sa sœur et il était très content",
+    'de': "Der Hund ist nicht groß, aber er läuft sehr schnell auf der Straße",
+    'it': "Il ragazzo è andato al mercato con la sua famiglia e non è tornato",
+    'pt': "O menino não quer comer pão com a irmã da mãe",
+    'tr': "Bugün hava çok güzel ve biz parka gidiyoruz, ama yağmur var",
+    'ru': "Сегодня хорошая погода и мы идём в парк",
+    'zh': "今天天气很好，我们去公园散步",
+    'ja': "今日はとても良い天気なので公園に行きます",
+    'ko': "오늘 날씨가 정말 좋아서 공원에 갑니다",
+    'hi': "आज मौसम बहुत अच्छा है और हम पार्क जा रहे हैं",
+}
+
+
+def test_detects_filter_languages():
+    """كل لغات فلتر اللغة تُكتشف بشكل صحيح"""
+    print("🔍 اختبار كشف اللغات المدعومة")
+
+    detector = LanguageDetector()
+    for language, text in SAMPLES.items():
+        detected = detector.detect(text)
+        assert detected == language, f"{language}: {detected}"
+
+    assert detector.detect("") == 'unknown'
+    assert detector.detect("12345 !!! 🎉") == 'unknown'
+    assert detector.detect("hello") == 'en'
+    print("✅ تم كشف جميع اللغات")
+
+
+def test_arabic_with_loanwords():
+    """كلمة دخيلة بحروف فارسية أو أردية لا تغير لغة النص العربي"""
+    print("🔍 اختبار النص العربي مع كلمات دخيلة")
+
+    detector = LanguageDetector()
+    assert detector.detect("بحثت عن الموضوع في گوگل ووجدت نتائج كثيرة") == 'ar'
+    assert detector.detect("طلبنا پیتزا على العشاء مع الأصدقاء") == 'ar'
+    assert detector.detect("شاهدت مباراة كرة القدم في ملعب لاہور أمس") == 'ar'
+    assert detector.detect("ابحث في گوگل") == 'ar'
+    # Persian and Urdu text is still detected
+    assert detector.detect("من امروز در گوگل جستجو کردم") == 'fa'
+    assert detector.detect("میں نے آج گوگل پر تلاش کی ہے") == 'ur'
+    print("✅ النص العربي بقي عربياً")
+
+
+def test_cache_per_text():
+    """النص نفسه يُكتشف مرة واحدة"""
+    print("🔍 اختبار الذاكرة المؤقتة")
+
+    detector = LanguageDetector(cache_size=2)
+    for _ in range(3):
+        assert detector.detect(SAMPLES['ru']) == 'ru'
+    detector.detect(SAMPLES['ar'])
+    detector.detect(SAMPLES['en'])  # evicts the Russian text
+
+    assert detector.get_stats() == {'cached_texts': 2, 'hits': 2, 'misses': 3}
+    print("✅ الذاكرة المؤقتة تعمل")
+
+
+def test_optional_ngram_model():
+    """نموذج n-gram الاختياري للغات اللاتينية"""
+    print("🔍 اختبار نموذج n-gram")
+
+    model = NGramLanguageModel()
+    model.train('en', ["the quick brown fox jumps over the lazy dog", "this is where we live"])
+    model.train('it', ["questo gatto mangia sempre molto", "andiamo insieme questa sera"])
+    path = os.path.join(tempfile.mkdtemp(), 'ngram.json')
+    model.save(path)
+
+    detector = LanguageDetector(NGramLanguageModel.load(path))
+    assert detector.detect("questa sera mangiamo insieme") == 'it'
+    assert detector.detect("the dog lives over there") == 'en'
+    # non-Latin scripts never reach the model
+    assert detector.detect(SAMPLES['ar']) == 'ar'
+    print("✅ نموذج n-gram يعمل")
+
+
+if __name__ == "__main__":
+    print("🌍 اختبار كشف اللغة")
+    print("=" * 50)
+
+    test_detects_filter_languages()
+    test_arabic_with_loanwords()
+    test_cache_per_text()
+    test_optional_ngram_model()
+
+    print("\n🎉 تم الانتهاء من اختبار كشف اللغة!")
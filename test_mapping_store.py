@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+اختبار مخزن تطابق الرسائل لمزامنة التعديل والحذف
+Test the integer-keyed mapping store: batched inserts, bulk lookup, retention and compact format
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from database.mapping_store import MessageMappingStore, pack_targets, unpack_targets
+
+SOURCE = '-1001111111111'
+TARGET_A = '-1002222222222'
+TARGET_B = -1003333333333
+
+
+def _store(**kwargs):
+    db = Database(os.path.join(tempfile.mkdtemp(), 'mapping_test.db'))
+    task_id = db.create_task(1, SOURCE, 'مصدر', TARGET_A, 'هدف')
+    kwargs.setdefault('flush_interval', 3600)
+    return db, task_id, MessageMappingStore(db, **kwargs)
+
+
+def _check_store(compact):
+    db, task_id, store = _store(compact=compact, batch_size=3)
+    store.add(task_id, SOURCE, 10, TARGET_A, 100)
+    store.add(task_id, SOURCE, 10, TARGET_B, 200)
+    assert store.get_stats()['rows'] == 0  # still buffered
+    store.add_many([(task_id, SOURCE, 11, TARGET_A, 101), (task_id, SOURCE, 12, '@username', 1)])
+    stats = store.get_stats()
+    assert stats['buffered'] == 0 and stats['flushes'] == 1 and stats['written'] == 3
+
+    assert sorted(store.get_targets(task_id, int(SOURCE), 10)) == [(TARGET_B, 200), (int(TARGET_A), 100)]
+    found = store.get_targets_bulk(task_id, SOURCE, [10, 11, 99])
+    assert sorted(found) == [10, 11] and found[11] == [(int(TARGET_A), 101)]
+    assert store.get_targets_bulk(task_id + 1, SOURCE, [10]) == {}
+
+    assert store.delete_sources(task_id, SOURCE, [10, 99]) >= 1
+    assert store.get_targets_bulk(task_id, SOURCE, [10, 11]) == {11: [(int(TARGET_A), 101)]}
+    return db, task_id, store
+
+
+def test_row_format():
+    """الصيغة العادية: صف لكل هدف"""
+    print("🔍 اختبار الصيغة العادية")
+    _check_store(compact=False)
+    print("✅ الصيغة العادية تعمل")
+
+
+def test_compact_format():
+    """الصيغة المضغوطة: صف لكل رسالة مصدر"""
+    print("🔍 اختبار الصيغة المضغوطة")
+    assert unpack_targets(pack_targets([(int(TARGET_A), 5), (TARGET_B, 6)])) == [(int(TARGET_A), 5), (TARGET_B, 6)]
+    assert len(pack_targets([(int(TARGET_A), 5)])) == 12
+
+    db, task_id, store = _check_store(compact=True)
+    # a later target of the same source message is merged into its blob
+    store.add(task_id, SOURCE, 11, TARGET_B, 201)
+    store.flush()
+    assert sorted(store.get_targets(task_id, SOURCE, 11)) == [(TARGET_B, 201), (int(TARGET_A), 101)]
+    assert store.get_stats()['rows'] == 1
+    print("✅ الصيغة المضغوطة تعمل")
+
+
+def test_retention_and_legacy_import():
+    """حذف التطابقات القديمة ونقل الجدول القديم"""
+    print("🔍 اختبار فترة الاحتفاظ والنقل")
+
+    db = Database(os.path.join(tempfile.mkdtemp(), 'mapping_legacy_test.db'))
+    task_id = db.create_task(1, SOURCE, 'مصدر', TARGET_A, 'هدف')
+    db.save_message_mapping(task_id, SOURCE, 7, TARGET_A, 70)
+    db.save_message_mapping(task_id, SOURCE, 8, '@username', 80)
+
+    store = MessageMappingStore(db, retention_days=1)
+    assert store.get_targets(task_id, SOURCE, 7) == [(int(TARGET_A), 70)]
+    assert store.get_stats()['rows'] == 1  # non-numeric legacy targets are skipped
+
+    assert store.prune(now=time.time()) == 0
+    assert store.prune(now=time.time() + 2 * 86400) == 1
+    assert store.get_targets(task_id, SOURCE, 7) == []
+    assert MessageMappingStore(db, retention_days=0).prune(now=time.time() + 10 ** 9) == 0
+    print("✅ فترة الاحتفاظ والنقل يعملان")
+
+
+if __name__ == "__main__":
+    print("🔗 اختبار مخزن تطابق الرسائل")
+    print("=" * 50)
+
+    test_row_format()
+    test_compact_format()
+    test_retention_and_legacy_import()
+
+    print("\n🎉 تم الانتهاء من اختبار مخزن التطابق!")
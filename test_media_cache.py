@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+اختبار الذاكرة المؤقتة المشتركة للوسائط
+Test the byte-budgeted, content-addressed media cache with disk spill
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from media_cache import MediaCache
+
+
+def test_key_is_stable_and_ignores_task():
+    """المفتاح يعتمد على المحتوى والإعدادات فقط"""
+    print("🔍 اختبار ثبات المفتاح")
+
+    data = b'video' * 100
+    settings = {'enabled': True, 'position': 'bottom_right', 'opacity': 70}
+    key = MediaCache.make_key('watermark', data, 'a.mp4', settings)
+
+    assert key == MediaCache.make_key('watermark', data, 'b.mp4', dict(reversed(list(settings.items()))))
+    assert key != MediaCache.make_key('watermark', data, 'a.mp4', dict(settings, opacity=50))
+    assert key != MediaCache.make_key('watermark', data + b'x', 'a.mp4', settings)
+    assert key != MediaCache.make_key('audio', data, 'a.mp4', settings)
+    print("✅ المفتاح ثابت")
+
+
+def test_byte_budget_lru():
+    """الطرد حسب البايتات وترتيب LRU"""
+    print("🔍 اختبار حد البايتات")
+
+    cache = MediaCache(max_bytes=300, disk_dir=None)
+    cache.put('a', b'1' * 100)
+    cache.put('b', b'2' * 100)
+    cache.put('c', b'3' * 100)
+    assert cache.get('a') is not None  # a becomes most recent
+    cache.put('d', b'4' * 100)
+
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache and 'd' in cache
+    stats = cache.get_stats()
+    assert stats['memory_bytes'] == 300
+    assert stats['evictions'] == 1 and stats['hits'] == 1
+
+    # larger than half of the budget: not kept in RAM without a disk tier
+    cache.put('huge', b'x' * 200)
+    assert cache.get('huge') is None
+    assert cache.get_stats()['misses'] == 1
+    print("✅ حد البايتات يعمل")
+
+
+def test_disk_spill_and_restart():
+    """العناصر المطرودة تنتقل للقرص وتبقى بعد إعادة التشغيل"""
+    print("🔍 اختبار طبقة القرص")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = MediaCache(max_bytes=200, disk_dir=tmp, disk_max_bytes=1000)
+        cache.put('a', b'1' * 100)
+        cache.put('b', b'2' * 100)
+        cache.put('c', b'3' * 100)
+        cache.put('big', b'9' * 500)  # goes straight to disk
+
+        stats = cache.get_stats()
+        assert stats['spills'] == 1 and stats['evictions'] == 0
+        assert stats['disk_bytes'] == 600
+
+        assert cache.get('a') == b'1' * 100
+        assert cache.get('big') == b'9' * 500
+        assert cache.get_stats()['disk_hits'] == 2
+
+        restarted = MediaCache(max_bytes=200, disk_dir=tmp, disk_max_bytes=1000)
+        assert restarted.get('big') == b'9' * 500
+
+        small_disk = MediaCache(max_bytes=200, disk_dir=tmp, disk_max_bytes=550)
+        assert small_disk.get_stats()['disk_bytes'] <= 550
+    print("✅ طبقة القرص تعمل")
+
+
+def test_clear_namespace():
+    """مسح نوع واحد من العناصر"""
+    print("🔍 اختبار المسح حسب النوع")
+
+    cache = MediaCache(max_bytes=1000, disk_dir=None)
+    cache.put(MediaCache.make_key('watermark', b'a', 'a.jpg', {}), b'A')
+    cache.put(MediaCache.make_key('audio', b'a', 'a.mp3', {}), b'B')
+    cache.clear('watermark')
+    assert cache.get_stats('watermark')['entries'] == 0
+    assert cache.get_stats('audio')['entries'] == 1
+    print("✅ المسح حسب النوع يعمل")
+
+
+def test_async_access_off_event_loop():
+    """get_async / put_async تعمل في Thread منفصل وتقرأ من القرص"""
+    print("🔍 اختبار الوصول غير المتزامن")
+
+    class RecordingCache(MediaCache):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.threads = set()
+
+        def get(self, key):
+            self.threads.add(threading.current_thread().name)
+            return super().get(key)
+
+        def put(self, key, data):
+            self.threads.add(threading.current_thread().name)
+            super().put(key, data)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = RecordingCache(max_bytes=200, disk_dir=tmp, disk_max_bytes=1000)
+
+        async def run():
+            await cache.put_async('big', b'9' * 500)  # disk only
+            return threading.current_thread().name, await cache.get_async('big'), await cache.get_async('missing')
+
+        loop_thread, big, missing = asyncio.run(run())
+        assert big == b'9' * 500 and missing is None
+        assert cache.get_stats()['disk_hits'] == 1
+        assert cache.threads and loop_thread not in cache.threads
+
+        assert MediaCache(max_bytes=200, disk_dir=tmp, disk_max_bytes=1000).get('big') == b'9' * 500
+    print("✅ الوصول لا يحجب حلقة الأحداث")
+
+
+if __name__ == "__main__":
+    print("💾 اختبار الذاكرة المؤقتة للوسائط")
+    print("=" * 50)
+
+    test_key_is_stable_and_ignores_task()
+    test_byte_budget_lru()
+    test_disk_spill_and_restart()
+    test_clear_namespace()
+    test_async_access_off_event_loop()
+
+    print("\n🎉 تم الانتهاء من اختبار الذاكرة المؤقتة!")
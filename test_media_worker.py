@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+اختبار خدمة عمال معالجة الوسائط
+Test the process-pool media worker service (job IDs, timeouts, cancellation, caps)
+"""
+
+import asyncio
+import operator
+import os
+import sys
+import time
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from media_worker import MediaJobError, MediaWorkerService
+
+
+def test_job_runs_in_worker_process():
+    """المهمة تنفذ في عملية منفصلة وتعيد النتيجة"""
+    print("🔍 اختبار تنفيذ المهمة في عملية منفصلة")
+
+    async def run():
+        service = MediaWorkerService(max_workers=1)
+        try:
+            pid = await service.run('image', os.getpid)
+            total = await service.run('audio', operator.add, 2, 3)
+            return pid, total, service.get_stats()
+        finally:
+            service.shutdown()
+
+    pid, total, stats = asyncio.run(run())
+    assert pid != os.getpid()
+    assert total == 5
+    assert stats['completed'] == 2 and stats['mode'] == 'process'
+    print("✅ المهمة نفذت خارج حلقة الأحداث")
+
+
+def test_timeout_restarts_pool():
+    """المهمة العالقة تنتهي مهلتها ويعاد تشغيل المجمع"""
+    print("🔍 اختبار انتهاء المهلة")
+
+    async def run():
+        service = MediaWorkerService(max_workers=1)
+        try:
+            try:
+                await service.run('video', time.sleep, 30, timeout=0.5)
+                raise AssertionError("timeout expected")
+            except MediaJobError:
+                pass
+            # the pool keeps working after the restart
+            result = await service.run('image', operator.mul, 6, 7)
+            return result, service.get_stats()
+        finally:
+            service.shutdown()
+
+    result, stats = asyncio.run(run())
+    assert result == 42
+    assert stats['timed_out'] == 1 and stats['pool_restarts'] == 1
+    print("✅ انتهت المهلة وتمت إعادة تشغيل المجمع")
+
+
+def test_other_jobs_survive_restart():
+    """المهام الأخرى على المجمع تعاد مرة واحدة بعد إعادة تشغيله"""
+    print("🔍 اختبار بقاء المهام الأخرى بعد إعادة التشغيل")
+
+    async def run():
+        service = MediaWorkerService(max_workers=2)
+        try:
+            # start the workers before the jobs race each other
+            await service.run('image', operator.add, 1, 1)
+            stuck = service.submit('video', time.sleep, 30, timeout=0.5)
+            other = service.submit('image', time.sleep, 1)
+            results = await asyncio.gather(service.wait(stuck), service.wait(other), return_exceptions=True)
+            return results, service.get_stats()
+        finally:
+            service.shutdown()
+
+    (stuck_result, other_result), stats = asyncio.run(run())
+    assert isinstance(stuck_result, MediaJobError)
+    assert other_result is None  # time.sleep returned after the retry
+    assert stats['timed_out'] == 1 and stats['failed'] == 0 and stats['pool_restarts'] == 1
+    print("✅ المهمة الأخرى أكملت بعد إعادة المحاولة")
+
+
+def test_cancel_queued_job():
+    """إلغاء مهمة في الانتظار بمعرفها"""
+    print("🔍 اختبار إلغاء مهمة بالمعرف")
+
+    async def run():
+        service = MediaWorkerService(max_workers=0, concurrency={'video': 1})
+        try:
+            first = service.submit('video', time.sleep, 0.2)
+            second = service.submit('video', time.sleep, 0.2)
+            await asyncio.sleep(0.05)
+            assert service.jobs[second].status == 'queued'
+            assert service.cancel(second)
+            await service.wait(first)
+            try:
+                await service.wait(second)
+                raise AssertionError("cancellation expected")
+            except MediaJobError:
+                pass
+            return service.get_stats()
+        finally:
+            service.shutdown()
+
+    stats = asyncio.run(run())
+    assert stats['cancelled'] == 1 and stats['completed'] == 1
+    print("✅ تم إلغاء المهمة")
+
+
+def test_concurrency_cap_per_media_type():
+    """حد التوازي لكل نوع وسائط"""
+    print("🔍 اختبار حد التوازي لكل نوع")
+
+    async def run():
+        service = MediaWorkerService(max_workers=0, concurrency={'video': 1, 'image': 2})
+        try:
+            start = time.monotonic()
+            await asyncio.gather(*(service.run('video', time.sleep, 0.1) for _ in range(3)))
+            video_elapsed = time.monotonic() - start
+
+            start = time.monotonic()
+            await asyncio.gather(*(service.run('image', time.sleep, 0.1) for _ in range(2)))
+            image_elapsed = time.monotonic() - start
+            return video_elapsed, image_elapsed
+        finally:
+            service.shutdown()
+
+    video_elapsed, image_elapsed = asyncio.run(run())
+    assert video_elapsed >= 0.3
+    assert image_elapsed < 0.2
+    print(f"✅ فيديو متسلسل ({video_elapsed:.2f}s)، صور متوازية ({image_elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    print("🏭 اختبار خدمة عمال الوسائط")
+    print("=" * 50)
+
+    test_job_runs_in_worker_process()
+    test_timeout_restarts_pool()
+    test_other_jobs_survive_restart()
+    test_cancel_queued_job()
+    test_concurrency_cap_per_media_type()
+
+    print("\n🎉 تم الانتهاء من اختبار عمال الوسائط!")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+اختبار موزع الرسائل حسب المحادثة المصدر
+Test the per-source queue dispatcher used by the userbot message handler
+"""
+
+import asyncio
+import os
+import sys
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from userbot_service.message_dispatcher import SourceQueueDispatcher
+
+
+def test_order_kept_within_source():
+    """الرسائل من نفس المصدر تعالج بالترتيب"""
+    print("🔍 اختبار الحفاظ على الترتيب داخل المصدر")
+
+    async def run():
+        dispatcher = SourceQueueDispatcher(max_workers=4, queue_size=10)
+        done = []
+
+        def job(n):
+            async def process():
+                # later messages finish faster: order must still hold
+                await asyncio.sleep(0.01 * (5 - n))
+                done.append(n)
+            return process
+
+        for n in range(5):
+            await dispatcher.submit((1, -100), job(n))
+        while dispatcher.get_stats()['processed'] < 5:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return done
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4]
+    print("✅ تم الحفاظ على الترتيب")
+
+
+def test_sources_run_concurrently():
+    """رسالة بطيئة في مصدر لا توقف المصادر الأخرى"""
+    print("🔍 اختبار المعالجة المتوازية للمصادر")
+
+    async def run():
+        dispatcher = SourceQueueDispatcher(max_workers=4, queue_size=10)
+        release = asyncio.Event()
+        fast_done = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+
+        async def fast():
+            fast_done.set()
+
+        await dispatcher.submit((1, -100), slow)
+        await dispatcher.submit((1, -200), fast)
+        await asyncio.wait_for(fast_done.wait(), timeout=1)
+        release.set()
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    print("✅ المصادر المختلفة تعالج بالتوازي")
+
+
+def test_backpressure_and_metrics():
+    """امتلاء الطابور يجعل الإرسال ينتظر مع تسجيل المقاييس"""
+    print("🔍 اختبار الضغط العكسي ومقاييس الطوابير")
+
+    async def run():
+        dispatcher = SourceQueueDispatcher(max_workers=1, queue_size=2)
+        release = asyncio.Event()
+
+        async def blocked():
+            await release.wait()
+
+        # first job is taken by the worker, two more fill the queue
+        await dispatcher.submit('src', blocked)
+        await asyncio.sleep(0.01)
+        await dispatcher.submit('src', blocked)
+        await dispatcher.submit('src', blocked)
+
+        waiting = asyncio.create_task(dispatcher.submit('src', blocked))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        stats = dispatcher.get_stats()
+        assert stats['pending'] == 2
+        assert stats['backpressure_waits'] == 1
+
+        release.set()
+        await asyncio.wait_for(waiting, timeout=1)
+        while dispatcher.get_stats()['processed'] < 4:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return dispatcher.get_stats()
+
+    stats = asyncio.run(run())
+    assert stats['submitted'] == 4 and stats['failed'] == 0
+    print("✅ الضغط العكسي والمقاييس تعمل")
+
+
+def test_failed_job_does_not_stop_worker():
+    """خطأ في رسالة لا يوقف معالجة الرسائل التالية"""
+    print("🔍 اختبار استمرار العامل بعد الخطأ")
+
+    async def run():
+        dispatcher = SourceQueueDispatcher()
+        done = []
+
+        async def broken():
+            raise ValueError("boom")
+
+        async def ok():
+            done.append(True)
+
+        await dispatcher.submit('src', broken)
+        await dispatcher.submit('src', ok)
+        while dispatcher.get_stats()['processed'] < 1:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return done, dispatcher.get_stats()
+
+    done, stats = asyncio.run(run())
+    assert done == [True] and stats['failed'] == 1
+    print("✅ العامل يستمر بعد الخطأ")
+
+
+if __name__ == "__main__":
+    print("📬 اختبار موزع الرسائل حسب المصدر")
+    print("=" * 50)
+
+    test_order_kept_within_source()
+    test_sources_run_concurrently()
+    test_backpressure_and_metrics()
+    test_failed_job_does_not_stop_worker()
+
+    print("\n🎉 تم الانتهاء من اختبار موزع الرسائل!")
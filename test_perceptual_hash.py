@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+اختبار البصمة الإدراكية للوسائط
+Test perceptual hashes, the Hamming index and their use by the duplicate filter
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from perceptual_hash import (
+    HammingIndex, dhash_from_pixels, hamming_distance, phash_from_pixels, to_signed, to_unsigned
+)
+from userbot_service.duplicate_index import DuplicateIndexManager
+
+
+def _gradient(width, height, brightness=0):
+    rng = random.Random(7)
+    return [min(255, (x * 13 + y * 7 + rng.randrange(40)) % 200 + brightness)
+            for y in range(height) for x in range(width)]
+
+
+def test_hashes_survive_brightness_change():
+    """تغيير السطوع لا يغير البصمة"""
+    print("🔍 اختبار ثبات البصمة")
+
+    assert dhash_from_pixels(_gradient(9, 8)) == dhash_from_pixels(_gradient(9, 8, brightness=30))
+    original = phash_from_pixels(_gradient(32, 32))
+    assert hamming_distance(original, phash_from_pixels(_gradient(32, 32, brightness=30))) <= 4
+    other = phash_from_pixels(list(reversed(_gradient(32, 32))))
+    assert hamming_distance(original, other) > 10
+
+    value = (1 << 64) - 5
+    assert to_signed(value) < 0 and to_unsigned(to_signed(value)) == value
+    print("✅ البصمة ثابتة")
+
+
+def test_hamming_index_matches_brute_force():
+    """فهرس Hamming يطابق البحث الخطي"""
+    print("🔍 اختبار فهرس Hamming")
+
+    rng = random.Random(1)
+    hashes = {i: rng.getrandbits(64) for i in range(2000)}
+    index = HammingIndex(max_distance=6)
+    for item_id, value in hashes.items():
+        index.add(item_id, value)
+
+    for _ in range(50):
+        query = hashes[rng.randrange(2000)] ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        expected = sorted((i, hamming_distance(query, v)) for i, v in hashes.items() if hamming_distance(query, v) <= 6)
+        assert sorted(index.search(query)) == expected
+
+    index.remove(0)
+    assert all(item_id != 0 for item_id, _ in index.search(hashes[0]))
+    assert len(index) == 1999
+    print("✅ فهرس Hamming يعمل")
+
+
+def test_duplicate_filter_uses_phash():
+    """نفس الصورة بمعرف Telegram مختلف تكتشف كمكررة"""
+    print("🔍 اختبار فلتر التكرار بالبصمة")
+
+    db = Database(os.path.join(tempfile.mkdtemp(), 'perceptual_hash_test.db'))
+    task_id = db.create_task(1, '-1001111111111', 'مصدر', '-1002222222222', 'هدف')
+    now = int(time.time())
+    phash = (1 << 63) | 0x0F0F0F0F  # high bit set: stored as a negative INTEGER
+
+    manager = DuplicateIndexManager(db)
+    assert manager.check_and_store(task_id, '', 'photo-1', 'photo', 0.8, 24, False, True,
+                                   now=now, media_phash=phash) is None
+
+    # restart, then the same image re-uploaded (different id, 2 bits changed)
+    restarted = DuplicateIndexManager(db)
+    match = restarted.check_and_store(task_id, '', 'photo-2', 'photo', 0.8, 24, False, True,
+                                      now=now + 5, media_phash=phash ^ 0b101)
+    assert match is not None and match['reason'] == 'phash' and match['distance'] == 2
+    print("✅ البصمة الإدراكية تكتشف الصور المعاد رفعها")
+
+
+if __name__ == "__main__":
+    print("🖼️ اختبار البصمة الإدراكية")
+    print("=" * 50)
+
+    test_hashes_survive_brightness_change()
+    test_hamming_index_matches_brute_force()
+    test_duplicate_filter_uses_phash()
+
+    print("\n🎉 تم الانتهاء من اختبار البصمة الإدراكية!")
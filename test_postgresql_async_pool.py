@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+اختبار القراءات غير المتزامنة ومجمع الاتصالات في PostgreSQL
+Test the asyncpg per-message reads and the sync pool wait policy (mocked pools)
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import psycopg2.pool
+
+from database import database_postgresql
+from database.database_postgresql import HOT_QUERIES, PostgreSQLDatabase, _PooledConnection
+from database.settings_cache import settings_cache
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def fetchrow(self, query, *args):
+        self.queries.append((query, args))
+        result = self.rows.get(query)
+        if isinstance(result, Exception):
+            raise result
+        return result[0] if result else None
+
+    async def fetch(self, query, *args):
+        self.queries.append((query, args))
+        return list(self.rows.get(query) or [])
+
+
+class FakeAcquire:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        self.pool.acquired += 1
+        return self.pool.conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.pool.released += 1
+        return False
+
+
+class FakePool:
+    def __init__(self, rows):
+        self.conn = FakeConnection(rows)
+        self.acquired = 0
+        self.released = 0
+
+    def acquire(self):
+        return FakeAcquire(self)
+
+
+def make_db(rows):
+    """PostgreSQLDatabase without init_database, reading from a fake asyncpg pool"""
+    db = PostgreSQLDatabase.__new__(PostgreSQLDatabase)
+    db.connection_string = 'postgresql://test'
+    db._async_pools = {}
+    db._async_pool_lock = threading.Lock()
+    pool = FakePool(rows)
+
+    async def get_async_pool():
+        return pool
+
+    db.get_async_pool = get_async_pool
+    return db, pool
+
+
+def test_async_get_task_uses_prepared_query():
+    """async_get_task يستخدم الاستعلام الثابت ويعيد الاتصال إلى المجمع"""
+    print("🔍 اختبار async_get_task")
+    db, pool = make_db({
+        HOT_QUERIES['get_task']: [{'id': 3, 'task_name': 'مهمة'}],
+        HOT_QUERIES['get_user_tasks']: [{'id': 3}, {'id': 4}],
+    })
+
+    task = asyncio.run(db.async_get_task(3))
+    tasks = asyncio.run(db.async_get_user_tasks(1))
+
+    assert task == {'id': 3, 'task_name': 'مهمة'}
+    assert [t['id'] for t in tasks] == [3, 4]
+    assert pool.conn.queries[0] == (HOT_QUERIES['get_task'], (3,))
+    assert pool.acquired == pool.released == 2
+    print("✅ القراءة تمت عبر المجمع")
+
+
+def test_audio_template_defaults_created():
+    """إعدادات قالب الصوت تُنشأ بالقيم الافتراضية عند غيابها"""
+    print("🔍 اختبار إنشاء إعدادات قالب الصوت")
+    db, pool = make_db({
+        HOT_QUERIES['create_audio_template_settings']: [{'task_id': 5, 'title_template': '$title'}],
+    })
+
+    settings = asyncio.run(db.async_get_audio_template_settings(5))
+
+    assert settings == {'task_id': 5, 'title_template': '$title'}
+    assert [query for query, _ in pool.conn.queries] == [
+        HOT_QUERIES['get_audio_template_settings'],
+        HOT_QUERIES['create_audio_template_settings'],
+    ]
+    print("✅ الإعدادات الافتراضية أُنشئت")
+
+
+def test_async_errors_return_none():
+    """أخطاء القراءة تُسجل وتعيد None كما في الدوال المتزامنة"""
+    print("🔍 اختبار أخطاء القراءة غير المتزامنة")
+    db, _ = make_db({
+        HOT_QUERIES['get_rate_limit_settings']: RuntimeError("connection lost"),
+        HOT_QUERIES['get_task']: RuntimeError("connection lost"),
+    })
+
+    assert asyncio.run(db.async_get_rate_limit_settings(1)) is None
+    assert asyncio.run(db.async_get_task(1)) is None
+    print("✅ الأخطاء لا تنتشر إلى المعالج")
+
+
+def test_settings_cache_prefers_async_variants():
+    """ذاكرة الإعدادات تستخدم الدوال غير المتزامنة عند توفرها"""
+    print("🔍 اختبار تحميل الإعدادات عبر asyncpg")
+    db, pool = make_db({
+        HOT_QUERIES['get_message_settings']: [{'task_id': 9, 'header_enabled': True}],
+        HOT_QUERIES['get_rate_limit_settings']: [{'task_id': 9, 'message_count': 3}],
+    })
+
+    def sync_read(*args):
+        raise AssertionError("sync read used although an async variant exists")
+
+    for name in ('get_message_settings', 'get_rate_limit_settings', 'get_audio_template_settings'):
+        setattr(db, name, sync_read)
+
+    settings_cache.clear()
+    snapshot = asyncio.run(settings_cache.get_async(db, 9))
+
+    assert snapshot.message_settings == {'task_id': 9, 'header_enabled': True}
+    assert snapshot.rate_limit_settings == {'task_id': 9, 'message_count': 3}
+    assert pool.acquired == pool.released
+    settings_cache.clear()
+    print("✅ الإعدادات حُملت دون استدعاءات متزامنة")
+
+
+class ExhaustedPool:
+    """psycopg2 pool stand-in that is empty until ``release_after`` seconds"""
+
+    def __init__(self, release_after=None):
+        self.closed = False
+        self.release_at = None if release_after is None else time.monotonic() + release_after
+        self.attempts = 0
+
+    def getconn(self):
+        self.attempts += 1
+        if self.release_at is not None and time.monotonic() >= self.release_at:
+            return 'connection'
+        raise psycopg2.pool.PoolError("connection pool exhausted")
+
+
+def test_exhausted_pool_fails_fast_on_event_loop():
+    """مجمع ممتلئ يرفع الخطأ فوراً داخل حلقة الأحداث بدلاً من النوم"""
+    print("🔍 اختبار المجمع الممتلئ داخل حلقة الأحداث")
+    pool = ExhaustedPool()
+
+    async def acquire():
+        started = time.monotonic()
+        try:
+            _PooledConnection._acquire(pool)
+        except psycopg2.pool.PoolError:
+            return time.monotonic() - started
+        raise AssertionError("PoolError expected")
+
+    elapsed = asyncio.run(acquire())
+    assert pool.attempts == 1
+    assert elapsed < 0.05
+    print("✅ لا انتظار على حلقة الأحداث")
+
+
+def test_worker_thread_waits_for_connection():
+    """Thread العامل ينتظر حتى يعود اتصال إلى المجمع"""
+    print("🔍 اختبار انتظار Thread العامل")
+    original_timeout = database_postgresql.PG_POOL_WAIT_TIMEOUT
+    database_postgresql.PG_POOL_WAIT_TIMEOUT = 2
+    try:
+        pool = ExhaustedPool(release_after=0.1)
+        assert _PooledConnection._acquire(pool) == 'connection'
+        assert pool.attempts > 1
+
+        database_postgresql.PG_POOL_WAIT_TIMEOUT = 0.05
+        never = ExhaustedPool()
+        try:
+            _PooledConnection._acquire(never)
+            raise AssertionError("PoolError expected after the wait timeout")
+        except psycopg2.pool.PoolError:
+            pass
+    finally:
+        database_postgresql.PG_POOL_WAIT_TIMEOUT = original_timeout
+    print("✅ العامل حصل على الاتصال بعد تحريره")
+
+
+if __name__ == "__main__":
+    print("🐘 اختبار مجمع PostgreSQL غير المتزامن")
+    print("=" * 50)
+    test_async_get_task_uses_prepared_query()
+    test_audio_template_defaults_created()
+    test_async_errors_return_none()
+    test_settings_cache_prefers_async_variants()
+    test_exhausted_pool_fails_fast_on_event_loop()
+    test_worker_thread_waits_for_connection()
+    print("=" * 50)
+    print("🎉 جميع الاختبارات نجحت")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+اختبار محدد معدل الرسائل في الذاكرة
+Test the sliding-window rate limiter and its database snapshot
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from userbot_service.rate_limiter import SlidingWindowRateLimiter
+
+
+def test_sliding_window():
+    """النافذة المنزلقة تسمح بـ N رسالة في الفترة"""
+    print("🔍 اختبار النافذة المنزلقة")
+
+    limiter = SlidingWindowRateLimiter()
+    allowed = [limiter.allow(1, 3, 60, now=100 + i) for i in range(5)]
+    assert allowed == [True, True, True, False, False]
+    assert limiter.remaining(1, 3, 60, now=104) == 0
+
+    # the first message leaves the window after 60 seconds
+    assert limiter.allow(1, 3, 60, now=160.5)
+    assert not limiter.allow(1, 3, 60, now=160.6)
+    # other tasks are independent
+    assert limiter.allow(2, 3, 60, now=160.6)
+
+    # raising message_count keeps the recorded messages
+    assert limiter.allow(1, 4, 60, now=161)
+    assert limiter.allow(1, 4, 60, now=161.5)
+    assert not limiter.allow(1, 4, 60, now=161.6)
+    print("✅ النافذة المنزلقة تعمل")
+
+
+def test_snapshot_survives_restart():
+    """اللقطة تحفظ في قاعدة البيانات وتستعاد بعد إعادة التشغيل"""
+    print("🔍 اختبار حفظ واستعادة اللقطة")
+
+    db = Database(os.path.join(tempfile.mkdtemp(), 'rate_limiter_test.db'))
+    task_id = db.create_task(1, '-1001111111111', 'مصدر', '-1002222222222', 'هدف')
+    now = time.time()
+
+    limiter = SlidingWindowRateLimiter(db, snapshot_interval=30)
+    assert limiter.allow(task_id, 2, 60, now=now)
+    assert limiter.allow(task_id, 2, 60, now=now + 1)
+    assert db.load_rate_limit_snapshot() == {}  # no per-message INSERT
+    limiter.snapshot(now + 1)
+
+    # legacy COUNT(*) check reads the same rows
+    db.save_rate_limit_settings(task_id, enabled=True, message_count=2, time_period_seconds=60)
+    assert db.check_rate_limit(task_id)
+
+    restarted = SlidingWindowRateLimiter(db, snapshot_interval=30)
+    assert not restarted.allow(task_id, 2, 60, now=now + 2)
+    assert restarted.allow(task_id, 2, 60, now=now + 61)
+    print("✅ اللقطة تستعاد بعد إعادة التشغيل")
+
+
+def test_backend_without_snapshots():
+    """قاعدة بيانات بدون دوال اللقطات تعمل بدون حفظ"""
+    print("🔍 اختبار قاعدة بيانات بدون لقطات")
+
+    class NoSnapshotDatabase:
+        pass
+
+    limiter = SlidingWindowRateLimiter(NoSnapshotDatabase(), snapshot_interval=1)
+    assert limiter.db is None
+    assert limiter.allow(1, 1, 60, now=100)
+    assert not limiter.allow(1, 1, 60, now=101)
+    limiter.snapshot(300)
+    print("✅ حد الرسائل يعمل في الذاكرة فقط")
+
+
+if __name__ == "__main__":
+    print("⏰ اختبار محدد معدل الرسائل")
+    print("=" * 50)
+
+    test_sliding_window()
+    test_snapshot_survives_restart()
+    test_backend_without_snapshots()
+
+    print("\n🎉 تم الانتهاء من اختبار محدد المعدل!")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+اختبار الجدول الأسبوعي لفلتر الأيام وساعات العمل
+Test the 7x24 schedule bitmasks and the owner's timezone
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from database.settings_cache import settings_cache
+from userbot_service.schedule_filter import TaskSchedule, get_task_schedule
+
+UTC = datetime.timezone.utc
+# Monday 2024-01-01 06:30 UTC
+MONDAY_0630_UTC = datetime.datetime(2024, 1, 1, 6, 30, tzinfo=UTC)
+
+
+def test_day_and_hour_masks():
+    """الأيام والساعات في القناع الأسبوعي"""
+    print("🔍 اختبار القناع الأسبوعي")
+
+    days = [{'day_number': 0, 'is_allowed': False}, {'day_number': 1, 'is_allowed': True}]
+    work = TaskSchedule(days, {'mode': 'work_hours', 'enabled_hours': [9, 10]}, 'UTC')
+    assert not work.day_allowed(MONDAY_0630_UTC)
+    assert work.day_allowed(MONDAY_0630_UTC + datetime.timedelta(days=1))
+    assert not work.hour_allowed(MONDAY_0630_UTC)
+    assert work.hour_allowed(MONDAY_0630_UTC + datetime.timedelta(hours=3))
+
+    sleep = TaskSchedule([], {'mode': 'sleep_hours', 'enabled_hours': [6]}, 'UTC')
+    assert sleep.day_allowed(MONDAY_0630_UTC)
+    assert not sleep.hour_allowed(MONDAY_0630_UTC)
+    assert sleep.hour_allowed(MONDAY_0630_UTC + datetime.timedelta(hours=1))
+
+    # no hours configured never blocks
+    assert TaskSchedule(None, {'mode': 'sleep_hours', 'enabled_hours': []}, 'UTC').hour_allowed(MONDAY_0630_UTC)
+    print("✅ القناع الأسبوعي يعمل")
+
+
+def test_user_timezone():
+    """المنطقة الزمنية للمستخدم تحدد اليوم والساعة"""
+    print("🔍 اختبار المنطقة الزمنية")
+
+    # Sunday 23:30 in Riyadh is still Sunday 20:30 UTC
+    sunday_late = datetime.datetime(2024, 1, 7, 20, 30, tzinfo=UTC)
+    days = [{'day_number': 0, 'is_allowed': False}]
+    assert TaskSchedule(days, None, 'UTC').day_allowed(sunday_late)
+    assert TaskSchedule(days, None, 'Asia/Tokyo').day_allowed(sunday_late) is False  # Monday 05:30
+
+    riyadh = TaskSchedule(None, {'mode': 'work_hours', 'enabled_hours': [9]}, 'Asia/Riyadh')
+    assert riyadh.hour_allowed(MONDAY_0630_UTC)  # 09:30 in Riyadh
+    invalid = TaskSchedule(None, {'mode': 'work_hours', 'enabled_hours': [9]}, 'Not/AZone')
+    assert invalid.hour_allowed(MONDAY_0630_UTC)  # falls back to UTC+3
+    print("✅ المنطقة الزمنية تعمل")
+
+
+def test_recompiled_after_schedule_write():
+    """الجدول يعاد بناؤه فقط بعد تعديل الأيام أو الساعات"""
+    print("🔍 اختبار إعادة البناء بعد التعديل")
+
+    db = Database(os.path.join(tempfile.mkdtemp(), 'schedule_test.db'))
+    task_id = db.create_task(7, '-1001111111111', 'مصدر', '-1002222222222', 'هدف')
+    db.update_user_timezone(7, 'UTC')
+    settings_cache.clear()
+
+    schedule = get_task_schedule(settings_cache.get(db, task_id))
+    assert schedule.timezone_name == 'UTC' and schedule.day_allowed(MONDAY_0630_UTC)
+    assert get_task_schedule(settings_cache.get(db, task_id)) is schedule
+
+    db.set_day_filter(task_id, 0, False)
+    updated = get_task_schedule(settings_cache.get(db, task_id))
+    assert updated is not schedule and not updated.day_allowed(MONDAY_0630_UTC)
+    print("✅ الجدول يعاد بناؤه بعد التعديل")
+
+
+if __name__ == "__main__":
+    print("📅 اختبار جدول الأيام وساعات العمل")
+    print("=" * 50)
+
+    test_day_and_hour_masks()
+    test_user_timezone()
+    test_recompiled_after_schedule_write()
+
+    print("\n🎉 تم الانتهاء من اختبار الجدول الأسبوعي!")
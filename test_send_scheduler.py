@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+اختبار جدولة الإرسال لكل محادثة هدف
+Test concurrent fan-out, per-target spacing, the per-client in-flight cap and FloodWait backoff
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from userbot_service.send_scheduler import SendScheduler, FLOOD_MIN_LEARNED_INTERVAL
+
+
+async def _fake_send(scheduler, client, target, interval, log, duration=0.05):
+    async with scheduler.slot(client, target, interval):
+        log.append(('start', target, time.monotonic()))
+        await asyncio.sleep(duration)
+
+
+def test_targets_sent_concurrently():
+    """الأهداف المستقلة ترسل بالتوازي"""
+    print("🔍 اختبار الإرسال المتوازي")
+
+    async def run():
+        scheduler = SendScheduler(max_inflight=10)
+        log = []
+        started = time.monotonic()
+        await asyncio.gather(*(_fake_send(scheduler, 1, target, 5, log) for target in range(8)))
+        return time.monotonic() - started, scheduler.get_stats()
+
+    elapsed, stats = asyncio.run(run())
+    assert elapsed < 0.2, elapsed  # not 8 x 0.05s, and no interval between different targets
+    assert stats['sends'] == 8 and stats['in_flight'] == 0 and stats['waited_seconds'] == 0
+    print(f"✅ 8 أهداف في {elapsed:.2f} ثانية")
+
+
+def test_interval_per_target():
+    """فاصل الإرسال يطبق بين رسالتين لنفس الهدف"""
+    print("🔍 اختبار فاصل الإرسال لنفس الهدف")
+
+    async def run():
+        scheduler = SendScheduler()
+        log = []
+        await asyncio.gather(
+            _fake_send(scheduler, 1, 'a', 0.2, log, 0),
+            _fake_send(scheduler, 1, 'a', 0.2, log, 0),
+            _fake_send(scheduler, 1, 'b', 0.2, log, 0),
+        )
+        return log
+
+    log = asyncio.run(run())
+    a_times = [stamp for _, target, stamp in log if target == 'a']
+    b_time = [stamp for _, target, stamp in log if target == 'b'][0]
+    assert a_times[1] - a_times[0] >= 0.19
+    assert b_time - a_times[0] < 0.1
+    print("✅ الفاصل لكل هدف يعمل")
+
+
+def test_inflight_cap_per_client():
+    """الحد الأقصى للإرسالات المتزامنة لكل عميل"""
+    print("🔍 اختبار حد الإرسالات المتزامنة")
+
+    async def run():
+        scheduler = SendScheduler(max_inflight=2)
+        peak = {'now': 0, 'max': 0}
+
+        async def send(client, target):
+            async with scheduler.slot(client, target):
+                peak['now'] += 1
+                peak['max'] = max(peak['max'], peak['now'])
+                await asyncio.sleep(0.02)
+                peak['now'] -= 1
+
+        await asyncio.gather(*(send(1, target) for target in range(6)))
+        client_one_peak = peak['max']
+        peak['max'] = 0
+        await asyncio.gather(*(send(client, target) for client in (1, 2) for target in range(3)))
+        return client_one_peak, peak['max']
+
+    one_client, two_clients = asyncio.run(run())
+    assert one_client == 2
+    assert two_clients == 4
+    print("✅ الحد لكل عميل يعمل")
+
+
+def test_flood_parks_only_destination():
+    """FloodWait يوقف الهدف المتأثر فقط"""
+    print("🔍 اختبار إيقاف الهدف عند FloodWait")
+
+    async def run():
+        scheduler = SendScheduler()
+        slot = await scheduler.acquire(1, 'a', chat_type='channel')
+        slot.report_flood(0.2)
+        slot.release()
+        state = scheduler.get_backoff_state()
+
+        log = []
+        started = time.monotonic()
+        await asyncio.gather(
+            _fake_send(scheduler, 1, 'a', 0, log, 0),
+            _fake_send(scheduler, 1, 'b', 0, log, 0),
+            _fake_send(scheduler, 2, 'a', 0, log, 0),
+        )
+        delays = {(target, stamp - started >= 0.19) for _, target, stamp in log}
+        return state, delays, scheduler.get_backoff_state()
+
+    state, delays, after = asyncio.run(run())
+    assert [entry['destination'] for entry in state['parked']] == ['a']
+    assert state['flood_waits'] == 1
+    assert ('a', True) in delays and ('b', False) in delays
+    assert ('a', False) in delays  # the same chat on another client is not parked
+    assert after['parked'] == []
+    print("✅ الإيقاف يقتصر على الهدف المتأثر")
+
+
+def test_learned_interval_per_chat_type():
+    """الفاصل المتعلم يتضاعف مع كل FloodWait ويتناقص مع الإرسال الناجح"""
+    print("🔍 اختبار الفاصل المتعلم لكل نوع محادثة")
+
+    scheduler = SendScheduler()
+    scheduler.report_flood(1, 'a', 'channel', 0)
+    assert scheduler.learned_interval(1, 'channel') == FLOOD_MIN_LEARNED_INTERVAL
+    scheduler.report_flood(1, 'b', 'channel', 0)
+    assert scheduler.learned_interval(1, 'channel') == FLOOD_MIN_LEARNED_INTERVAL * 2
+    assert scheduler.learned_interval(1, 'group') == 0
+    assert scheduler.learned_interval(2, 'channel') == 0
+
+    async def run():
+        stamps = []
+        for _ in range(2):
+            async with scheduler.slot(1, 'c', chat_type='channel'):
+                stamps.append(time.monotonic())
+        return stamps[1] - stamps[0]
+
+    # the second send to a channel waits for the learned interval
+    gap = asyncio.run(run())
+    assert gap >= FLOOD_MIN_LEARNED_INTERVAL * 2 * 0.95, gap  # shrunk slightly by the first send
+    learned = scheduler.get_backoff_state()['learned_intervals'][0]
+    assert learned['chat_type'] == 'channel' and learned['floods'] == 2
+    assert learned['interval_seconds'] < FLOOD_MIN_LEARNED_INTERVAL * 2
+    print("✅ الفاصل المتعلم يعمل")
+
+
+def test_retry_queue_survives_restart():
+    """قائمة إعادة الإرسال تحفظ في قاعدة البيانات"""
+    print("🔍 اختبار قائمة إعادة الإرسال الدائمة")
+
+    path = os.path.join(tempfile.mkdtemp(), 'send_retry_test.db')
+    db = Database(path)
+    task_id = db.create_task(1, '-1001111111111', 'مصدر', '-1002222222222', 'هدف')
+    db.save_send_retry(1, task_id, '-1001111111111', 5, '-1002222222222', 30, 1, 'FloodWait 30s')
+    db.save_send_retry(1, task_id, '-1001111111111', 5, '-1002222222222', 60, 2, 'FloodWait 60s')
+
+    retries = Database(path).get_send_retries(1)
+    assert len(retries) == 1
+    assert retries[0]['attempts'] == 2 and 50 < retries[0]['wait_seconds'] <= 60
+    assert db.get_send_retries(2) == []
+
+    db.delete_send_retry(task_id, '-1001111111111', 5, '-1002222222222')
+    assert db.get_send_retries() == []
+    print("✅ قائمة إعادة الإرسال تعمل")
+
+
+if __name__ == "__main__":
+    print("📤 اختبار جدولة الإرسال")
+    print("=" * 50)
+
+    test_targets_sent_concurrently()
+    test_interval_per_target()
+    test_inflight_cap_per_client()
+    test_flood_parks_only_destination()
+    test_learned_interval_per_chat_type()
+    test_retry_queue_survives_restart()
+
+    print("\n🎉 تم الانتهاء من اختبار جدولة الإرسال!")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+اختبار الذاكرة المؤقتة لإعدادات المهام
+Test the per-task settings snapshot cache shared by the bot and the userbot
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from database import settings_cache as settings_cache_module
+from database.settings_cache import settings_cache
+
+
+class CountingDatabase(Database):
+    """Database that counts connections opened by the settings getters"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connections = 0
+        self.init_database()
+
+    def get_connection(self):
+        self.connections += 1
+        return super().get_connection()
+
+
+def _create_db():
+    temp_dir = tempfile.mkdtemp()
+    db = CountingDatabase(os.path.join(temp_dir, 'settings_cache_test.db'))
+    task_id = db.create_task(1, '-1001111111111', 'مصدر', '-1002222222222', 'هدف')
+    settings_cache.clear()
+    return db, task_id
+
+
+def test_snapshot_hit_does_not_touch_db():
+    """القراءة الثانية للإعدادات لا تفتح أي اتصال بقاعدة البيانات"""
+    print("🔍 اختبار عدم قراءة قاعدة البيانات عند وجود نسخة مخزنة")
+    db, task_id = _create_db()
+
+    first = settings_cache.get(db, task_id)
+    db.connections = 0
+    second = settings_cache.get(db, task_id)
+
+    assert second is first
+    assert db.connections == 0
+    assert settings_cache.get_stats()['hits'] == 1
+    print("✅ لا توجد قراءات من قاعدة البيانات عند الإصابة")
+
+
+def test_write_invalidates_snapshot():
+    """تعديل إعداد من البوت يلغي النسخة المخزنة للمهمة"""
+    print("🔍 اختبار إلغاء النسخة المخزنة بعد التعديل")
+    db, task_id = _create_db()
+
+    before = settings_cache.get(db, task_id)
+    assert before.forwarding_settings['link_preview_enabled'] in (True, 1)
+
+    db.toggle_link_preview(task_id)
+    after = settings_cache.get(db, task_id)
+
+    assert after is not before
+    assert not after.forwarding_settings['link_preview_enabled']
+    print("✅ تم تحديث الإعدادات بعد التعديل")
+
+
+def test_invalidation_is_scoped_to_task():
+    """تعديل مهمة لا يلغي النسخ المخزنة لمهام أخرى"""
+    print("🔍 اختبار حصر الإلغاء في المهمة المعدلة")
+    db, task_id = _create_db()
+    other_id = db.create_task(1, '-1003333333333', 'مصدر', '-1004444444444', 'هدف')
+
+    other = settings_cache.get(db, other_id)
+    settings_cache.get(db, task_id)
+    db.update_header_settings(task_id, True, 'ترويسة')
+
+    assert settings_cache.get(db, other_id) is other
+    assert settings_cache.get(db, task_id).message_settings['header_text'] == 'ترويسة'
+    print("✅ الإلغاء محصور في المهمة المعدلة")
+
+
+def test_user_level_write_invalidates_everything():
+    """تعديلات بدون task_id (مثل المنطقة الزمنية) تلغي جميع النسخ"""
+    print("🔍 اختبار الإلغاء الشامل")
+    db, task_id = _create_db()
+
+    snapshot = settings_cache.get(db, task_id)
+    db.update_user_timezone(1, 'Asia/Riyadh')
+
+    assert settings_cache.get(db, task_id) is not snapshot
+    print("✅ تم إلغاء جميع النسخ المخزنة")
+
+
+def test_partial_snapshot_kept_briefly():
+    """فشل أحد المحملات لا يعيد تحميل كل الإعدادات لكل رسالة"""
+    print("🔍 اختبار النسخة الجزئية")
+
+    class FailingDatabase(CountingDatabase):
+        def get_working_hours(self, task_id):
+            raise RuntimeError('working_hours table is broken')
+
+    db = FailingDatabase(os.path.join(tempfile.mkdtemp(), 'settings_cache_partial.db'))
+    task_id = db.create_task(1, '-1001111111111', 'مصدر', '-1002222222222', 'هدف')
+    settings_cache.clear()
+
+    partial = settings_cache.get(db, task_id)
+    assert not partial.complete and partial.working_hours is None
+    db.connections = 0
+    assert settings_cache.get(db, task_id) is partial
+    assert db.connections == 0
+
+    # after the short TTL every loader runs again
+    partial.loaded_at -= settings_cache_module.PARTIAL_SNAPSHOT_TTL + 1
+    assert settings_cache.get(db, task_id) is not partial
+    print("✅ النسخة الجزئية تحفظ لفترة قصيرة")
+
+
+def test_async_load_off_the_event_loop():
+    """التحميل من حلقة الأحداث يستخدم الدوال غير المتزامنة ويشغل الباقي في Thread منفصل"""
+    print("🔍 اختبار التحميل غير المتزامن")
+
+    class AsyncBackend:
+        def __init__(self):
+            self.sync_threads = set()
+            self.async_calls = 0
+
+        def get_message_settings(self, task_id):
+            self.sync_threads.add(threading.current_thread().name)
+            return {'header_enabled': False}
+
+        def get_filter_words(self, task_id, filter_type):
+            return [f'{filter_type}-{task_id}']
+
+        def get_rate_limit_settings(self, task_id):
+            raise AssertionError("the async variant must be used")
+
+        async def async_get_rate_limit_settings(self, task_id):
+            self.async_calls += 1
+            return {'message_count': 5}
+
+    db = AsyncBackend()
+    settings_cache.clear()
+
+    async def run():
+        loop_thread = threading.current_thread().name
+        first = await settings_cache.get_async(db, 7)
+        second = await settings_cache.get_async(db, 7)
+        return loop_thread, first, second
+
+    loop_thread, first, second = asyncio.run(run())
+    assert second is first and first.complete
+    assert first.rate_limit_settings == {'message_count': 5} and db.async_calls == 1
+    assert first.message_settings == {'header_enabled': False}
+    assert first.blacklist_words == ['blacklist-7']
+    assert first.watermark_settings is None  # not implemented by this backend
+    assert db.sync_threads and loop_thread not in db.sync_threads
+    # sync callers share the snapshot
+    assert settings_cache.get(db, 7) is first
+    print("✅ التحميل لا يحجب حلقة الأحداث")
+
+
+if __name__ == "__main__":
+    print("🗂️ اختبار الذاكرة المؤقتة لإعدادات المهام")
+    print("=" * 50)
+
+    test_snapshot_hit_does_not_touch_db()
+    test_write_invalidates_snapshot()
+    test_invalidation_is_scoped_to_task()
+    test_user_level_write_invalidates_everything()
+    test_partial_snapshot_kept_briefly()
+    test_async_load_off_the_event_loop()
+
+    print("\n🎉 تم الانتهاء من اختبار ذاكرة الإعدادات!")
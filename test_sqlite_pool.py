@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+اختبار مجمع اتصالات SQLite
+Test the per-thread SQLite connection pool used by Database
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.sqlite_pool import SQLiteConnectionPool
+
+
+def _pool():
+    return SQLiteConnectionPool(os.path.join(tempfile.mkdtemp(), 'pool_test.db'))
+
+
+def test_connection_reused_per_thread():
+    """نفس الـ Thread يحصل على نفس الاتصال"""
+    print("🔍 اختبار إعادة استخدام الاتصال")
+    pool = _pool()
+
+    first = pool.get_connection()
+    second = pool.get_connection()
+    assert first is second
+
+    other = []
+    worker = threading.Thread(target=lambda: other.append(pool.get_connection()))
+    worker.start()
+    worker.join()
+    assert other[0] is not first
+    assert pool.get_stats()['created'] == 2
+    print("✅ الاتصال يعاد استخدامه لكل Thread")
+
+
+def test_pragmas_applied():
+    """وضع WAL والإعدادات مفعلة على كل اتصال"""
+    print("🔍 اختبار إعدادات PRAGMA")
+    conn = _pool().get_connection()
+
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+    print("✅ تم تطبيق إعدادات PRAGMA")
+
+
+def test_closed_connection_is_replaced():
+    """إغلاق الاتصال يدوياً لا يكسر المجمع"""
+    print("🔍 اختبار استبدال الاتصال المغلق")
+    pool = _pool()
+
+    conn = pool.get_connection()
+    conn.close()
+    fresh = pool.get_connection()
+    assert fresh is not conn
+    assert fresh.execute('SELECT 1').fetchone()[0] == 1
+    assert pool.get_stats()['reconnects'] == 1
+    print("✅ تم استبدال الاتصال المغلق")
+
+
+def test_dead_thread_connections_are_closed():
+    """اتصالات الـ Threads المنتهية يتم إغلاقها"""
+    print("🔍 اختبار إغلاق اتصالات الـ Threads المنتهية")
+    pool = _pool()
+
+    for _ in range(3):
+        worker = threading.Thread(target=pool.get_connection)
+        worker.start()
+        worker.join()
+    pool.get_connection()
+
+    stats = pool.get_stats()
+    assert stats['open_connections'] == 1
+    assert stats['closed_stale'] == 3
+    print("✅ تم إغلاق الاتصالات غير المستخدمة")
+
+
+def test_concurrent_writers():
+    """الكتابة من عدة Threads بدون خطأ database is locked"""
+    print("🔍 اختبار الكتابة المتزامنة")
+    pool = _pool()
+    with pool.get_connection() as conn:
+        conn.execute('CREATE TABLE items (value INTEGER)')
+
+    errors = []
+
+    def writer(offset):
+        try:
+            for i in range(50):
+                with pool.get_connection() as conn:
+                    conn.execute('INSERT INTO items (value) VALUES (?)', (offset + i,))
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=writer, args=(n * 100,)) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    assert pool.get_connection().execute('SELECT COUNT(*) FROM items').fetchone()[0] == 200
+    print("✅ الكتابة المتزامنة تعمل")
+
+
+if __name__ == "__main__":
+    print("🔌 اختبار مجمع اتصالات SQLite")
+    print("=" * 50)
+
+    test_connection_reused_per_thread()
+    test_pragmas_applied()
+    test_closed_connection_is_replaced()
+    test_dead_thread_connections_are_closed()
+    test_concurrent_writers()
+
+    print("\n🎉 تم الانتهاء من اختبار مجمع الاتصالات!")
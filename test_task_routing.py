@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+اختبار فهرس توجيه المحادثات المصدر
+Test the source-chat routing index used by the userbot message handler
+"""
+
+import os
+import sys
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from userbot_service.task_routing import TaskRoutingIndex
+
+
+def _sample_tasks():
+    return [
+        {'id': 1, 'task_name': 'أ', 'source_chat_id': '-1001111111111', 'target_chat_id': '-1002222222222'},
+        {'id': 1, 'task_name': 'أ', 'source_chat_id': '-1001111111111', 'target_chat_id': '-1003333333333'},
+        {'id': 2, 'task_name': 'ب', 'source_chat_id': '@NewsChannel', 'target_chat_id': '-1004444444444'},
+        {'id': 3, 'task_name': 'ج', 'source_chat_id': ' -1005555555555 ', 'target_chat_id': '@target'},
+        {'id': 4, 'task_name': 'د', 'source_chat_id': '', 'target_chat_id': '-1006666666666'},
+    ]
+
+
+def test_lookup_by_chat_id():
+    """البحث بالمعرف الرقمي يعيد جميع الأهداف بنفس الترتيب"""
+    print("🔍 اختبار البحث بالمعرف الرقمي")
+    index = TaskRoutingIndex(_sample_tasks())
+
+    matches = index.lookup(-1001111111111)
+    assert [t['target_chat_id'] for t in matches] == ['-1002222222222', '-1003333333333']
+    assert index.lookup(-1005555555555)[0]['id'] == 3
+    print("✅ البحث بالمعرف الرقمي يعمل")
+
+
+def test_non_matching_chat_is_rejected():
+    """المحادثات غير المرتبطة بمهام تعيد قائمة فارغة"""
+    print("🔍 اختبار رفض المحادثات غير المطابقة")
+    index = TaskRoutingIndex(_sample_tasks())
+
+    assert index.lookup(-1009999999999) == []
+    assert index.lookup(-1009999999999, 'someone') == []
+    assert index.lookup(None) == []
+    print("✅ تم رفض المحادثات غير المطابقة")
+
+
+def test_lookup_by_username():
+    """البحث باسم المستخدم غير حساس لحالة الأحرف"""
+    print("🔍 اختبار البحث باسم المستخدم")
+    index = TaskRoutingIndex(_sample_tasks())
+
+    assert index.has_username_routes
+    assert [t['id'] for t in index.lookup(-1007777777777, 'newschannel')] == [2]
+    assert [t['id'] for t in index.lookup(-1007777777777, 'NEWSCHANNEL')] == [2]
+    print("✅ البحث باسم المستخدم يعمل")
+
+
+def test_id_and_username_merge_keeps_order():
+    """عند التطابق بالمعرف واسم المستخدم معاً يتم الحفاظ على ترتيب المهام"""
+    print("🔍 اختبار دمج نتائج المعرف واسم المستخدم")
+    tasks = [
+        {'id': 5, 'source_chat_id': '@mixed', 'target_chat_id': '1'},
+        {'id': 6, 'source_chat_id': '-1008888888888', 'target_chat_id': '2'},
+    ]
+    index = TaskRoutingIndex(tasks)
+
+    assert [t['id'] for t in index.lookup(-1008888888888, 'mixed')] == [5, 6]
+    print("✅ تم دمج النتائج بالترتيب الصحيح")
+
+
+def test_invalid_sources_are_skipped():
+    """المصادر الفارغة لا تُضاف للفهرس"""
+    print("🔍 اختبار تجاهل المصادر غير الصالحة")
+    index = TaskRoutingIndex(_sample_tasks())
+
+    assert len(index) == 5
+    assert index.source_count() == 3
+    assert not TaskRoutingIndex([])
+    print("✅ تم تجاهل المصادر غير الصالحة")
+
+
+if __name__ == "__main__":
+    print("🧭 اختبار فهرس توجيه المحادثات")
+    print("=" * 50)
+
+    test_lookup_by_chat_id()
+    test_non_matching_chat_is_rejected()
+    test_lookup_by_username()
+    test_id_and_username_merge_keeps_order()
+    test_invalid_sources_are_skipped()
+
+    print("\n🎉 تم الانتهاء من اختبار فهرس التوجيه!")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+اختبار خطة تنظيف النصوص المترجمة مسبقاً
+Test and micro-benchmark the precompiled text cleaning pipeline against the
+previous implementation (one re.sub per rule, patterns compiled per call)
+"""
+
+import os
+import re
+import sys
+import time
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from userbot_service.text_cleaning import TextCleaningPlan
+
+ALL_RULES = {
+    'remove_links': True,
+    'remove_emojis': True,
+    'remove_hashtags': True,
+    'remove_phone_numbers': True,
+    'remove_lines_with_keywords': True,
+    'remove_empty_lines': True,
+}
+
+KEYWORDS = ['للإعلان', 'اشترك الآن', 'Join us']
+
+# Typical channel posts (news, promos, deals)
+CORPUS = [
+    "🔴 عاجل | انقطاع الكهرباء عن عدة مناطق في العاصمة\n\nالتفاصيل: https://example.com/news/123\n\n#عاجل #أخبار\nتابعونا على t.me/news_channel",
+    "📢 للإعلان في القناة تواصل معنا\n📞 +966 50 123 4567\nwww.ads-site.net",
+    "عرض خاص 🎉🎉\nخصم 50% على جميع المنتجات حتى نهاية 2025\n\n\n\nللطلب: 0501234567890\n[اضغط هنا](https://shop.example.org/deal)",
+    "Breaking: markets rally as inflation cools 📈\nRead more <https://finance.example.com/a/1>\n#markets #economy\nJoin us: t.me/markets",
+    "صباح الخير 🌸\n\nحديث اليوم:\n«خيركم من تعلم القرآن وعلمه»\n\n   \n#حديث",
+    "<a href=\"https://example.com\">رابط مخفي</a> داخل النص\nاتصل: (123) 456-7890 أو 555-123-4567",
+    "Match result ⚽️: 2 - 1\nGoals: 12', 78'\n\nHighlights youtube.com/watch?v=abc\n\n\nاشترك الآن في القناة",
+    "تحديث الطقس ☀️🌡️\nالرياض: 41°\nجدة: 36°\nالدمام: 39°\n\n#الطقس",
+]
+
+
+def legacy_clean(text, settings, keywords):
+    """التنفيذ السابق (للمقارنة فقط)"""
+    cleaned_text = text
+    if settings.get('remove_links', False):
+        cleaned_text = re.sub(r'\[([^\]]+)\]\s*\(([^)]*)\)', r'\1', cleaned_text)
+        cleaned_text = re.sub(r'<a\s+href=[\'\"][^\'\"]+[\'\"]\s*>(.*?)</a>', r'\1', cleaned_text, flags=re.IGNORECASE | re.DOTALL)
+        cleaned_text = re.sub(r'<https?://[^>]+>', '', cleaned_text)
+        cleaned_text = re.sub(r'https?://[^\s]+', '', cleaned_text)
+        cleaned_text = re.sub(r't\.me/[^\s]+', '', cleaned_text)
+        cleaned_text = re.sub(r'www\.[^\s]+', '', cleaned_text)
+        cleaned_text = re.sub(r'\b[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.([a-zA-Z]{2,6}\.?)+(/[^\s]*)?', '', cleaned_text)
+        cleaned_text = re.sub(r'\[\s*\]', '', cleaned_text)
+        cleaned_text = re.sub(r'\(\s*\)', '', cleaned_text)
+    if settings.get('remove_emojis', False):
+        emoji_pattern = re.compile(
+            "[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF"
+            "\U00002700-\U000027BF\U0001f926-\U0001f937\U00010000-\U0010ffff\u2640-\u2642"
+            "\u2600-\u2B55\u200d\u23cf\u23e9-\u23f3\u23f8-\u23f9\u3030]+", flags=re.UNICODE)
+        cleaned_text = emoji_pattern.sub('', cleaned_text)
+    if settings.get('remove_hashtags', False):
+        cleaned_text = re.sub(r'#\w+', '', cleaned_text)
+    if settings.get('remove_phone_numbers', False):
+        for pattern in [
+            r'\+\d{1,4}[-.\s]?\(?\d{1,4}\)?[-.\s]?\d{1,4}[-.\s]?\d{4,9}',
+            r'\b\d{3}[-.\s]\d{3}[-.\s]\d{4}\b',
+            r'\b\d{4}[-.\s]\d{3}[-.\s]\d{3}\b',
+            r'\b\d{2}[-.\s]\d{4}[-.\s]\d{4}\b',
+            r'\b\d{10,15}\b',
+            r'\(\d{3}\)\s?\d{3}[-.\s]?\d{4}',
+        ]:
+            cleaned_text = re.sub(pattern, '', cleaned_text)
+    if settings.get('remove_lines_with_keywords', False) and keywords:
+        cleaned_text = '\n'.join(
+            line for line in cleaned_text.split('\n')
+            if not any(keyword.lower() in line.lower() for keyword in keywords)
+        )
+    lines = [re.sub(r'[ \t]+', ' ', line.strip()) for line in cleaned_text.split('\n')]
+    if settings.get('remove_empty_lines', False):
+        lines = [line for i, line in enumerate(lines)
+                 if line.strip() or (0 < i < len(lines) - 1 and lines[i - 1].strip() and lines[i + 1].strip())]
+    return '\n'.join(lines)
+
+
+def test_plan_matches_previous_output():
+    """الخطة الجديدة تعطي نفس نتيجة التنفيذ السابق على المدونة"""
+    print("🔍 اختبار تطابق النتائج")
+
+    settings_variants = [ALL_RULES, {'remove_links': True}, {'remove_emojis': True, 'remove_empty_lines': True},
+                         {'remove_hashtags': True, 'remove_phone_numbers': True}]
+    for settings in settings_variants:
+        plan = TextCleaningPlan(settings, KEYWORDS)
+        for post in CORPUS:
+            assert plan.apply(post) == legacy_clean(post, settings, KEYWORDS), (settings, post)
+    print("✅ النتائج متطابقة")
+
+
+def test_hidden_links_keep_text():
+    """الروابط المخفية تحتفظ بالنص الظاهر"""
+    print("🔍 اختبار الروابط المخفية")
+
+    plan = TextCleaningPlan({'remove_links': True})
+    assert plan.apply('[اضغط هنا](https://x.com/a) الآن') == 'اضغط هنا الآن'
+    assert plan.apply('<a href="https://x.com">موقعنا</a>') == 'موقعنا'
+    print("✅ الروابط المخفية تعمل")
+
+
+def test_overlapping_rules_keep_previous_order():
+    """القواعد المتداخلة تطبق بالترتيب السابق: روابط، ايموجي، هاشتاقات، هواتف"""
+    print("🔍 اختبار تداخل القواعد")
+
+    overlaps = [
+        '#abc.com',               # the link goes first, the lone '#' stays
+        'وسم #😀abc هنا',         # the emoji goes first, then the hashtag
+        'اتصل 555 123#tag 4567',  # the hashtag goes first, then the phone number
+        'راجع #news.example.org/a اليوم',
+    ]
+    for settings in (ALL_RULES, {'remove_links': True, 'remove_hashtags': True},
+                     {'remove_emojis': True, 'remove_hashtags': True},
+                     {'remove_hashtags': True, 'remove_phone_numbers': True}):
+        plan = TextCleaningPlan(settings, KEYWORDS)
+        for text in overlaps:
+            assert plan.apply(text) == legacy_clean(text, settings, KEYWORDS), (settings, text)
+
+    plan = TextCleaningPlan({'remove_links': True, 'remove_hashtags': True})
+    assert plan.apply('#abc.com') == '#'
+    print("✅ ترتيب القواعد محفوظ")
+
+
+def run_benchmark(rounds: int = 300):
+    """مقارنة السرعة مع التنفيذ السابق (يعيد الزمنين بالثواني)"""
+    plan = TextCleaningPlan(ALL_RULES, KEYWORDS)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for post in CORPUS:
+            legacy_clean(post, ALL_RULES, KEYWORDS)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for post in CORPUS:
+            plan.apply(post)
+    plan_time = time.perf_counter() - start
+
+    per_post = rounds * len(CORPUS)
+    print(f"   التنفيذ السابق: {legacy_time / per_post * 1e6:.1f} µs/رسالة")
+    print(f"   الخطة المترجمة: {plan_time / per_post * 1e6:.1f} µs/رسالة")
+    print(f"   التسريع: {legacy_time / plan_time:.1f}x")
+    return legacy_time, plan_time
+
+
+def test_benchmark():
+    """مقارنة السرعة (للعرض فقط؛ TEXT_CLEANING_BENCHMARK_ASSERT=1 يجعلها شرطاً)"""
+    print("🔍 مقارنة السرعة")
+
+    plan = TextCleaningPlan(ALL_RULES, KEYWORDS)
+    for post in CORPUS:
+        assert plan.apply(post) == legacy_clean(post, ALL_RULES, KEYWORDS)
+
+    legacy_time, plan_time = run_benchmark()
+    if os.getenv('TEXT_CLEANING_BENCHMARK_ASSERT'):
+        assert plan_time < legacy_time
+        print("✅ الخطة أسرع")
+    else:
+        print("✅ الناتج مطابق (التوقيت للعرض فقط)")
+
+
+if __name__ == "__main__":
+    print("🧹 اختبار خطة تنظيف النصوص")
+    print("=" * 50)
+
+    test_plan_matches_previous_output()
+    test_hidden_links_keep_text()
+    test_overlapping_rules_keep_previous_order()
+    print("🔍 مقارنة السرعة")
+    legacy_time, plan_time = run_benchmark()
+    assert plan_time < legacy_time
+    print("✅ الخطة أسرع")
+
+    print("\n🎉 تم الانتهاء من اختبار تنظيف النصوص!")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+اختبار محرك الاستبدال النصي المترجم
+Test the single-pass compiled text replacement engine and its per-task cache
+"""
+
+import os
+import sys
+import tempfile
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from database.settings_cache import settings_cache
+from database.text_replacement import TextReplacementEngine
+
+
+def _rule(find_text, replace_text, is_case_sensitive=False, is_whole_word=False):
+    return {'find_text': find_text, 'replace_text': replace_text,
+            'is_case_sensitive': is_case_sensitive, 'is_whole_word': is_whole_word}
+
+
+def test_single_pass_rules():
+    """الاستبدال بمرور واحد مع الخيارات"""
+    print("🔍 اختبار المحرك")
+
+    engine = TextReplacementEngine([
+        _rule('cat', 'dog'),
+        _rule('Cat', 'LION', is_case_sensitive=True),
+        _rule('car', 'bus', is_whole_word=True),
+        _rule('قناة', 'مجموعة'),
+        _rule('قناة الأخبار', 'قناتنا'),
+    ])
+
+    text, count = engine.apply('Cat cat CAT scar car')
+    assert text == 'LION dog dog scar bus'
+    assert count == 4
+
+    # longer phrase wins at the same position
+    text, _ = engine.apply('تابع قناة الأخبار و قناة الرياضة')
+    assert text == 'تابع قناتنا و مجموعة الرياضة'
+
+    # replacement output is not re-scanned
+    text, _ = TextReplacementEngine([_rule('a', 'b'), _rule('b', 'c')]).apply('ab')
+    assert text == 'bc'
+
+    # replacement text is literal
+    text, _ = TextReplacementEngine([_rule('x', r'\1 $')]).apply('x')
+    assert text == r'\1 $'
+    print("✅ المحرك يعمل")
+
+
+def test_database_engine_cached_and_invalidated():
+    """المحرك يُبنى مرة واحدة ويعاد بناؤه عند الإضافة أو الحذف"""
+    print("🔍 اختبار الذاكرة المؤقتة للمحرك")
+
+    db = Database(os.path.join(tempfile.mkdtemp(), 'replacement_test.db'))
+    task_id = db.create_task(1, '-1001111111111', 'مصدر', '-1002222222222', 'هدف')
+    settings_cache.clear()
+
+    entry_id = db.add_text_replacement(task_id, 'hello', 'مرحبا')
+    assert db.apply_text_replacements(task_id, 'hello world') == 'مرحبا world'
+
+    engine = settings_cache.get(db, task_id).compiled('text_replacement_engine', lambda s: None)
+    db.apply_text_replacements(task_id, 'hello again')
+    assert settings_cache.get(db, task_id).compiled('text_replacement_engine', lambda s: None) is engine
+
+    db.add_text_replacement(task_id, 'world', 'العالم')
+    assert db.apply_text_replacements(task_id, 'hello world') == 'مرحبا العالم'
+
+    db.remove_text_replacement(entry_id)
+    assert db.apply_text_replacements(task_id, 'hello world') == 'hello العالم'
+
+    db.set_text_replacement_enabled(task_id, False)
+    assert db.apply_text_replacements(task_id, 'hello world') == 'hello world'
+    print("✅ الذاكرة المؤقتة تتحدث مع القواعد")
+
+
+if __name__ == "__main__":
+    print("🔁 اختبار محرك الاستبدال النصي")
+    print("=" * 50)
+
+    test_single_pass_rules()
+    test_database_engine_cached_and_invalidated()
+
+    print("\n🎉 تم الانتهاء من اختبار الاستبدال النصي!")
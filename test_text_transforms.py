@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+اختبار ذاكرة تحويلات النص لكل رسالة
+Test that each text stage runs once per (task, stage, input) within a message
+"""
+
+import asyncio
+import os
+import sys
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from userbot_service.text_transforms import TextTransformCache
+
+
+def test_stage_runs_once_per_task():
+    """نفس المرحلة لنفس المهمة تعمل مرة واحدة لكل الأهداف"""
+    print("🔍 اختبار تنفيذ المرحلة مرة واحدة")
+
+    calls = []
+
+    def clean(text):
+        calls.append(text)
+        return text.strip()
+
+    transforms = TextTransformCache()
+    for _ in range(5):  # five targets of the same task
+        assert transforms.apply(1, 'cleaning', '  hello  ', clean) == 'hello'
+    assert transforms.apply(2, 'cleaning', '  hello  ', clean) == 'hello'
+    assert transforms.apply(1, 'cleaning', ' other ', clean) == 'other'
+
+    assert len(calls) == 3
+    assert transforms.get_stats() == {'entries': 3, 'hits': 4, 'misses': 3}
+    print("✅ المرحلة تعمل مرة واحدة لكل مهمة ومدخل")
+
+
+def test_async_stage_and_empty_text():
+    """المراحل غير المتزامنة والنص الفارغ"""
+    print("🔍 اختبار الترجمة والنص الفارغ")
+
+    calls = []
+
+    async def translate(text):
+        calls.append(text)
+        return text.upper()
+
+    async def run():
+        transforms = TextTransformCache()
+        first = await transforms.apply_async(7, 'translation', 'hi', translate)
+        second = await transforms.apply_async(7, 'translation', 'hi', translate)
+        empty = await transforms.apply_async(7, 'translation', '', translate)
+        header = transforms.apply(7, 'message_formatting', '', lambda text: 'HEADER\n' + text, skip_empty=False)
+        return first, second, empty, header
+
+    first, second, empty, header = asyncio.run(run())
+    assert first == second == 'HI'
+    assert empty == ''
+    assert header == 'HEADER\n'
+    assert calls == ['hi']
+    print("✅ الترجمة تعمل مرة واحدة")
+
+
+if __name__ == "__main__":
+    print("🔄 اختبار ذاكرة تحويلات النص")
+    print("=" * 50)
+
+    test_stage_runs_once_per_task()
+    test_async_stage_and_empty_text()
+
+    print("\n🎉 تم الانتهاء من اختبار تحويلات النص!")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+اختبار خدمة الترجمة المجمعة
+Test the batched translation service with a local stand-in provider
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from userbot_service.translation_service import TranslationCache, TranslationProvider, TranslationService
+
+
+class FakeProvider(TranslationProvider):
+    """مترجم محلي: يعكس النص ويسجل الدفعات"""
+
+    name = 'fake'
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.threads = set()
+        self.fail = fail
+
+    def translate_batch(self, texts, source, target):
+        self.threads.add(threading.current_thread().name)
+        self.batches.append((source, target, list(texts)))
+        if self.fail:
+            raise RuntimeError("provider down")
+        return [f"{target}:{text[::-1]}" for text in texts]
+
+
+def _cache_path():
+    return os.path.join(tempfile.mkdtemp(), 'translation_cache.db')
+
+
+def test_batches_per_language_pair():
+    """النصوص المتزامنة تُجمع في دفعة واحدة لكل زوج لغات"""
+    print("🔍 اختبار التجميع حسب زوج اللغات")
+
+    async def run():
+        provider = FakeProvider()
+        service = TranslationService(provider, TranslationCache(_cache_path()), batch_window=0.02)
+        try:
+            results = await asyncio.gather(
+                service.translate('abc', 'auto', 'en'),
+                service.translate('xyz', 'auto', 'en'),
+                service.translate('abc', 'auto', 'en'),  # duplicate joins the same item
+                service.translate('abc', 'auto', 'fr'),
+            )
+            return provider, results, service.get_stats()
+        finally:
+            service.shutdown()
+
+    provider, results, stats = asyncio.run(run())
+    assert results == ['en:cba', 'en:zyx', 'en:cba', 'fr:cba']
+    assert sorted(provider.batches) == [('auto', 'en', ['abc', 'xyz']), ('auto', 'fr', ['abc'])]
+    assert all(name.startswith('translation') for name in provider.threads)
+    assert stats['batches'] == 2 and stats['translated'] == 3
+    print("✅ تم التجميع في دفعتين")
+
+
+def test_cache_memory_and_sqlite():
+    """الذاكرة المؤقتة في الذاكرة وفي SQLite"""
+    print("🔍 اختبار الذاكرة المؤقتة")
+
+    path = _cache_path()
+
+    async def run(provider):
+        service = TranslationService(provider, TranslationCache(path), batch_window=0)
+        try:
+            first = await service.translate('hello', 'en', 'ar')
+            second = await service.translate('hello', 'en', 'ar')
+            return first, second, service.get_stats()
+        finally:
+            service.shutdown()
+
+    provider = FakeProvider()
+    first, second, stats = asyncio.run(run(provider))
+    assert first == second == 'ar:olleh'
+    assert len(provider.batches) == 1 and stats['memory_hits'] == 1
+
+    # new process: served from SQLite, provider not called
+    restarted = FakeProvider()
+    first, _, stats = asyncio.run(run(restarted))
+    assert first == 'ar:olleh'
+    assert restarted.batches == [] and stats['db_hits'] == 1
+    print("✅ الذاكرة المؤقتة تعمل")
+
+
+def test_cache_file_created_lazily_off_loop():
+    """ملف الذاكرة الدائمة ينشأ عند أول استخدام وقراءته خارج حلقة الأحداث"""
+    print("🔍 اختبار الإنشاء المتأخر لملف الذاكرة")
+
+    path = os.path.join(tempfile.mkdtemp(), 'data', 'translation_cache.db')
+    cache = TranslationCache(path)
+    assert not os.path.exists(path)
+
+    threads = []
+    load = cache.load
+
+    def recording_load(*args):
+        threads.append(threading.current_thread().name)
+        return load(*args)
+
+    cache.load = recording_load
+
+    async def run():
+        service = TranslationService(FakeProvider(), cache, batch_window=0)
+        try:
+            return await service.translate('hello', 'en', 'ar')
+        finally:
+            service.shutdown()
+
+    assert asyncio.run(run()) == 'ar:olleh'
+    assert os.path.exists(path)
+    assert threads and all(name.startswith('translation') for name in threads)
+    assert TranslationCache(path).get('en', 'ar', 'hello') == 'ar:olleh'
+    print("✅ الملف أنشئ عند الحاجة والقراءة في Thread منفصل")
+
+
+def test_provider_failure_returns_original():
+    """فشل المزود يعيد النص الأصلي بدون تخزين"""
+    print("🔍 اختبار فشل المزود")
+
+    async def run():
+        service = TranslationService(FakeProvider(fail=True), TranslationCache(None), batch_window=0)
+        try:
+            result = await service.translate('نص', 'auto', 'en')
+            return result, service.get_stats()
+        finally:
+            service.shutdown()
+
+    result, stats = asyncio.run(run())
+    assert result == 'نص'
+    assert stats['failures'] == 1 and stats['memory_entries'] == 0
+    print("✅ النص الأصلي يعاد عند الفشل")
+
+
+if __name__ == "__main__":
+    print("🌐 اختبار خدمة الترجمة")
+    print("=" * 50)
+
+    test_batches_per_language_pair()
+    test_cache_memory_and_sqlite()
+    test_cache_file_created_lazily_off_loop()
+    test_provider_failure_returns_original()
+
+    print("\n🎉 تم الانتهاء من اختبار خدمة الترجمة!")
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+اختبار رفع الوسائط مرة واحدة وإرسالها لعدة أهداف
+Test that processed media is uploaded once and reused for every target
+"""
+
+import asyncio
+import os
+import sys
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import send_file_helper
+from send_file_helper import MediaUploadCache, TelethonFileSender
+
+
+class FakeMessage:
+    def __init__(self, media):
+        self.media = media
+
+
+class FakeClient:
+    """عميل وهمي يسجل عدد البايتات المرفوعة"""
+
+    def __init__(self):
+        self.uploaded_bytes = 0
+        self.sent = []
+
+    async def send_file(self, entity, file, **kwargs):
+        await asyncio.sleep(0.01)
+        if hasattr(file, 'read'):
+            data = file.read()
+            self.uploaded_bytes += len(data)
+            media = ('media', len(data))
+        else:
+            media = file
+        self.sent.append((entity, media, kwargs.get('caption')))
+        return FakeMessage(media)
+
+    async def upload_file(self, file, file_name=None):
+        self.uploaded_bytes += len(file.read())
+        return ('input_file', file_name)
+
+
+def test_upload_once_for_all_targets():
+    """الملف يرفع مرة واحدة لعشرة أهداف"""
+    print("🔍 اختبار الرفع مرة واحدة لعدة أهداف")
+
+    async def run():
+        client = FakeClient()
+        cache = MediaUploadCache()
+        video = os.urandom(1024 * 1024)
+        for target in range(10):
+            await TelethonFileSender.send_file_with_name(
+                client, target, video, 'video.mp4', upload_cache=cache, caption=f"target {target}")
+        return client, cache
+
+    client, cache = asyncio.run(run())
+    assert client.uploaded_bytes == 1024 * 1024
+    assert len(client.sent) == 10
+    assert all(media == ('media', 1024 * 1024) for _, media, _ in client.sent)
+    assert client.sent[3][2] == "target 3"
+    assert cache.get_stats() == {'entries': 1, 'uploads': 1, 'reuses': 9}
+    print("✅ تم رفع الملف مرة واحدة فقط")
+
+
+def test_concurrent_targets_share_upload():
+    """الأهداف المتزامنة تنتظر الرفع الأول"""
+    print("🔍 اختبار الإرسال المتزامن")
+
+    async def run():
+        client = FakeClient()
+        cache = MediaUploadCache()
+        photo = os.urandom(4096)
+        await asyncio.gather(*(
+            TelethonFileSender.send_file_with_name(client, target, photo, 'photo.jpg', upload_cache=cache)
+            for target in range(5)
+        ))
+        return client, cache
+
+    client, cache = asyncio.run(run())
+    assert client.uploaded_bytes == 4096
+    assert cache.uploads == 1 and cache.reuses == 4
+    print("✅ الإرسال المتزامن يعيد استخدام نفس الرفع")
+
+
+def test_different_content_uploaded_separately():
+    """محتوى مختلف يرفع بشكل منفصل"""
+    print("🔍 اختبار المفتاح حسب المحتوى")
+
+    async def run():
+        client = FakeClient()
+        cache = MediaUploadCache()
+        await TelethonFileSender.send_file_with_name(client, 1, b'a' * 10, 'a.jpg', upload_cache=cache)
+        await TelethonFileSender.send_file_with_name(client, 2, b'b' * 10, 'b.jpg', upload_cache=cache)
+        await TelethonFileSender.send_file_with_name(client, 3, b'a' * 10, 'a.jpg', upload_cache=cache)
+        return client, cache
+
+    client, cache = asyncio.run(run())
+    assert client.uploaded_bytes == 20
+    assert cache.get_stats() == {'entries': 2, 'uploads': 2, 'reuses': 1}
+    print("✅ كل محتوى له رفع مستقل")
+
+
+def test_no_media_handle_not_cached():
+    """بدون وسائط في الرسالة المرسلة لا يعاد رفع الملف ولا يخزن"""
+    print("🔍 اختبار رسالة مرسلة بدون وسائط")
+
+    class NoMediaClient(FakeClient):
+        async def send_file(self, entity, file, **kwargs):
+            await super().send_file(entity, file, **kwargs)
+            return FakeMessage(None)
+
+    async def run():
+        client = NoMediaClient()
+        cache = MediaUploadCache()
+        await TelethonFileSender.send_file_with_name(client, 1, b'c' * 10, 'c.jpg', upload_cache=cache)
+        return client, cache
+
+    client, cache = asyncio.run(run())
+    assert client.uploaded_bytes == 10
+    assert cache.get_stats() == {'entries': 0, 'uploads': 1, 'reuses': 0}
+    print("✅ لم يتم رفع الملف مرة ثانية")
+
+
+def test_flood_wait_not_retried():
+    """FloodWait يمرر للمستدعي بدون محاولة رفع بديلة"""
+    print("🔍 اختبار FloodWait أثناء الإرسال")
+
+    class FakeFloodWait(Exception):
+        seconds = 30
+
+    class FloodedClient(FakeClient):
+        async def send_file(self, entity, file, **kwargs):
+            raise FakeFloodWait()
+
+    async def run():
+        client = FloodedClient()
+        try:
+            await TelethonFileSender.send_file_with_name(client, 1, b'd' * 10, 'd.jpg', upload_cache=MediaUploadCache())
+        except FakeFloodWait:
+            return client
+        raise AssertionError("FloodWait expected")
+
+    wait_errors = send_file_helper.WAIT_ERRORS
+    send_file_helper.WAIT_ERRORS = (FakeFloodWait,)
+    try:
+        client = asyncio.run(run())
+    finally:
+        send_file_helper.WAIT_ERRORS = wait_errors
+    assert client.uploaded_bytes == 0
+    print("✅ FloodWait لم يؤد إلى رفع إضافي")
+
+
+if __name__ == "__main__":
+    print("📤 اختبار الرفع مرة واحدة والإرسال لعدة أهداف")
+    print("=" * 50)
+
+    test_upload_once_for_all_targets()
+    test_concurrent_targets_share_upload()
+    test_different_content_uploaded_separately()
+    test_no_media_handle_not_cached()
+    test_flood_wait_not_retried()
+
+    print("\n🎉 تم الانتهاء من اختبار الرفع!")
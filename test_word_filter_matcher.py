@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+اختبار مطابقة فلتر الكلمات (Aho-Corasick)
+Test the compiled whitelist/blacklist matcher and its cache invalidation
+"""
+
+import os
+import sys
+import tempfile
+
+# إضافة المسار الحالي إلى Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from database.settings_cache import settings_cache
+from database.word_filter import AhoCorasick, WordFilterMatcher, normalize_text
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    """إيجاد الأنماط المتداخلة بمرور واحد"""
+    print("🔍 اختبار آلة Aho-Corasick")
+
+    automaton = AhoCorasick([(p, p) for p in ('he', 'she', 'his', 'hers')])
+    assert automaton.search('ushers') == 'she'
+    assert automaton.search('ahis') == 'his'
+    assert automaton.search('xyz') is None
+
+    # suffix output: 'abcd' fails over to 'bc'
+    automaton = AhoCorasick([('abcx', 'abcx'), ('bc', 'bc')])
+    assert automaton.search('abcd') == 'bc'
+    print("✅ الآلة تعمل")
+
+
+def test_case_and_arabic_normalization():
+    """الحساسية لحالة الأحرف وتطبيع العربية"""
+    print("🔍 اختبار التطبيع")
+
+    matcher = WordFilterMatcher([
+        (1, 1, 'إعلان', False),
+        (2, 1, 'SPAM', True),
+        (3, 1, 'Promo Code', False),
+    ])
+    assert normalize_text('أحمد') == 'احمد'
+    assert matcher.search('هذا اعلان مدفوع') == 'إعلان'
+    assert matcher.search('هذا إعْـــلان') == 'إعلان'
+    assert matcher.search('use PROMO code now') == 'Promo Code'
+    assert matcher.search('this is SPAM') == 'SPAM'
+    assert matcher.search('this is spam') is None
+    print("✅ التطبيع يعمل")
+
+
+def _create_db():
+    temp_dir = tempfile.mkdtemp()
+    db = Database(os.path.join(temp_dir, 'word_filter_test.db'))
+    task_id = db.create_task(1, '-1001111111111', 'مصدر', '-1002222222222', 'هدف')
+    settings_cache.clear()
+    return db, task_id
+
+
+def test_database_filter_reports_phrase():
+    """قاعدة البيانات تعيد العبارة المطابقة وتعيد البناء بعد التعديل"""
+    print("🔍 اختبار فلتر الكلمات في قاعدة البيانات")
+    db, task_id = _create_db()
+
+    db.set_word_filter_status(task_id, 'blacklist', True)
+    db.add_multiple_filter_words(task_id, 'blacklist', [f'كلمة{i}' for i in range(2000)] + ['قمار'])
+    assert db.check_word_filter(task_id, 'موقع قمار جديد') == (False, 'قمار')
+    assert db.is_message_allowed_by_word_filter(task_id, 'رسالة عادية')
+
+    # compiled matcher is reused until the list changes
+    snapshot = settings_cache.get(db, task_id)
+    assert settings_cache.get(db, task_id) is snapshot
+
+    db.remove_word_from_filter(task_id, 'blacklist', 'قمار')
+    assert db.check_word_filter(task_id, 'موقع قمار جديد') == (True, None)
+
+    db.set_word_filter_status(task_id, 'whitelist', True)
+    db.add_word_to_filter(task_id, 'whitelist', 'عاجل')
+    assert db.check_word_filter(task_id, 'خبر عاجل') == (True, 'عاجل')
+    assert not db.is_message_allowed_by_word_filter(task_id, 'خبر عادي')
+    print("✅ فلتر الكلمات يعمل مع الذاكرة المؤقتة")
+
+
+if __name__ == "__main__":
+    print("🔤 اختبار مطابقة فلتر الكلمات")
+    print("=" * 50)
+
+    test_aho_corasick_finds_overlapping_patterns()
+    test_case_and_arabic_normalization()
+    test_database_filter_reports_phrase()
+
+    print("\n🎉 تم الانتهاء من اختبار فلتر الكلمات!")
@@ -0,0 +1,326 @@
+"""
+Near-duplicate index for the duplicate filter - فهرس كشف الرسائل المتشابهة
+
+بدلاً من تحميل كل رسائل النافذة الزمنية من قاعدة البيانات ومقارنتها واحدة واحدة،
+يحتفظ كل مهمة بفهرس MinHash/LSH في الذاكرة:
+- توقيع MinHash لمجموعة كلمات النص (نفس مقياس Jaccard المستخدم سابقاً)
+- تقسيم التوقيع إلى أشرطة (LSH bands) بحيث تقارن الرسالة فقط مع المرشحين
+  الذين يشاركونها شريطاً واحداً على الأقل، ثم يتم التحقق بنسبة Jaccard الدقيقة
+- التوقيعات تحفظ بشكل مضغوط في عمود text_signature في جدول message_duplicates
+  لإعادة بناء الفهرس بعد إعادة التشغيل دون إعادة حسابها
+- البصمات الإدراكية للوسائط (اختيارية) تحفظ في عمود media_phash وتبحث بمسافة Hamming
+"""
+import hashlib
+import logging
+import os
+import random
+import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from perceptual_hash import HammingIndex, PERCEPTUAL_HASH_DISTANCE, to_signed, to_unsigned
+
+logger = logging.getLogger(__name__)
+
+MINHASH_PERMUTATIONS = int(os.getenv('DUPLICATE_MINHASH_PERMUTATIONS', '128'))
+# Below this threshold LSH would need tiny bands; scan the in-memory entries instead
+MIN_LSH_THRESHOLD = 0.2
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = 0xFFFFFFFF
+
+# Fixed seed: signatures are persisted and must stay comparable across restarts
+_rng = random.Random(0x5EED)
+_PERMUTATIONS: List[Tuple[int, int]] = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(1024)
+]
+
+
+def text_words(text: str) -> FrozenSet[str]:
+    """Word set used for similarity (same tokenization as before)"""
+    return frozenset(text.lower().split())
+
+
+def _token_hash(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+
+
+def minhash_signature(words: FrozenSet[str], num_perm: int = MINHASH_PERMUTATIONS) -> Tuple[int, ...]:
+    """MinHash signature of a word set"""
+    if not words:
+        return ()
+    hashes = [_token_hash(word) for word in words]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS[:num_perm]
+    )
+
+
+@lru_cache(maxsize=256)
+def text_signature(text: str, num_perm: int = MINHASH_PERMUTATIONS) -> Tuple[FrozenSet[str], Tuple[int, ...]]:
+    """(words, signature) for a message text; cached because the same message is checked per task"""
+    words = text_words(text)
+    return words, minhash_signature(words, num_perm)
+
+
+def pack_signature(signature: Tuple[int, ...]) -> Optional[bytes]:
+    """Compact BLOB form (4 bytes per permutation)"""
+    if not signature:
+        return None
+    return array('I', signature).tobytes()
+
+
+def unpack_signature(blob) -> Tuple[int, ...]:
+    if not blob:
+        return ()
+    values = array('I')
+    values.frombytes(bytes(blob))
+    return tuple(values)
+
+
+def jaccard(words1: FrozenSet[str], words2: FrozenSet[str]) -> float:
+    if not words1 or not words2:
+        return 0.0
+    intersection = len(words1 & words2)
+    return intersection / (len(words1) + len(words2) - intersection)
+
+
+@lru_cache(maxsize=128)
+def lsh_params(threshold: float, num_perm: int = MINHASH_PERMUTATIONS) -> Tuple[int, int]:
+    """Pick (bands, rows) minimizing weighted false positive/negative probability around the threshold
+
+    Missed duplicates weigh more than extra candidates, since candidates are
+    verified with the exact Jaccard similarity anyway.
+    """
+    def area(probability, start, end, steps=50):
+        width = (end - start) / steps
+        return sum(probability(start + (i + 0.5) * width) for i in range(steps)) * width
+
+    best, best_error = (num_perm, 1), None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if bands < 1:
+            break
+        false_positive = area(lambda s: 1 - (1 - s ** rows) ** bands, 0.0, threshold)
+        false_negative = area(lambda s: (1 - s ** rows) ** bands, threshold, 1.0)
+        error = 0.25 * false_positive + 0.75 * false_negative
+        if best_error is None or error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class DuplicateEntry:
+    """One stored message in the index"""
+
+    __slots__ = ('entry_id', 'timestamp', 'words', 'signature', 'media_hash', 'media_phash')
+
+    def __init__(self, entry_id: int, timestamp: int, words: FrozenSet[str],
+                 signature: Tuple[int, ...], media_hash: str, media_phash: Optional[int] = None):
+        self.entry_id = entry_id
+        self.timestamp = timestamp
+        self.words = words
+        self.signature = signature
+        self.media_hash = media_hash
+        self.media_phash = media_phash
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index of one task's recent messages, ordered by timestamp"""
+
+    def __init__(self, threshold: float, window_seconds: int, num_perm: int = MINHASH_PERMUTATIONS,
+                 phash_distance: int = PERCEPTUAL_HASH_DISTANCE):
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.num_perm = num_perm
+        self.use_lsh = threshold >= MIN_LSH_THRESHOLD
+        self.bands, self.rows = lsh_params(round(threshold, 2), num_perm) if self.use_lsh else (0, 0)
+        self._entries: 'OrderedDict[int, DuplicateEntry]' = OrderedDict()
+        self._buckets: List[Dict[Tuple[int, ...], Set[int]]] = [{} for _ in range(self.bands)]
+        self._media: Dict[str, Set[int]] = {}
+        self._phashes = HammingIndex(phash_distance)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, signature[start:start + self.rows]
+
+    def add(self, entry_id: int, timestamp: int, words: FrozenSet[str],
+            signature: Tuple[int, ...], media_hash: str = '', media_phash: Optional[int] = None):
+        entry = DuplicateEntry(entry_id, timestamp, words, signature, media_hash, media_phash)
+        self._entries[entry_id] = entry
+        if self.use_lsh and len(signature) == self.num_perm:
+            for band, key in self._band_keys(signature):
+                self._buckets[band].setdefault(key, set()).add(entry_id)
+        if media_hash:
+            self._media.setdefault(media_hash, set()).add(entry_id)
+        if media_phash is not None:
+            self._phashes.add(entry_id, media_phash)
+
+    def _remove(self, entry: DuplicateEntry):
+        if self.use_lsh and len(entry.signature) == self.num_perm:
+            for band, key in self._band_keys(entry.signature):
+                bucket = self._buckets[band].get(key)
+                if bucket is not None:
+                    bucket.discard(entry.entry_id)
+                    if not bucket:
+                        del self._buckets[band][key]
+        if entry.media_hash:
+            ids = self._media.get(entry.media_hash)
+            if ids is not None:
+                ids.discard(entry.entry_id)
+                if not ids:
+                    del self._media[entry.media_hash]
+        if entry.media_phash is not None:
+            self._phashes.remove(entry.entry_id)
+
+    def touch(self, entry_id: int, timestamp: int):
+        """A duplicate was found: refresh its timestamp (keeps the timestamp order)"""
+        entry = self._entries.get(entry_id)
+        if entry is not None:
+            entry.timestamp = timestamp
+            self._entries.move_to_end(entry_id)
+
+    def expire(self, cutoff: int) -> int:
+        """Drop entries at or before the cutoff"""
+        removed = 0
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if entry.timestamp > cutoff:
+                break
+            self._entries.popitem(last=False)
+            self._remove(entry)
+            removed += 1
+        return removed
+
+    def find_text(self, words: FrozenSet[str], signature: Tuple[int, ...]) -> Optional[Tuple[int, float]]:
+        """Best stored entry with Jaccard similarity >= threshold, as (entry_id, similarity)"""
+        if not words:
+            return None
+        if self.use_lsh and len(signature) == self.num_perm:
+            candidates: Set[int] = set()
+            for band, key in self._band_keys(signature):
+                bucket = self._buckets[band].get(key)
+                if bucket:
+                    candidates.update(bucket)
+        else:
+            candidates = set(self._entries)
+
+        best = None
+        for entry_id in candidates:
+            entry = self._entries.get(entry_id)
+            if entry is None or not entry.words:
+                continue
+            similarity = jaccard(words, entry.words)
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (entry_id, similarity)
+        return best
+
+    def find_media(self, media_hash: str) -> Optional[int]:
+        ids = self._media.get(media_hash) if media_hash else None
+        if not ids:
+            return None
+        return max(ids, key=lambda entry_id: self._entries[entry_id].timestamp)
+
+    def find_phash(self, media_phash: Optional[int]) -> Optional[Tuple[int, int]]:
+        """Nearest stored media within the Hamming distance, as (entry_id, distance)"""
+        if media_phash is None:
+            return None
+        matches = self._phashes.search(media_phash)
+        return matches[0] if matches else None
+
+
+class DuplicateIndexManager:
+    """Per-task near-duplicate indexes backed by the message_duplicates table"""
+
+    def __init__(self, db, num_perm: int = MINHASH_PERMUTATIONS):
+        self.db = db
+        self.num_perm = num_perm
+        self._indexes: Dict[int, NearDuplicateIndex] = {}
+
+    def forget(self, task_id: int = None):
+        if task_id is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(task_id, None)
+
+    def _load(self, task_id: int, threshold: float, window_seconds: int, now: int) -> NearDuplicateIndex:
+        index = NearDuplicateIndex(threshold, window_seconds, self.num_perm)
+        rows = self.db.get_recent_messages_for_duplicate_check(task_id, now - window_seconds)
+        backfill = []
+        # rows come newest first; the index keeps timestamp order
+        for row in reversed(rows):
+            text = row.get('message_text') or ''
+            words = text_words(text)
+            signature = unpack_signature(row.get('text_signature'))
+            if words and len(signature) != self.num_perm:
+                signature = minhash_signature(words, self.num_perm)
+                backfill.append((pack_signature(signature), row['id']))
+            media_phash = row.get('media_phash')
+            index.add(row['id'], row['timestamp'], words, signature, row.get('media_hash') or '',
+                      to_unsigned(media_phash) if media_phash is not None else None)
+
+        if backfill:
+            self.db.update_duplicate_signatures(backfill)
+        logger.info(f"🗂️ تم بناء فهرس التكرار للمهمة {task_id}: {len(index)} رسالة، "
+                    f"LSH={index.bands}×{index.rows}، حسابات توقيع جديدة={len(backfill)}")
+        return index
+
+    def get_index(self, task_id: int, threshold: float, window_seconds: int, now: int) -> NearDuplicateIndex:
+        index = self._indexes.get(task_id)
+        # A wider window needs rows that were already expired from memory
+        if index is None or index.threshold != threshold or index.window_seconds < window_seconds:
+            index = self._load(task_id, threshold, window_seconds, now)
+            self._indexes[task_id] = index
+        index.window_seconds = window_seconds
+        index.expire(now - window_seconds)
+        return index
+
+    def check_and_store(self, task_id: int, message_text: str, media_hash: str, media_type: str,
+                        threshold: float, window_hours: int, check_text: bool, check_media: bool,
+                        now: int = None, media_phash: Optional[int] = None) -> Optional[Dict]:
+        """Return the matched duplicate (and refresh it), or store the message and return None"""
+        now = int(now if now is not None else time.time())
+        index = self.get_index(task_id, threshold, int(window_hours * 3600), now)
+
+        words, signature = text_signature(message_text, self.num_perm) if message_text else (frozenset(), ())
+
+        match = None
+        if check_text and words:
+            found = index.find_text(words, signature)
+            if found:
+                match = {'id': found[0], 'reason': 'text', 'similarity': found[1]}
+        if match is None and check_media and media_hash:
+            found = index.find_media(media_hash)
+            if found is not None:
+                match = {'id': found, 'reason': 'media', 'similarity': 1.0}
+        if match is None and check_media and media_phash is not None:
+            found = index.find_phash(media_phash)
+            if found is not None:
+                match = {'id': found[0], 'reason': 'phash', 'similarity': 1.0 - found[1] / 64, 'distance': found[1]}
+
+        if match is not None:
+            self.db.update_message_timestamp_for_duplicate(match['id'], now)
+            index.touch(match['id'], now)
+            return match
+
+        entry_id = self.db.store_message_for_duplicate_check(
+            task_id=task_id,
+            message_text=message_text,
+            media_hash=media_hash or "",
+            media_type=media_type or "",
+            timestamp=now,
+            text_signature=pack_signature(signature),
+            media_phash=to_signed(media_phash) if media_phash is not None else None
+        )
+        if entry_id is not None:
+            index.add(entry_id, now, words, signature, media_hash or '', media_phash)
+        return None
+
+    def get_stats(self) -> Dict[int, int]:
+        return {task_id: len(index) for task_id, index in self._indexes.items()}
@@ -0,0 +1,228 @@
+"""
+Entity / InputPeer cache per client - ذاكرة مؤقتة لكيانات المحادثات لكل عميل
+
+كل توجيه كان يستدعي client.get_entity() للهدف فقط لتسجيل اسمه، وكذلك مزامنة
+التعديل والحذف والألبومات والموافقة اليدوية. هنا يتم حل كل محادثة مرة واحدة
+لكل عميل والاحتفاظ بـ InputPeer واسم المحادثة ونوعها لمدة ENTITY_CACHE_TTL:
+- التسخين المسبق من قائمة المهام في refresh_user_tasks
+- الإدخال المنتهي يعاد مباشرة ويتم تحديثه في الخلفية (الإرسال لا ينتظر الحل)
+- الحفظ في جدول entity_cache (peer_id + access_hash) ليستمر بعد إعادة التشغيل
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Hashable, Iterable, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+ENTITY_CACHE_TTL = float(os.getenv('USERBOT_ENTITY_CACHE_TTL', str(6 * 3600)))
+
+ChatRef = Union[int, str]
+
+
+def chat_key(chat: ChatRef) -> str:
+    """Normalized cache key: numeric id as text or lower-case @username"""
+    if isinstance(chat, str):
+        chat = chat.strip()
+        if chat.startswith('@'):
+            return chat.lower()
+        try:
+            return str(int(chat))
+        except ValueError:
+            return chat.lower()
+    return str(chat)
+
+
+def lookup_ref(chat: ChatRef) -> ChatRef:
+    """What get_entity() expects: int for numeric ids (a digit string is read as a phone)"""
+    key = chat_key(chat)
+    try:
+        return int(key)
+    except ValueError:
+        return key
+
+
+def chat_type(entity) -> str:
+    """Chat type of a Telethon entity: channel, group or user"""
+    if getattr(entity, 'broadcast', False):
+        return 'channel'
+    if getattr(entity, 'megagroup', False) or hasattr(entity, 'title'):
+        return 'group'
+    return 'user'
+
+
+def chat_title(entity, default: str) -> str:
+    return getattr(entity, 'title', None) or getattr(entity, 'first_name', None) or default
+
+
+def peer_fields(input_peer) -> Optional[Tuple[str, int, Optional[int]]]:
+    """(peer_type, peer_id, access_hash) of an InputPeer, None if it cannot be stored"""
+    for peer_type, attribute in (('channel', 'channel_id'), ('chat', 'chat_id'), ('user', 'user_id')):
+        peer_id = getattr(input_peer, attribute, None)
+        if peer_id is not None:
+            access_hash = getattr(input_peer, 'access_hash', None)
+            if peer_type != 'chat' and access_hash is None:
+                return None  # e.g. InputPeerUserFromMessage: only valid with its message
+            return peer_type, peer_id, access_hash
+    return None
+
+
+def marked_id(input_peer) -> Optional[int]:
+    """Bot API style chat id of an InputPeer (-100... channels, -... basic groups)"""
+    fields = peer_fields(input_peer)
+    if fields is None:
+        return None
+    peer_type, peer_id, _ = fields
+    if peer_type == 'channel':
+        return -(10 ** 12 + peer_id)
+    return -peer_id if peer_type == 'chat' else peer_id
+
+
+def build_input_peer(peer_type: str, peer_id: int, access_hash: Optional[int]):
+    """InputPeer from stored fields (no network round-trip needed to use it)"""
+    from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+    if peer_type == 'channel':
+        return InputPeerChannel(peer_id, access_hash)
+    if peer_type == 'chat':
+        return InputPeerChat(peer_id)
+    return InputPeerUser(peer_id, access_hash)
+
+
+class CachedEntity:
+    """Resolved chat: InputPeer to send to, plus title and type for logs and send pacing"""
+
+    __slots__ = ('input_peer', 'title', 'chat_type', 'resolved_at')
+
+    def __init__(self, input_peer, title: str, chat_type: str, resolved_at: float):
+        self.input_peer = input_peer
+        self.title = title
+        self.chat_type = chat_type
+        self.resolved_at = resolved_at
+
+    @property
+    def chat_id(self) -> Optional[int]:
+        """Numeric chat id, also for chats configured by @username"""
+        return marked_id(self.input_peer)
+
+
+class EntityCache:
+    """(client, chat) -> CachedEntity with TTL, background refresh and DB persistence"""
+
+    def __init__(self, db=None, ttl: float = ENTITY_CACHE_TTL):
+        self.db = db
+        self.ttl = ttl
+        self._entries: Dict[Tuple[Hashable, str], CachedEntity] = {}
+        self._loaded: set = set()
+        self._refreshing: Dict[Tuple[Hashable, str], asyncio.Task] = {}
+        self._prewarm_tasks: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, client_key: Hashable):
+        """Load the entities saved for this client by a previous run (once)"""
+        if client_key in self._loaded or self.db is None:
+            return
+        self._loaded.add(client_key)
+        try:
+            for row in self.db.get_cached_entities(client_key):
+                input_peer = build_input_peer(row['peer_type'], row['peer_id'], row['access_hash'])
+                self._remember(client_key, row['chat_key'], CachedEntity(
+                    input_peer, row['title'], row['chat_type'], row['resolved_at']))
+        except Exception as e:
+            logger.error(f"خطأ في تحميل ذاكرة الكيانات للمستخدم {client_key}: {e}")
+
+    def get(self, client_key: Hashable, chat: ChatRef) -> Optional[CachedEntity]:
+        """Cached entry (fresh or stale) without resolving"""
+        self.load(client_key)
+        return self._entries.get((client_key, chat_key(chat)))
+
+    async def resolve(self, client_key: Hashable, client, chat: ChatRef) -> CachedEntity:
+        """Cached entity; resolves on the first use and refreshes stale entries in the background"""
+        key = (client_key, chat_key(chat))
+        entry = self.get(client_key, chat)
+        if entry is not None:
+            self.hits += 1
+            if time.time() - entry.resolved_at > self.ttl and key not in self._refreshing:
+                refresh = asyncio.ensure_future(self._refresh(client_key, client, chat, entry))
+                self._refreshing[key] = refresh
+                refresh.add_done_callback(lambda _: self._refreshing.pop(key, None))
+            return entry
+
+        self.misses += 1
+        return await self._fetch(client_key, client, chat, lookup_ref(chat))
+
+    async def _refresh(self, client_key: Hashable, client, chat: ChatRef, entry: CachedEntity):
+        try:
+            await self._fetch(client_key, client, chat, entry.input_peer)
+        except Exception as e:
+            logger.warning(f"⚠️ فشل تحديث كيان المحادثة {chat}: {e} - استخدام النسخة المحفوظة")
+
+    async def _fetch(self, client_key: Hashable, client, chat: ChatRef, lookup) -> CachedEntity:
+        entity = await client.get_entity(lookup)
+        input_peer = await client.get_input_entity(entity)
+        entry = CachedEntity(input_peer, chat_title(entity, str(chat)), chat_type(entity), time.time())
+        self._remember(client_key, chat_key(chat), entry)
+        self._save(client_key, chat, entry)
+        return entry
+
+    def _remember(self, client_key: Hashable, key: str, entry: CachedEntity):
+        self._entries[(client_key, key)] = entry
+        if entry.chat_id is not None:
+            # @username chats are also found by their numeric id (message mappings store ids)
+            self._entries[(client_key, str(entry.chat_id))] = entry
+
+    def _save(self, client_key: Hashable, chat: ChatRef, entry: CachedEntity):
+        fields = peer_fields(entry.input_peer)
+        if self.db is None or fields is None:
+            return
+        try:
+            self.db.save_cached_entity(client_key, chat_key(chat), *fields,
+                                       entry.title, entry.chat_type, entry.resolved_at)
+        except Exception as e:
+            logger.error(f"خطأ في حفظ كيان المحادثة {chat}: {e}")
+
+    def invalidate(self, client_key: Hashable, chat: ChatRef):
+        """Drop an entry that Telegram rejected (left chat, changed access hash...)"""
+        key = chat_key(chat)
+        if self._entries.pop((client_key, key), None) is not None and self.db is not None:
+            try:
+                self.db.delete_cached_entity(client_key, key)
+            except Exception as e:
+                logger.error(f"خطأ في حذف كيان المحادثة {chat}: {e}")
+
+    async def prewarm(self, client_key: Hashable, client, chats: Iterable[ChatRef]):
+        """Resolve every chat that is not cached yet (one at a time to stay clear of flood limits)"""
+        self.load(client_key)
+        resolved = 0
+        for chat in dict.fromkeys(chat_key(chat) for chat in chats if chat):
+            if (client_key, chat) in self._entries:
+                continue
+            try:
+                await self._fetch(client_key, client, chat, lookup_ref(chat))
+                resolved += 1
+            except Exception as e:
+                logger.warning(f"⚠️ لا يمكن حل المحادثة {chat} مسبقاً: {e}")
+        if resolved:
+            logger.info(f"🔥 تم تسخين {resolved} كيان محادثة للمستخدم {client_key}")
+
+    def schedule_prewarm(self, client_key: Hashable, client, chats: Iterable[ChatRef]) -> asyncio.Task:
+        """Prewarm in the background, replacing a prewarm still running for this client"""
+        previous = self._prewarm_tasks.get(client_key)
+        if previous is not None and not previous.done():
+            previous.cancel()
+        task = asyncio.ensure_future(self.prewarm(client_key, client, list(chats)))
+        self._prewarm_tasks[client_key] = task
+        return task
+
+    def forget_client(self, client_key: Hashable):
+        """Stop background work for a client that disconnected (saved rows stay)"""
+        task = self._prewarm_tasks.pop(client_key, None)
+        if task is not None and not task.done():
+            task.cancel()
+        for key in [key for key in self._entries if key[0] == client_key]:
+            del self._entries[key]
+        self._loaded.discard(client_key)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'entities': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,115 @@
+"""
+Forward-mode batching - تجميع رسائل وضع التوجيه في استدعاء واحد
+
+في وضع التوجيه بدون أي تعديل على النص، تجمع الرسائل التي تصل من نفس المصدر
+إلى نفس الهدف خلال FORWARD_BATCH_WINDOW ثانية ثم ترسل باستدعاء واحد
+client.forward_messages(target, [ids...]) بدلاً من استدعاء لكل رسالة.
+- الدفعة ترسل في الخلفية فلا يتوقف طابور المصدر أثناء نافذة التجميع
+- دفعات نفس المفتاح ترسل بالترتيب، و flush() يرسل الدفعات المعلقة قبل أي إرسال آخر للهدف
+- الحد الأقصى FORWARD_BATCH_MAX رسالة لكل استدعاء (حد Telegram)
+- الوسائط التي يرسلها مسار التوجيه كنسخة (حذف التعليق أو تقسيم الألبوم) لا تجمع
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for more messages from the same source (0 disables batching)
+FORWARD_BATCH_WINDOW = float(os.getenv('USERBOT_FORWARD_BATCH_WINDOW', '0.5'))
+# forwardMessages accepts at most 100 ids
+FORWARD_BATCH_MAX = min(100, int(os.getenv('USERBOT_FORWARD_BATCH_MAX', '100')))
+
+BatchSender = Callable[[List[int]], Awaitable]
+
+
+def media_copy_flags(message, text_cleaning_settings: Optional[dict], forwarding_settings: dict) -> Tuple[bool, bool]:
+    """(needs_copy_for_caption, needs_copy_for_album): media the forward path re-sends as a copy"""
+    if not getattr(message, 'media', None):
+        return False, False
+    return (bool(text_cleaning_settings and text_cleaning_settings.get('remove_caption', False)),
+            bool(forwarding_settings.get('split_album_enabled', False)))
+
+
+def can_batch(message, forward_mode: str, requires_copy_mode: bool, text_cleaning_settings: Optional[dict],
+              forwarding_settings: dict, sending_interval: float = 0) -> bool:
+    """Only pure forwards are batched: anything the send path copies, groups or paces goes alone"""
+    if requires_copy_mode or forward_mode == 'copy' or sending_interval or getattr(message, 'grouped_id', None):
+        return False
+    return not any(media_copy_flags(message, text_cleaning_settings, forwarding_settings))
+
+
+class ForwardBatcher:
+    """Coalesce message ids per key and send each batch with one call"""
+
+    def __init__(self, window: float = FORWARD_BATCH_WINDOW, max_size: int = FORWARD_BATCH_MAX):
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._batches: Dict[Hashable, List[int]] = {}
+        self._senders: Dict[Hashable, BatchSender] = {}
+        self._timers: Dict[Hashable, asyncio.Task] = {}
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.batches_sent = 0
+        self.messages_batched = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(self, key: Hashable, message_id: int, send: BatchSender):
+        """Queue a message id; `send(ids)` of the first message in the window sends the batch"""
+        ids = self._batches.get(key)
+        if ids is None:
+            ids = self._batches[key] = []
+            self._senders[key] = send
+            self._timers[key] = asyncio.ensure_future(self._flush_later(key))
+        ids.append(message_id)
+        self.messages_batched += 1
+        if len(ids) >= self.max_size:
+            self._start(key)
+
+    async def _flush_later(self, key: Hashable):
+        await asyncio.sleep(self.window)
+        if self._timers.get(key) is asyncio.current_task():
+            del self._timers[key]
+        self._start(key)
+
+    def _start(self, key: Hashable):
+        """Hand the pending batch to a send task that runs after the previous batch of the key"""
+        ids = self._batches.pop(key, None)
+        send = self._senders.pop(key, None)
+        timer = self._timers.pop(key, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        if not ids:
+            return
+
+        task = asyncio.ensure_future(self._send(self._inflight.get(key), ids, send))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._inflight.pop(key, None) if self._inflight.get(key) is done else None)
+
+    async def _send(self, previous: Optional[asyncio.Task], ids: List[int], send: BatchSender):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            await send(ids)
+            self.batches_sent += 1
+        except Exception as e:
+            logger.error(f"❌ خطأ في إرسال دفعة التوجيه ({len(ids)} رسالة): {e}")
+
+    async def flush(self, match: Optional[Callable[[Hashable], bool]] = None):
+        """Send the pending batches (all, or those whose key matches) now and wait for them"""
+        for key in [key for key in list(self._batches) if match is None or match(key)]:
+            self._start(key)
+        tasks = [task for key, task in list(self._inflight.items()) if match is None or match(key)]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            'pending_batches': len(self._batches),
+            'batches_sent': self.batches_sent,
+            'messages_batched': self.messages_batched,
+            'api_calls_saved': max(0, self.messages_batched - self.batches_sent - len(self._batches)),
+        }
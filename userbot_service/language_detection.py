@@ -0,0 +1,251 @@
+"""
+Fast script-based language detection - كشف لغة الرسالة
+
+يصنف النص بمرور واحد (تعبير نمطي واحد يعد أطوال مقاطع كل نظام كتابة)
+ثم يميز اللغات التي تشترك في نفس الكتابة:
+- العربية / الفارسية / الأردية حسب نسبة الكلمات التي تحتوي الحروف الخاصة
+- الصينية / اليابانية حسب وجود الكانا
+- اللغات اللاتينية (en, es, fr, de, it, pt, tr) حسب الحروف المميزة والكلمات الشائعة
+  أو نموذج n-gram اختياري
+
+Supports the languages offered by the language filter UI:
+ar, en, es, fr, de, ru, zh, ja, ko, it, pt, hi, tr, fa, ur.
+Results are cached per text so checking the same message against many
+tasks costs one detection.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON file with trained trigram profiles (see NGramLanguageModel.save)
+LANGUAGE_NGRAM_MODEL = os.getenv('LANGUAGE_NGRAM_MODEL', '')
+LANGUAGE_CACHE_SIZE = int(os.getenv('LANGUAGE_CACHE_SIZE', '4096'))
+
+SUPPORTED_LANGUAGES = ('ar', 'en', 'es', 'fr', 'de', 'ru', 'zh', 'ja', 'ko', 'it', 'pt', 'hi', 'tr', 'fa', 'ur')
+
+# One pass over the text: each match is a run of letters of one script
+_SCRIPT_PATTERN = re.compile(
+    r'(?P<arabic>[؀-ۿݐ-ݿࢠ-ࣿﭐ-﷿ﹰ-﻿]+)'
+    r'|(?P<latin>[A-Za-zÀ-ɏḀ-ỿ]+)'
+    r'|(?P<cyrillic>[Ѐ-ӿ]+)'
+    r'|(?P<kana>[぀-ヿㇰ-ㇿ]+)'
+    r'|(?P<han>[一-鿿㐀-䶿]+)'
+    r'|(?P<hangul>[가-힯ᄀ-ᇿ㄰-㆏]+)'
+    r'|(?P<devanagari>[ऀ-ॿ]+)'
+    r'|(?P<other>[^\W\d_]+)'
+)
+
+_SCRIPT_LANGUAGE = {
+    'cyrillic': 'ru',
+    'hangul': 'ko',
+    'devanagari': 'hi',
+}
+
+# Letters that only appear in Urdu / Persian among the Arabic-script languages
+_URDU_LETTERS = re.compile('[ٹڈڑںھہےۓ]')
+_PERSIAN_LETTERS = re.compile('[پچژکگی]')
+# A loanword such as "گوگل" in Arabic text is not enough: these letters must show
+# up in at least this many words, making up at least this share of the words
+ARABIC_VARIANT_MIN_WORDS = 2
+ARABIC_VARIANT_WORD_SHARE = 0.15
+
+_LATIN_WORDS = re.compile(r'[a-zß-ɏ]+')
+
+# Distinctive letters per Latin-script language (weighted more than words)
+_LATIN_LETTERS: Dict[str, str] = {
+    'es': 'ñ¿¡',
+    'fr': 'œêëîûùÿ',
+    'de': 'ßä',
+    'it': 'ìò',
+    'pt': 'ãõ',
+    'tr': 'ğışİ',
+}
+
+_LATIN_STOPWORDS: Dict[str, frozenset] = {
+    'en': frozenset('the and is are was were to of in on at for with this that you it be have from'.split()),
+    'es': frozenset('el la los las de que y en un una es por para con no se del al lo como más pero'.split()),
+    'fr': frozenset('le la les de des et est un une du en que qui pour pas dans sur au avec ce il je'.split()),
+    'de': frozenset('der die das und ist nicht ein eine zu den mit von sich auf für im dem des auch ich'.split()),
+    'it': frozenset('il lo la gli le di che e è un una per non con del della sono nel alla ma anche'.split()),
+    'pt': frozenset('o a os as de que e é um uma do da em para com não no na por mais se dos'.split()),
+    'tr': frozenset('ve bir bu da de için ile çok ne mi gibi daha olarak ama var sonra kadar ben'.split()),
+}
+
+# Minimum share of the letters a script needs to decide the language
+SCRIPT_THRESHOLD = 0.3
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+class NGramLanguageModel:
+    """Optional character trigram model used to separate Latin-script languages
+
+    Train it with sample texts per language; detection then picks the
+    language whose trigram profile gives the highest log-likelihood.
+    """
+
+    def __init__(self, n: int = 3):
+        self.n = n
+        self._profiles: Dict[str, Dict[str, float]] = {}
+        self._floor: Dict[str, float] = {}
+
+    def _grams(self, text: str) -> Iterable[str]:
+        for word in _LATIN_WORDS.findall(text.lower()):
+            padded = f' {word} '
+            for i in range(len(padded) - self.n + 1):
+                yield padded[i:i + self.n]
+
+    def train(self, language: str, texts: Iterable[str]):
+        counts = Counter()
+        for text in texts:
+            counts.update(self._grams(text))
+        total = sum(counts.values()) + len(counts) + 1
+        self._profiles[language] = {gram: math.log((count + 1) / total) for gram, count in counts.items()}
+        self._floor[language] = math.log(1 / total)
+
+    @property
+    def languages(self):
+        return tuple(self._profiles)
+
+    def classify(self, text: str) -> Optional[str]:
+        grams = list(self._grams(text))
+        if not grams or not self._profiles:
+            return None
+        scores = {
+            language: sum(profile.get(gram, self._floor[language]) for gram in grams)
+            for language, profile in self._profiles.items()
+        }
+        return max(scores, key=scores.get)
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'n': self.n, 'profiles': self._profiles, 'floor': self._floor}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> 'NGramLanguageModel':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        model = cls(data['n'])
+        model._profiles = data['profiles']
+        model._floor = data['floor']
+        return model
+
+
+class LanguageDetector:
+    """Script classifier with an LRU cache keyed by text hash"""
+
+    def __init__(self, ngram_model: Optional[NGramLanguageModel] = None, cache_size: int = LANGUAGE_CACHE_SIZE):
+        self.ngram_model = ngram_model
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def detect(self, text: str) -> str:
+        """ISO code of the dominant language, or 'unknown'"""
+        if not text:
+            return 'unknown'
+        key = text_hash(text)
+        with self._lock:
+            language = self._cache.get(key)
+            if language is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return language
+            self.misses += 1
+
+        language = self._classify(text)
+
+        with self._lock:
+            self._cache[key] = language
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return language
+
+    def _classify(self, text: str) -> str:
+        counts: Dict[str, int] = {}
+        arabic_words: List[str] = []
+        for match in _SCRIPT_PATTERN.finditer(text):
+            script = match.lastgroup
+            counts[script] = counts.get(script, 0) + match.end() - match.start()
+            if script == 'arabic':
+                arabic_words.append(match.group())
+
+        total = sum(counts.values())
+        if not total:
+            return 'unknown'
+
+        script = max(counts, key=counts.get)
+        if script == 'other' or counts[script] / total <= SCRIPT_THRESHOLD:
+            return 'unknown'
+
+        if script == 'arabic':
+            return self._classify_arabic(arabic_words)
+        if script in ('han', 'kana'):
+            # Japanese mixes kanji with kana; Chinese has no kana
+            return 'ja' if 'kana' in counts else 'zh'
+        if script == 'latin':
+            return self._classify_latin(text)
+        return _SCRIPT_LANGUAGE.get(script, 'unknown')
+
+    @staticmethod
+    def _classify_arabic(words: List[str]) -> str:
+        # Urdu text also uses the Persian letters, so it is checked first
+        for language, letters in (('ur', _URDU_LETTERS), ('fa', _PERSIAN_LETTERS)):
+            marked = sum(1 for word in words if letters.search(word))
+            if marked >= ARABIC_VARIANT_MIN_WORDS and marked / len(words) >= ARABIC_VARIANT_WORD_SHARE:
+                return language
+        return 'ar'
+
+    def _classify_latin(self, text: str) -> str:
+        if self.ngram_model is not None:
+            language = self.ngram_model.classify(text)
+            if language:
+                return language
+
+        lowered = text.lower()
+        scores = Counter()
+        for language, letters in _LATIN_LETTERS.items():
+            found = sum(lowered.count(letter) for letter in letters)
+            if found:
+                scores[language] += 3 * found
+        for word in _LATIN_WORDS.findall(lowered):
+            for language, stopwords in _LATIN_STOPWORDS.items():
+                if word in stopwords:
+                    scores[language] += 1
+
+        if not scores:
+            return 'en'  # Default to English for Latin script
+        best, best_score = scores.most_common(1)[0]
+        # Ties with English keep the previous default
+        return 'en' if scores.get('en', 0) == best_score else best
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'cached_texts': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+def _load_default_model() -> Optional[NGramLanguageModel]:
+    if not LANGUAGE_NGRAM_MODEL:
+        return None
+    try:
+        model = NGramLanguageModel.load(LANGUAGE_NGRAM_MODEL)
+        logger.info(f"🌍 تم تحميل نموذج n-gram للغات: {', '.join(model.languages)}")
+        return model
+    except Exception as e:
+        logger.error(f"خطأ في تحميل نموذج n-gram للغات: {e}")
+        return None
+
+
+# Shared detector: one detection per message text across all tasks
+language_detector = LanguageDetector(_load_default_model())
@@ -0,0 +1,133 @@
+"""
+Per-source message dispatcher for the userbot
+موزع الرسائل حسب المحادثة المصدر
+
+كل (مستخدم، محادثة مصدر) له طابور asyncio محدود الحجم وعامل واحد،
+فتبقى الرسائل من نفس المصدر بالترتيب، بينما تتم معالجة المصادر المختلفة بالتوازي.
+عند امتلاء الطابور ينتظر المعالج (backpressure) بدلاً من تكديس الرسائل في الذاكرة.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of sources processed at the same time (all users)
+DEFAULT_MAX_WORKERS = int(os.getenv('USERBOT_MAX_WORKERS', '8'))
+# Pending messages allowed per source before submit() starts waiting
+DEFAULT_QUEUE_SIZE = int(os.getenv('USERBOT_SOURCE_QUEUE_SIZE', '100'))
+# Seconds an empty source queue keeps its worker alive
+DEFAULT_IDLE_TIMEOUT = 60.0
+
+
+class SourceQueueDispatcher:
+    """Bounded per-key asyncio queues with one ordered worker per key"""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.max_workers = max(1, max_workers)
+        self.queue_size = max(1, queue_size)
+        self.idle_timeout = idle_timeout
+        self.queues: Dict[Hashable, asyncio.Queue] = {}
+        self.workers: Dict[Hashable, asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.backpressure_waits = 0
+        self.max_depth_seen = 0
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # Created lazily so it belongs to the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        return self._slots
+
+    async def submit(self, key: Hashable, job: Callable[[], Awaitable]):
+        """Queue a job for a source; waits while that source's queue is full"""
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            self.queues[key] = queue
+
+        if queue.full():
+            self.backpressure_waits += 1
+            logger.warning(f"⏳ طابور المصدر {key} ممتلئ ({queue.qsize()}) - انتظار المعالجة")
+        await queue.put((time.monotonic(), job))
+        self.submitted += 1
+        self.max_depth_seen = max(self.max_depth_seen, queue.qsize())
+
+        worker = self.workers.get(key)
+        if worker is None or worker.done():
+            self.workers[key] = asyncio.create_task(self._worker(key, queue))
+
+    async def _worker(self, key: Hashable, queue: asyncio.Queue):
+        slots = self._get_slots()
+        try:
+            while True:
+                try:
+                    queued_at, job = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if queue.empty():
+                        break
+                    continue
+
+                async with slots:
+                    self.active += 1
+                    try:
+                        wait_time = time.monotonic() - queued_at
+                        if wait_time > 5:
+                            logger.info(f"⏱️ رسالة من المصدر {key} انتظرت {wait_time:.1f} ثانية في الطابور")
+                        await job()
+                        self.processed += 1
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        self.failed += 1
+                        logger.error(f"خطأ في معالجة رسالة من المصدر {key}: {e}")
+                    finally:
+                        self.active -= 1
+                        queue.task_done()
+        finally:
+            if self.workers.get(key) is asyncio.current_task():
+                del self.workers[key]
+                if queue.empty() and self.queues.get(key) is queue:
+                    del self.queues[key]
+
+    async def stop(self, match: Optional[Callable[[Hashable], bool]] = None):
+        """Cancel workers (all of them, or those whose key matches) and drop their queues"""
+        keys = [key for key in list(self.workers) if match is None or match(key)]
+        current = asyncio.current_task()
+        # Never cancel (and wait for) the worker that is calling stop()
+        tasks = [task for task in (self.workers.pop(key) for key in keys) if task is not current]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for key in [key for key in list(self.queues) if match is None or match(key)]:
+            del self.queues[key]
+
+    def queue_depths(self) -> Dict[Hashable, int]:
+        """Pending messages per source"""
+        return {key: queue.qsize() for key, queue in self.queues.items()}
+
+    def get_stats(self) -> Dict:
+        """Queue depth and throughput metrics"""
+        depths = self.queue_depths()
+        return {
+            'sources': len(self.queues),
+            'workers': len(self.workers),
+            'active': self.active,
+            'max_workers': self.max_workers,
+            'queue_size': self.queue_size,
+            'pending': sum(depths.values()),
+            'deepest_queue': max(depths.values()) if depths else 0,
+            'max_depth_seen': self.max_depth_seen,
+            'submitted': self.submitted,
+            'processed': self.processed,
+            'failed': self.failed,
+            'backpressure_waits': self.backpressure_waits,
+        }
@@ -0,0 +1,129 @@
+"""
+In-process sliding-window rate limiter - محدد معدل الرسائل في الذاكرة
+
+بدلاً من إدراج صف في rate_limit_tracking لكل رسالة وتنفيذ COUNT(*) على الجدول
+لكل فحص، يحتفظ كل مهمة بآخر message_count طابع زمني فقط في deque محدودة:
+الرسالة مرفوضة إذا امتلأت النافذة وكان أقدم طابع فيها ما زال داخل الفترة، أي فحص O(1).
+
+لتحمل إعادة التشغيل يمكن حفظ لقطة دورية من الطوابع في جدول rate_limit_tracking
+(RATE_LIMIT_SNAPSHOT_INTERVAL ثانية، 0 للتعطيل) واستعادتها عند أول استخدام.
+"""
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_SNAPSHOT_INTERVAL = float(os.getenv('RATE_LIMIT_SNAPSHOT_INTERVAL', '60'))
+
+
+class SlidingWindowRateLimiter:
+    """Exact sliding window per task, bounded to message_count timestamps"""
+
+    def __init__(self, db=None, snapshot_interval: float = RATE_LIMIT_SNAPSHOT_INTERVAL):
+        if db is not None and not (hasattr(db, 'save_rate_limit_snapshot')
+                                   and hasattr(db, 'load_rate_limit_snapshot')):
+            logger.info(f"⏰ {type(db).__name__} لا يدعم لقطات حد الرسائل - النوافذ في الذاكرة فقط")
+            db = None
+        self.db = db
+        self.snapshot_interval = snapshot_interval
+        self._windows: Dict[int, Deque[float]] = {}
+        self._periods: Dict[int, int] = {}
+        self._restored = db is None or snapshot_interval <= 0
+        self._dirty = False
+        self._last_snapshot = time.time()
+
+    def _window(self, task_id: int, max_messages: int) -> Deque[float]:
+        window = self._windows.get(task_id)
+        if window is None or window.maxlen != max_messages:
+            # New task or message_count changed: keep the most recent timestamps
+            window = deque(window or (), maxlen=max_messages)
+            self._windows[task_id] = window
+        return window
+
+    def allow(self, task_id: int, max_messages: int, period_seconds: int, now: Optional[float] = None) -> bool:
+        """Record and allow the message, or return False if the task is over its limit"""
+        if not self._restored:
+            self.restore()
+        now = time.time() if now is None else now
+
+        window = self._window(task_id, max_messages)
+        self._periods[task_id] = period_seconds
+        if len(window) >= max_messages and window[0] > now - period_seconds:
+            self.maybe_snapshot(now)
+            return False
+
+        window.append(now)
+        self._dirty = True
+        self.maybe_snapshot(now)
+        return True
+
+    def remaining(self, task_id: int, max_messages: int, period_seconds: int, now: Optional[float] = None) -> int:
+        """Messages still allowed in the current window"""
+        now = time.time() if now is None else now
+        window = self._windows.get(task_id) or ()
+        cutoff = now - period_seconds
+        return max(0, max_messages - sum(1 for stamp in window if stamp > cutoff))
+
+    def reset(self, task_id: int = None):
+        if task_id is None:
+            self._windows.clear()
+            self._periods.clear()
+        else:
+            self._windows.pop(task_id, None)
+            self._periods.pop(task_id, None)
+        self._dirty = True
+
+    # ===== Snapshots =====
+
+    def snapshot_state(self, now: Optional[float] = None) -> Dict[int, List[float]]:
+        """Timestamps still inside each task's period"""
+        now = time.time() if now is None else now
+        state = {}
+        for task_id, window in self._windows.items():
+            period = self._periods.get(task_id)
+            # Restored windows not used since the restart keep all their timestamps
+            stamps = list(window) if period is None else [stamp for stamp in window if stamp > now - period]
+            if stamps:
+                state[task_id] = stamps
+        return state
+
+    def maybe_snapshot(self, now: float):
+        if self.db is None or self.snapshot_interval <= 0 or not self._dirty:
+            return
+        if now - self._last_snapshot >= self.snapshot_interval:
+            self.snapshot(now)
+
+    def snapshot(self, now: Optional[float] = None):
+        """Persist the current windows (replaces the previous snapshot)"""
+        if self.db is None:
+            return
+        now = time.time() if now is None else now
+        self._last_snapshot = now
+        try:
+            self.db.save_rate_limit_snapshot(self.snapshot_state(now))
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"خطأ في حفظ لقطة حد الرسائل: {e}")
+
+    def restore(self):
+        """Load the last snapshot (once, on first use)"""
+        self._restored = True
+        try:
+            state = self.db.load_rate_limit_snapshot()
+        except Exception as e:
+            logger.error(f"خطأ في تحميل لقطة حد الرسائل: {e}")
+            return
+        for task_id, stamps in state.items():
+            # Unbounded until the first allow() call sizes it to message_count
+            self._windows[task_id] = deque(sorted(stamps))
+        if state:
+            logger.info(f"⏰ تمت استعادة نوافذ حد الرسائل لـ {len(state)} مهمة")
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'tasks': len(self._windows),
+            'tracked_messages': sum(len(window) for window in self._windows.values()),
+        }
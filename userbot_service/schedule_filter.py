@@ -0,0 +1,100 @@
+"""
+Precompiled weekly schedule for the day and working-hours filters
+جدول أسبوعي مُسبق البناء لفلتر الأيام وفلتر ساعات العمل
+
+يتم تحويل أيام المهمة وساعاتها إلى قناع بتات 7×24 (بت لكل ساعة من الأسبوع)
+مرة واحدة لكل لقطة إعدادات، ثم يكون الفحص لكل رسالة مجرد اختبار بت واحد
+باستخدام المنطقة الزمنية للمستخدم من user_settings بدلاً من UTC+3 الثابت.
+"""
+import datetime
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = 'Asia/Riyadh'
+HOURS_PER_WEEK = 7 * 24
+_FULL_WEEK = (1 << HOURS_PER_WEEK) - 1
+_DAY_BITS = (1 << 24) - 1
+
+DAY_NAMES = ['الإثنين', 'الثلاثاء', 'الأربعاء', 'الخميس', 'الجمعة', 'السبت', 'الأحد']
+
+
+@lru_cache(maxsize=64)
+def get_timezone(name: Optional[str]) -> datetime.tzinfo:
+    """tzinfo for an IANA name; falls back to the previous fixed UTC+3"""
+    if name and ZoneInfo is not None:
+        try:
+            return ZoneInfo(name)
+        except Exception:
+            logger.warning(f"⚠️ منطقة زمنية غير معروفة '{name}' - استخدام UTC+3")
+    return datetime.timezone(datetime.timedelta(hours=3))
+
+
+def hour_of_week(moment: datetime.datetime) -> int:
+    """Bit index of a local time: weekday (0=Monday) * 24 + hour"""
+    return moment.weekday() * 24 + moment.hour
+
+
+def compile_day_mask(day_filters: Optional[Iterable[Dict]]) -> int:
+    """Every hour of the allowed days (days without a row stay allowed)"""
+    mask = _FULL_WEEK
+    for day in day_filters or []:
+        day_number = day.get('day_number')
+        if isinstance(day_number, int) and 0 <= day_number < 7 and not day.get('is_allowed', True):
+            mask &= ~(_DAY_BITS << (day_number * 24))
+    return mask
+
+
+def compile_hours_mask(working_hours: Optional[Dict]) -> int:
+    """Hours of the week when messages pass the working-hours filter"""
+    enabled_hours = (working_hours or {}).get('enabled_hours') or []
+    if not enabled_hours:
+        return _FULL_WEEK  # no hours configured: never block
+
+    day_hours = 0
+    for hour in enabled_hours:
+        if 0 <= hour < 24:
+            day_hours |= 1 << hour
+    if working_hours.get('mode', 'work_hours') != 'work_hours':
+        # sleep_hours: the selected hours are the blocked ones
+        day_hours = ~day_hours & _DAY_BITS
+
+    mask = 0
+    for day_number in range(7):
+        mask |= day_hours << (day_number * 24)
+    return mask
+
+
+class TaskSchedule:
+    """7×24 bitmasks of one task, evaluated in the owner's timezone"""
+
+    def __init__(self, day_filters: Optional[List[Dict]], working_hours: Optional[Dict],
+                 timezone_name: Optional[str] = DEFAULT_TIMEZONE):
+        self.timezone_name = timezone_name or DEFAULT_TIMEZONE
+        self.tz = get_timezone(self.timezone_name)
+        self.day_mask = compile_day_mask(day_filters)
+        self.hours_mask = compile_hours_mask(working_hours)
+        self.mode = (working_hours or {}).get('mode', 'work_hours')
+
+    def local_now(self, now: Optional[datetime.datetime] = None) -> datetime.datetime:
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        return now.astimezone(self.tz)
+
+    def day_allowed(self, now: Optional[datetime.datetime] = None) -> bool:
+        return bool(self.day_mask >> hour_of_week(self.local_now(now)) & 1)
+
+    def hour_allowed(self, now: Optional[datetime.datetime] = None) -> bool:
+        return bool(self.hours_mask >> hour_of_week(self.local_now(now)) & 1)
+
+
+def get_task_schedule(settings) -> TaskSchedule:
+    """Schedule compiled once per settings snapshot (rebuilt after day/hour writes)"""
+    return settings.compiled('schedule', lambda snapshot: TaskSchedule(
+        snapshot.get('day_filters'), snapshot.get('working_hours'), snapshot.get('timezone')))
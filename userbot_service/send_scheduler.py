@@ -0,0 +1,195 @@
+"""
+Per-destination send scheduler - جدولة الإرسال لكل محادثة هدف
+
+يرسل UserBot الرسالة إلى الأهداف المستقلة بالتوازي بدلاً من الانتظار بين كل
+هدف والذي يليه. الجدولة تضمن:
+- ترتيب الإرسال لنفس المحادثة الهدف (قفل لكل هدف)
+- فاصل الإرسال (sending_interval) كحد أدنى بين رسالتين متتاليتين لنفس الهدف
+- حد أقصى للإرسالات المتزامنة لكل عميل لاحترام حدود Telegram
+- عند FloodWait يتم إيقاف الهدف المتأثر فقط للمدة المطلوبة، ويتعلم المجدول
+  فاصلاً آمناً لكل نوع محادثة (قناة/مجموعة/مستخدم) لكل عميل
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Concurrent sends allowed per Telethon client
+MAX_INFLIGHT_SENDS = int(os.getenv('USERBOT_MAX_INFLIGHT_SENDS', '4'))
+# Learned spacing after a flood wait: doubled per flood, multiplied by (1 - decay) per good send
+FLOOD_MIN_LEARNED_INTERVAL = float(os.getenv('USERBOT_FLOOD_MIN_INTERVAL', '0.5'))
+FLOOD_MAX_LEARNED_INTERVAL = float(os.getenv('USERBOT_FLOOD_MAX_INTERVAL', '30'))
+FLOOD_INTERVAL_DECAY = float(os.getenv('USERBOT_FLOOD_INTERVAL_DECAY', '0.02'))
+# Sends retried after a flood wait before the message is given up for that target
+FLOOD_RETRY_ATTEMPTS = int(os.getenv('USERBOT_FLOOD_RETRY_ATTEMPTS', '3'))
+
+
+class SendSlot:
+    """Held while sending to one destination; release() records the send time"""
+
+    def __init__(self, scheduler: 'SendScheduler', client_key: Hashable, destination: Hashable,
+                 chat_type: Optional[str] = None):
+        self.scheduler = scheduler
+        self.client_key = client_key
+        self.destination = destination
+        self.chat_type = chat_type
+        self.flooded = False
+        self.released = False
+
+    def report_flood(self, seconds: float):
+        """Telegram asked to wait: park this destination and slow down its chat type"""
+        self.flooded = True
+        self.scheduler.report_flood(self.client_key, self.destination, self.chat_type, seconds)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self.client_key, self.destination, self.chat_type, self.flooded)
+
+
+class SendScheduler:
+    """Concurrent fan-out with per-destination spacing, a per-client in-flight cap
+    and FloodWait backoff (parked destinations, learned interval per chat type)"""
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT_SENDS):
+        self.max_inflight = max(1, max_inflight)
+        self._client_slots: Dict[Hashable, asyncio.Semaphore] = {}
+        self._destination_locks: Dict[Tuple[Hashable, Hashable], asyncio.Lock] = {}
+        self._last_sent: Dict[Tuple[Hashable, Hashable], float] = {}
+        self._parked_until: Dict[Tuple[Hashable, Hashable], float] = {}
+        self._learned_interval: Dict[Tuple[Hashable, str], float] = {}
+        self._flood_counts: Dict[Tuple[Hashable, str], int] = {}
+        self.sends = 0
+        self.in_flight = 0
+        self.waited_seconds = 0.0
+        self.flood_waits = 0
+        self.flood_seconds = 0.0
+
+    def _semaphore(self, client_key: Hashable) -> asyncio.Semaphore:
+        semaphore = self._client_slots.get(client_key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_inflight)
+            self._client_slots[client_key] = semaphore
+        return semaphore
+
+    def learned_interval(self, client_key: Hashable, chat_type: Optional[str]) -> float:
+        """Spacing learned from flood waits for this client and chat type"""
+        return self._learned_interval.get((client_key, chat_type), 0.0)
+
+    def parked_for(self, client_key: Hashable, destination: Hashable) -> float:
+        """Seconds left before this destination may be sent to again"""
+        until = self._parked_until.get((client_key, destination))
+        return max(0.0, until - time.monotonic()) if until is not None else 0.0
+
+    def park(self, client_key: Hashable, destination: Hashable, seconds: float):
+        """Hold sends to one destination for `seconds` (other destinations keep going)"""
+        key = (client_key, destination)
+        until = time.monotonic() + max(0.0, seconds)
+        if until > self._parked_until.get(key, 0.0):
+            self._parked_until[key] = until
+
+    def report_flood(self, client_key: Hashable, destination: Hashable, chat_type: Optional[str], seconds: float):
+        """Record a FloodWait/SlowModeWait: park the destination and double the learned interval
+
+        Each successful send then multiplies the interval by (1 - FLOOD_INTERVAL_DECAY)
+        until it drops below 0.05s and is forgotten.
+        """
+        self.park(client_key, destination, seconds)
+        self.flood_waits += 1
+        self.flood_seconds += seconds
+        type_key = (client_key, chat_type)
+        self._flood_counts[type_key] = self._flood_counts.get(type_key, 0) + 1
+        interval = max(FLOOD_MIN_LEARNED_INTERVAL, self._learned_interval.get(type_key, 0.0) * 2)
+        self._learned_interval[type_key] = min(FLOOD_MAX_LEARNED_INTERVAL, interval)
+        logger.warning(f"🌊 FloodWait للهدف {destination} ({chat_type or 'غير معروف'}): "
+                       f"إيقاف {seconds} ثانية، الفاصل المتعلم {self._learned_interval[type_key]:.1f} ثانية")
+
+    async def acquire(self, client_key: Hashable, destination: Hashable, min_interval: float = 0,
+                      chat_type: Optional[str] = None) -> SendSlot:
+        """Wait for the destination's turn, park and spacing, then for a client send slot"""
+        key = (client_key, destination)
+        lock = self._destination_locks.get(key)
+        if lock is None:
+            lock = self._destination_locks[key] = asyncio.Lock()
+        await lock.acquire()
+        try:
+            parked = self.parked_for(client_key, destination)
+            if parked > 0:
+                logger.info(f"🅿️ الهدف {destination} متوقف بسبب FloodWait: انتظار {parked:.1f} ثانية")
+                self.waited_seconds += parked
+                await asyncio.sleep(parked)
+            self._parked_until.pop(key, None)
+
+            min_interval = max(min_interval, self.learned_interval(client_key, chat_type))
+            last = self._last_sent.get(key)
+            if last is not None and min_interval > 0:
+                delay = last + min_interval - time.monotonic()
+                if delay > 0:
+                    logger.info(f"⏱️ فاصل الإرسال للهدف {destination}: انتظار {delay:.1f} ثانية")
+                    self.waited_seconds += delay
+                    await asyncio.sleep(delay)
+            await self._semaphore(client_key).acquire()
+            self.in_flight += 1
+        except BaseException:
+            lock.release()
+            raise
+        return SendSlot(self, client_key, destination, chat_type)
+
+    @asynccontextmanager
+    async def slot(self, client_key: Hashable, destination: Hashable, min_interval: float = 0,
+                   chat_type: Optional[str] = None):
+        """async with scheduler.slot(...): acquire() as a context manager"""
+        send_slot = await self.acquire(client_key, destination, min_interval, chat_type)
+        try:
+            yield send_slot
+        finally:
+            send_slot.release()
+
+    def _release(self, client_key: Hashable, destination: Hashable,
+                 chat_type: Optional[str] = None, flooded: bool = False):
+        key = (client_key, destination)
+        self._last_sent[key] = time.monotonic()
+        self.sends += 1
+        type_key = (client_key, chat_type)
+        if not flooded and type_key in self._learned_interval:
+            # Multiplicative decay: every successful send shrinks the learned interval by FLOOD_INTERVAL_DECAY
+            interval = self._learned_interval[type_key] * (1 - FLOOD_INTERVAL_DECAY)
+            if interval < 0.05:
+                del self._learned_interval[type_key]
+            else:
+                self._learned_interval[type_key] = interval
+        self.in_flight -= 1
+        self._semaphore(client_key).release()
+        lock = self._destination_locks.get(key)
+        if lock is not None and lock.locked():
+            lock.release()
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            'sends': self.sends,
+            'waited_seconds': round(self.waited_seconds, 2),
+            'destinations': len(self._last_sent),
+            'in_flight': self.in_flight,
+            'flood_waits': self.flood_waits,
+        }
+
+    def get_backoff_state(self) -> Dict[str, object]:
+        """Current FloodWait backoff: parked destinations, learned intervals and flood counts"""
+        now = time.monotonic()
+        return {
+            'parked': [
+                {'client': client_key, 'destination': destination, 'remaining_seconds': round(until - now, 1)}
+                for (client_key, destination), until in self._parked_until.items() if until > now
+            ],
+            'learned_intervals': [
+                {'client': client_key, 'chat_type': chat_type, 'interval_seconds': round(interval, 2),
+                 'floods': self._flood_counts.get((client_key, chat_type), 0)}
+                for (client_key, chat_type), interval in self._learned_interval.items()
+            ],
+            'flood_waits': self.flood_waits,
+            'flood_seconds': round(self.flood_seconds, 1),
+        }
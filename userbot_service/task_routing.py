@@ -0,0 +1,82 @@
+"""
+Source-chat routing index for the userbot
+فهرس توجيه المحادثات المصدر للـ UserBot
+
+يحول قائمة المهام المسطحة (مصدر × هدف) إلى جدول بحث مُسبق البناء
+حتى يتم رفض الرسائل من المحادثات غير المرتبطة بأي مهمة في O(1)
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+class TaskRoutingIndex:
+    """Precompiled lookup table: source chat -> matching task entries"""
+
+    def __init__(self, tasks: Iterable[Dict]):
+        """Build the index from the flattened task list of one user"""
+        self.tasks: List[Dict] = list(tasks)
+        self.by_chat_id: Dict[int, List[Dict]] = {}
+        self.by_username: Dict[str, List[Dict]] = {}
+        # Position of each entry in the original list, used to keep task order
+        # stable when a chat matches both by id and by username
+        self._order: Dict[int, int] = {}
+
+        for position, task in enumerate(self.tasks):
+            self._order[id(task)] = position
+            key = self.normalize_source(task.get('source_chat_id'))
+            if key is None:
+                logger.warning(f"⚠️ مصدر غير صالح للمهمة {task.get('id')}: '{task.get('source_chat_id')}'")
+                continue
+            if isinstance(key, int):
+                self.by_chat_id.setdefault(key, []).append(task)
+            else:
+                self.by_username.setdefault(key, []).append(task)
+
+    @staticmethod
+    def normalize_source(value) -> Optional[Union[int, str]]:
+        """Convert a stored source id to an int chat id or a lowercase username"""
+        if value is None:
+            return None
+        if isinstance(value, int):
+            return value
+        text = str(value).strip()
+        if not text:
+            return None
+        try:
+            return int(text)
+        except ValueError:
+            pass
+        if text.startswith('https://t.me/') or text.startswith('t.me/'):
+            text = text.rsplit('/', 1)[-1]
+        return text.lstrip('@').lower() or None
+
+    @property
+    def has_username_routes(self) -> bool:
+        """True when at least one task uses a @username as its source"""
+        return bool(self.by_username)
+
+    def lookup(self, chat_id: Optional[int], username: Optional[str] = None) -> List[Dict]:
+        """Return the task entries whose source is this chat (empty list if none)"""
+        by_id = self.by_chat_id.get(chat_id, []) if chat_id is not None else []
+        by_name = self.by_username.get(username.lower(), []) if username and self.by_username else []
+
+        if not by_name:
+            return by_id
+        if not by_id:
+            return by_name
+
+        merged = {id(task): task for task in by_id}
+        merged.update((id(task), task) for task in by_name)
+        return sorted(merged.values(), key=lambda task: self._order[id(task)])
+
+    def source_count(self) -> int:
+        """Number of distinct sources in the index"""
+        return len(self.by_chat_id) + len(self.by_username)
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def __bool__(self) -> bool:
+        return bool(self.tasks)
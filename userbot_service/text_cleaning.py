@@ -0,0 +1,151 @@
+"""
+Precompiled text cleaning pipeline - خطة تنظيف النصوص المترجمة مسبقاً
+
+جميع الأنماط مترجمة على مستوى الوحدة، ويتم بناء خطة تنظيف لكل مهمة من
+إعدادات get_text_cleaning_settings مرة واحدة (مع نسخة الإعدادات المخزنة).
+قواعد الحذف المفعلة تطبق بنفس الترتيب السابق (الروابط، ثم الايموجي، ثم
+الهاشتاقات، ثم أرقام الهواتف): دمجها في تعبير واحد يغير النتيجة عند التداخل،
+مثلاً "#abc.com" يصبح "#" لأن الرابط يحذف قبل الهاشتاق.
+"""
+import functools
+import re
+from typing import Iterable, Optional, Tuple
+
+# ===== Link rules =====
+
+# Hidden links keep their visible text: [text](url) and <a href="url">text</a>
+_HIDDEN_LINK_PATTERN = re.compile(
+    r'\[(?P<md_text>[^\]]+)\]\s*\(([^)]*)\)'
+    r'|<a\s+href=[\'\"][^\'\"]+[\'\"]\s*>(?P<html_text>.*?)</a>',
+    re.IGNORECASE | re.DOTALL
+)
+
+_LINK_PATTERNS = tuple(re.compile(rule) for rule in (
+    r'<https?://[^>]+>',                 # angle-bracket autolinks
+    r'https?://[^\s]+',                  # plain URLs
+    r't\.me/[^\s]+',
+    r'www\.[^\s]+',
+    r'\b[a-zA-Z0-9](?:[a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.(?:[a-zA-Z]{2,6}\.?)+(?:/[^\s]*)?',  # bare domains
+))
+
+_EMPTY_BRACKETS_PATTERN = re.compile(r'\[\s*\]|\(\s*\)')
+
+# ===== Other removal rules =====
+
+_EMOJI_RULE = (
+    "["
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    "\U00002700-\U000027BF"  # dingbats
+    "\U0001f926-\U0001f937"  # supplemental symbols
+    "\U00010000-\U0010ffff"  # supplemental characters
+    "\u2640-\u2642"          # gender symbols
+    "\u2600-\u2B55"          # misc symbols
+    "\u200d"                 # zero width joiner
+    "\u23cf"                 # various symbols
+    "\u23e9-\u23f3"          # symbol range
+    "\u23f8-\u23f9"          # symbol range
+    "\u3030"                 # wavy dash
+    "]+"
+)
+
+_HASHTAG_RULE = r'#\w+'
+
+# Phone numbers (specific patterns to avoid years like 2025)
+_PHONE_RULES = (
+    r'\+\d{1,4}[-.\s]?\(?\d{1,4}\)?[-.\s]?\d{1,4}[-.\s]?\d{4,9}',  # International with +
+    r'\b\d{3}[-.\s]\d{3}[-.\s]\d{4}\b',  # US format with separators
+    r'\b\d{4}[-.\s]\d{3}[-.\s]\d{3}\b',  # Some international with separators
+    r'\b\d{2}[-.\s]\d{4}[-.\s]\d{4}\b',  # Another format with separators
+    r'\b\d{10,15}\b',  # Long sequences of digits (10-15 digits) likely phone numbers
+    r'\(\d{3}\)\s?\d{3}[-.\s]?\d{4}',  # Format like (123) 456-7890
+)
+
+_SPACES_PATTERN = re.compile(r'[ \t]+')
+
+
+@functools.lru_cache(maxsize=16)
+def _removal_patterns(emojis: bool, hashtags: bool, phones: bool) -> Tuple[re.Pattern, ...]:
+    """Compiled deletion rules that run after the link pass: emojis, hashtags, then phones"""
+    rules = []
+    if emojis:
+        rules.append(_EMOJI_RULE)
+    if hashtags:
+        rules.append(_HASHTAG_RULE)
+    if phones:
+        rules.extend(_PHONE_RULES)
+    return tuple(re.compile(rule) for rule in rules)
+
+
+def _keep_link_text(match: re.Match) -> str:
+    text = match.group('md_text')
+    return text if text is not None else match.group('html_text')
+
+
+class TextCleaningPlan:
+    """Cleaning steps of one task, compiled from its text cleaning settings"""
+
+    def __init__(self, settings: dict, keywords: Optional[Iterable[str]] = None):
+        settings = settings or {}
+        self.remove_links = bool(settings.get('remove_links', False))
+        self.remove_empty_lines = bool(settings.get('remove_empty_lines', False))
+        self.removal_patterns = _removal_patterns(
+            bool(settings.get('remove_emojis', False)),
+            bool(settings.get('remove_hashtags', False)),
+            bool(settings.get('remove_phone_numbers', False)),
+        )
+
+        self.keyword_pattern = None
+        if settings.get('remove_lines_with_keywords', False):
+            words = sorted({keyword for keyword in (keywords or []) if keyword}, key=len, reverse=True)
+            if words:
+                self.keyword_pattern = re.compile('|'.join(re.escape(word) for word in words), re.IGNORECASE)
+
+    def apply(self, text: str) -> str:
+        """Run the plan over a message text"""
+        if not text:
+            return text
+
+        if self.remove_links:
+            text = _HIDDEN_LINK_PATTERN.sub(_keep_link_text, text)
+            for pattern in _LINK_PATTERNS:
+                text = pattern.sub('', text)
+            text = _EMPTY_BRACKETS_PATTERN.sub('', text)
+
+        for pattern in self.removal_patterns:
+            text = pattern.sub('', text)
+
+        lines = text.split('\n')
+        if self.keyword_pattern is not None:
+            search = self.keyword_pattern.search
+            lines = [line for line in lines if not search(line)]
+
+        # Clean whitespace within each line but preserve the line structure
+        lines = [_SPACES_PATTERN.sub(' ', line.strip()) for line in lines]
+
+        # Remove empty lines AFTER all other cleaning operations:
+        # only keep an empty line if it is between two content lines
+        if self.remove_empty_lines:
+            last = len(lines) - 1
+            lines = [
+                line for i, line in enumerate(lines)
+                if line or (0 < i < last and lines[i - 1] and lines[i + 1])
+            ]
+
+        return '\n'.join(lines)
+
+
+def get_text_cleaning_plan(settings) -> Optional[TextCleaningPlan]:
+    """Cleaning plan of a task, compiled once per settings snapshot"""
+    def build(snapshot):
+        cleaning_settings = snapshot.get('text_cleaning_settings')
+        if not cleaning_settings:
+            return None
+        keywords = None
+        if cleaning_settings.get('remove_lines_with_keywords', False):
+            keywords = snapshot.get('text_cleaning_keywords', [])
+        return TextCleaningPlan(cleaning_settings, keywords)
+
+    return settings.compiled('text_cleaning_plan', build)
@@ -0,0 +1,58 @@
+"""
+Per-message text transform cache - ذاكرة تحويلات النص لكل رسالة
+
+نفس نص الرسالة يمر بالتنظيف والاستبدال والترجمة والتنسيق مرة لفحص الميزات
+المتقدمة ثم مرة لكل هدف. هذه الذاكرة تحفظ ناتج كل مرحلة بالمفتاح
+(task_id, stage, hash النص) طوال معالجة الرسالة، فتعمل كل مرحلة مرة واحدة
+فقط لكل مهمة مهما كان عدد الأهداف.
+"""
+import hashlib
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def text_hash(text: str) -> str:
+    """hash ثابت للنص المدخل"""
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+class TextTransformCache:
+    """Memoizes text pipeline stages for the lifetime of one message"""
+
+    def __init__(self):
+        self._results: Dict[Tuple[Hashable, str, str], str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, task_id: Hashable, stage: str, text: str) -> Tuple[Hashable, str, str]:
+        return task_id, stage, text_hash(text or '')
+
+    def apply(self, task_id: Hashable, stage: str, text: str, transform: Callable[[str], str],
+              skip_empty: bool = True) -> str:
+        """Run a synchronous stage once per (task, stage, input)"""
+        if skip_empty and not text:
+            return text
+        key = self._key(task_id, stage, text)
+        if key in self._results:
+            self.hits += 1
+            return self._results[key]
+        self.misses += 1
+        result = transform(text)
+        self._results[key] = result
+        return result
+
+    async def apply_async(self, task_id: Hashable, stage: str, text: str,
+                          transform: Callable[[str], Awaitable[str]], skip_empty: bool = True) -> str:
+        """Run an async stage (e.g. translation) once per (task, stage, input)"""
+        if skip_empty and not text:
+            return text
+        key = self._key(task_id, stage, text)
+        if key in self._results:
+            self.hits += 1
+            return self._results[key]
+        self.misses += 1
+        result = await transform(text)
+        self._results[key] = result
+        return result
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'entries': len(self._results), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,319 @@
+"""
+Translation service - خدمة الترجمة غير المتزامنة
+
+بدلاً من إنشاء GoogleTranslator واستدعائه بشكل متزامن داخل حلقة الأحداث لكل هدف،
+تقوم هذه الخدمة بتجميع النصوص المنتظرة لكل زوج لغات في دفعة واحدة وتشغيل
+مزود الترجمة في Thread pool، مع ذاكرة مؤقتة LRU في الذاكرة وذاكرة دائمة في SQLite
+بالمفتاح (لغة المصدر، لغة الهدف، hash النص).
+
+Providers are pluggable: anything implementing TranslationProvider.translate_batch
+can be passed to TranslationService (tests use a local stand-in).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from database.sqlite_pool import SQLiteConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Kept next to the other runtime data (the ./data volume in docker-compose)
+TRANSLATION_CACHE_DB = os.getenv('TRANSLATION_CACHE_DB', os.path.join('data', 'translation_cache.db'))
+TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', '2000'))
+TRANSLATION_BATCH_SIZE = int(os.getenv('TRANSLATION_BATCH_SIZE', '20'))
+# Seconds to wait for more texts of the same language pair before sending a batch
+TRANSLATION_BATCH_WINDOW = float(os.getenv('TRANSLATION_BATCH_WINDOW', '0.05'))
+TRANSLATION_WORKERS = int(os.getenv('TRANSLATION_WORKERS', '2'))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=20).hexdigest()
+
+
+# ===== Providers =====
+
+class TranslationProvider:
+    """Provider interface; translate_batch runs in a worker thread"""
+
+    name = 'base'
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        raise NotImplementedError
+
+    def translate_batch(self, texts: List[str], source: str, target: str) -> List[str]:
+        return [self.translate(text, source, target) for text in texts]
+
+
+class GoogleTranslatorProvider(TranslationProvider):
+    """deep-translator GoogleTranslator (one translator per language pair)"""
+
+    name = 'google'
+
+    def __init__(self):
+        from deep_translator import GoogleTranslator
+        self._translator_class = GoogleTranslator
+        self._translators: Dict[Tuple[str, str], object] = {}
+        self._lock = threading.Lock()
+
+    def _get_translator(self, source: str, target: str):
+        with self._lock:
+            translator = self._translators.get((source, target))
+            if translator is None:
+                translator = self._translator_class(source=source, target=target)
+                self._translators[(source, target)] = translator
+            return translator
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        return self._get_translator(source, target).translate(text)
+
+    def translate_batch(self, texts: List[str], source: str, target: str) -> List[str]:
+        translator = self._get_translator(source, target)
+        if len(texts) > 1 and hasattr(translator, 'translate_batch'):
+            return translator.translate_batch(texts)
+        return [translator.translate(text) for text in texts]
+
+
+# ===== Cache =====
+
+class TranslationCache:
+    """LRU in memory backed by a SQLite table keyed by (source, target, text hash)
+
+    The SQLite file is opened on first use (not at import time); its reads and
+    writes are blocking and are run in the service's worker threads.
+    """
+
+    def __init__(self, db_path: Optional[str] = TRANSLATION_CACHE_DB, max_entries: int = TRANSLATION_CACHE_SIZE):
+        self.db_path = db_path
+        self.max_entries = max(1, max_entries)
+        self._memory: 'OrderedDict[Tuple[str, str, str], str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_failed = False
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @property
+    def persistent(self) -> bool:
+        return bool(self.db_path) and not self._pool_failed
+
+    def _get_pool(self) -> Optional[SQLiteConnectionPool]:
+        if self._pool is not None or not self.persistent:
+            return self._pool
+        with self._lock:
+            if self._pool is None and not self._pool_failed:
+                try:
+                    directory = os.path.dirname(self.db_path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    pool = SQLiteConnectionPool(self.db_path)
+                    with pool.get_connection() as conn:
+                        conn.execute('''
+                            CREATE TABLE IF NOT EXISTS translation_cache (
+                                source_lang TEXT NOT NULL,
+                                target_lang TEXT NOT NULL,
+                                text_hash TEXT NOT NULL,
+                                translated_text TEXT NOT NULL,
+                                created_at REAL NOT NULL,
+                                PRIMARY KEY (source_lang, target_lang, text_hash)
+                            )
+                        ''')
+                    self._pool = pool
+                except Exception as e:
+                    logger.error(f"خطأ في تهيئة ذاكرة الترجمة الدائمة: {e}")
+                    self._pool_failed = True
+        return self._pool
+
+    def _remember(self, key: Tuple[str, str, str], translated: str):
+        with self._lock:
+            self._memory[key] = translated
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def lookup(self, source: str, target: str, text: str) -> Optional[str]:
+        """In-memory lookup only (safe on the event loop)"""
+        key = (source, target, text_hash(text))
+        with self._lock:
+            translated = self._memory.get(key)
+            if translated is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return translated
+
+    def load(self, source: str, target: str, text: str) -> Optional[str]:
+        """SQLite lookup (blocking) after a memory miss"""
+        key = (source, target, text_hash(text))
+        pool = self._get_pool()
+        if pool is not None:
+            try:
+                row = pool.get_connection().execute('''
+                    SELECT translated_text FROM translation_cache
+                    WHERE source_lang = ? AND target_lang = ? AND text_hash = ?
+                ''', key).fetchone()
+                if row is not None:
+                    self.db_hits += 1
+                    self._remember(key, row['translated_text'])
+                    return row['translated_text']
+            except Exception as e:
+                logger.warning(f"⚠️ تعذر قراءة ذاكرة الترجمة: {e}")
+
+        self.misses += 1
+        return None
+
+    def get(self, source: str, target: str, text: str) -> Optional[str]:
+        translated = self.lookup(source, target, text)
+        return translated if translated is not None else self.load(source, target, text)
+
+    def remember_many(self, source: str, target: str, items: List[Tuple[str, str]]) -> List[tuple]:
+        """Keep (text, translated_text) pairs in memory; returns the rows for store()"""
+        rows = []
+        for text, translated in items:
+            key = (source, target, text_hash(text))
+            self._remember(key, translated)
+            rows.append(key + (translated, time.time()))
+        return rows
+
+    def store(self, rows: List[tuple]):
+        """Write rows from remember_many() to SQLite (blocking)"""
+        pool = self._get_pool() if rows else None
+        if pool is not None:
+            try:
+                with pool.get_connection() as conn:
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO translation_cache
+                        (source_lang, target_lang, text_hash, translated_text, created_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', rows)
+            except Exception as e:
+                logger.warning(f"⚠️ تعذر حفظ ذاكرة الترجمة: {e}")
+
+    def put_many(self, source: str, target: str, items: List[Tuple[str, str]]):
+        """Store (text, translated_text) pairs"""
+        self.store(self.remember_many(source, target, items))
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'memory_entries': len(self._memory),
+            'memory_hits': self.memory_hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses,
+        }
+
+
+# ===== Service =====
+
+class TranslationService:
+    """Batches translation requests per language pair and runs them off the event loop"""
+
+    def __init__(self, provider: TranslationProvider, cache: Optional[TranslationCache] = None,
+                 batch_size: int = TRANSLATION_BATCH_SIZE, batch_window: float = TRANSLATION_BATCH_WINDOW,
+                 max_workers: int = TRANSLATION_WORKERS):
+        self.provider = provider
+        self.cache = cache if cache is not None else TranslationCache()
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='translation')
+        # (source, target) -> {text: [futures]}
+        self._pending: Dict[Tuple[str, str], 'OrderedDict[str, List[asyncio.Future]]'] = {}
+        self._workers: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.requests = 0
+        self.batches = 0
+        self.translated = 0
+        self.failures = 0
+
+    async def translate(self, text: str, source: str, target: str) -> str:
+        """Translate a text (cached); returns the original text on failure"""
+        if not text or not text.strip():
+            return text
+        self.requests += 1
+
+        cached = self.cache.lookup(source, target, text)
+        if cached is None:
+            if self.cache.persistent:
+                cached = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self.cache.load, source, target, text)
+            else:
+                cached = self.cache.load(source, target, text)  # no file: only counts the miss
+        if cached is not None:
+            return cached
+
+        pair = (source, target)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(pair, OrderedDict()).setdefault(text, []).append(future)
+
+        worker = self._workers.get(pair)
+        if worker is None or worker.done():
+            self._workers[pair] = asyncio.create_task(self._batch_worker(pair))
+        return await future
+
+    async def _batch_worker(self, pair: Tuple[str, str]):
+        source, target = pair
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending.get(pair):
+                # Give other targets/messages a moment to join this batch
+                await asyncio.sleep(self.batch_window)
+                pending = self._pending[pair]
+                texts = list(pending.keys())[:self.batch_size]
+                waiters = {text: pending.pop(text) for text in texts}
+
+                try:
+                    results = await loop.run_in_executor(
+                        self._executor, self.provider.translate_batch, texts, source, target)
+                    if len(results) != len(texts):
+                        raise ValueError(f"provider returned {len(results)} results for {len(texts)} texts")
+                    self.batches += 1
+                    self.translated += len(texts)
+                    rows = self.cache.remember_many(source, target, [
+                        (text, result) for text, result in zip(texts, results) if result
+                    ])
+                    if rows and self.cache.persistent:
+                        await loop.run_in_executor(self._executor, self.cache.store, rows)
+                except Exception as e:
+                    self.failures += 1
+                    logger.error(f"❌ مشكلة في الترجمة ({source} → {target}, {len(texts)} نص): {e}")
+                    results = texts
+
+                for text, result in zip(texts, results):
+                    for future in waiters[text]:
+                        if not future.done():
+                            future.set_result(result or text)
+        finally:
+            if self._workers.get(pair) is asyncio.current_task():
+                del self._workers[pair]
+            if not self._pending.get(pair):
+                self._pending.pop(pair, None)
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = {
+            'provider': self.provider.name,
+            'requests': self.requests,
+            'batches': self.batches,
+            'translated': self.translated,
+            'failures': self.failures,
+            'pending': sum(len(texts) for texts in self._pending.values()),
+        }
+        stats.update(self.cache.get_stats())
+        return stats
+
+    def shutdown(self):
+        for worker in list(self._workers.values()):
+            worker.cancel()
+        for pending in self._pending.values():
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.cancel()
+        self._pending.clear()
+        if sys.version_info >= (3, 9):
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            self._executor.shutdown(wait=False)
@@ -17,17 +17,37 @@ Main Improvements:
 import logging
 import asyncio
 import re
-from typing import Dict, List, Optional, Tuple
+import functools
+from typing import Callable, Dict, List, Optional, Tuple
 from telethon import TelegramClient, events
-from telethon.errors import SessionPasswordNeededError, AuthKeyUnregisteredError
+from telethon.errors import SessionPasswordNeededError, AuthKeyUnregisteredError, FloodWaitError, SlowModeWaitError
 from telethon.sessions import StringSession
 from telethon.tl.types import MessageEntitySpoiler, DocumentAttributeFilename
 from database import get_database
+from database.mapping_store import MessageMappingStore
 from bot_package.config import API_ID, API_HASH
 import time
 from collections import defaultdict
 from watermark_processor import WatermarkProcessor
 from audio_processor import AudioProcessor
+from media_worker import MediaWorkerService, run_watermark_job, run_audio_job
+from send_file_helper import MediaUploadCache
+from userbot_service.task_routing import TaskRoutingIndex
+from userbot_service.message_dispatcher import SourceQueueDispatcher
+from userbot_service.send_scheduler import SendScheduler, FLOOD_RETRY_ATTEMPTS
+from userbot_service.entity_cache import CachedEntity, EntityCache
+from userbot_service.forward_batcher import ForwardBatcher, can_batch, media_copy_flags
+from userbot_service.text_cleaning import get_text_cleaning_plan
+from userbot_service.text_transforms import TextTransformCache
+from userbot_service.translation_service import TranslationService, GoogleTranslatorProvider
+from userbot_service.language_detection import language_detector
+from userbot_service.duplicate_index import DuplicateIndexManager
+from userbot_service.rate_limiter import SlidingWindowRateLimiter
+from userbot_service.schedule_filter import DAY_NAMES, get_task_schedule
+from perceptual_hash import PERCEPTUAL_HASH_ENABLED, image_hash, select_thumbnail
+from database.settings_cache import settings_cache, TaskSettingsSnapshot
+from database.word_filter import check_word_filters
+from database.text_replacement import apply_replacement_rules
 import tempfile
 import os
 
@@ -99,11 +119,25 @@ class UserbotService:
         
         self.clients: Dict[int, TelegramClient] = {}  # user_id -> client
         self.user_tasks: Dict[int, List[Dict]] = {}   # user_id -> tasks
+        self.task_routes: Dict[int, TaskRoutingIndex] = {}  # user_id -> source chat routing index
         self.user_locks: Dict[int, asyncio.Lock] = {}  # user_id -> lock for thread safety
+        self.message_dispatcher = SourceQueueDispatcher()  # (user_id, source chat) -> ordered queue
+        self.send_scheduler = SendScheduler()  # (user_id, target chat) -> spacing, user_id -> in-flight cap
+        self.send_retry_tasks: set = set()  # background retries of sends parked by FloodWait
+        self.message_processors: Dict[int, Callable] = {}  # user_id -> process_message (used to replay retries)
+        self.entity_cache = EntityCache(self.db)  # (user_id, chat) -> InputPeer, title and chat type
+        self.forward_batcher = ForwardBatcher()  # (user_id, task, source, target) -> ids forwarded in one call
+        self.mapping_store = MessageMappingStore(self.db)  # source message -> target messages (edit/delete sync)
         self.running = True
         self.album_collectors: Dict[int, AlbumCollector] = {}  # user_id -> collector
         self.watermark_processor = WatermarkProcessor()  # معالج العلامة المائية
         self.audio_processor = AudioProcessor()  # معالج الوسوم الصوتية
+        self.media_workers = MediaWorkerService()  # معالجة الوسائط خارج حلقة الأحداث
+        # ترجمة مجمعة خارج حلقة الأحداث مع ذاكرة مؤقتة دائمة
+        self.translation_service = TranslationService(GoogleTranslatorProvider()) if TRANSLATION_AVAILABLE else None
+        self.duplicate_index = DuplicateIndexManager(self.db)  # task_id -> MinHash/LSH index of recent messages
+        self.media_phash_cache: Dict[str, Optional[int]] = {}  # Telegram media id -> perceptual hash
+        self.rate_limiter = SlidingWindowRateLimiter(self.db)  # task_id -> recent message timestamps
         self.session_health_status: Dict[int, bool] = {}  # user_id -> health status
         self.session_locks: Dict[int, bool] = {}  # user_id -> is_locked (prevent multiple usage)
         self.max_reconnect_attempts = 3
@@ -192,6 +226,9 @@ class UserbotService:
                 # Set up event handlers for this user
                 await self._setup_event_handlers(user_id, client)
 
+                # Resume sends that were waiting on FloodWait before the restart
+                self._track_send_retry(asyncio.create_task(self._replay_send_retries(user_id, client)))
+
                 user = await client.get_me()
                 logger.info(f"✅ تم تشغيل UserBot للمستخدم {user_id} ({user.first_name})")
 
@@ -315,6 +352,7 @@ class UserbotService:
                     
                     if user_id in self.user_tasks:
                         del self.user_tasks[user_id]
+                    self.task_routes.pop(user_id, None)
                     
                     if user_id in self.album_collectors:
                         del self.album_collectors[user_id]
@@ -332,14 +370,14 @@ class UserbotService:
                         pass
                     del self.clients[user_id]
                 
-                for attr in ['user_tasks', 'album_collectors', 'session_health_status']:
+                for attr in ['user_tasks', 'task_routes', 'album_collectors', 'session_health_status']:
                     if hasattr(self, attr) and user_id in getattr(self, attr):
                         delattr(self, attr)[user_id]
 
         except Exception as e:
             logger.error(f"خطأ في إيقاف جلسة المستخدم {user_id}: {e}")
             # Force cleanup on error
-            for attr in ['clients', 'user_tasks', 'album_collectors', 'session_health_status', 'session_locks']:
+            for attr in ['clients', 'user_tasks', 'task_routes', 'album_collectors', 'session_health_status', 'session_locks']:
                 if hasattr(self, attr) and user_id in getattr(self, attr):
                     try:
                         del getattr(self, attr)[user_id]
@@ -434,124 +472,20 @@ class UserbotService:
             }
 
     def apply_text_cleaning(self, message_text: str, task_id: int) -> str:
-        """Apply text cleaning based on task settings"""
+        """Apply text cleaning based on task settings
+
+        The cleaning plan (fused, precompiled patterns) is built once per task
+        settings snapshot, see userbot_service/text_cleaning.py
+        """
         if not message_text:
             return message_text
 
         try:
-            # Get text cleaning settings for this task
-            settings = self.db.get_text_cleaning_settings(task_id)
-            if not settings:
+            plan = get_text_cleaning_plan(self.get_task_settings(task_id))
+            if plan is None:
                 return message_text
 
-            cleaned_text = message_text
-
-            # 1. Remove links
-            if settings.get('remove_links', False):
-                # Remove Markdown/HTML hidden links first (preserve visible text)
-                cleaned_text = re.sub(r'\[([^\]]+)\]\s*\(([^)]*)\)', r'\1', cleaned_text)
-                cleaned_text = re.sub(r'<a\s+href=[\'\"][^\'\"]+[\'\"]\s*>(.*?)</a>', r'\1', cleaned_text, flags=re.IGNORECASE|re.DOTALL)
-                # Remove angle-bracket autolinks like <https://example.com>
-                cleaned_text = re.sub(r'<https?://[^>]+>', '', cleaned_text)
-                # Then remove plain URLs and domains
-                cleaned_text = re.sub(r'https?://[^\s]+', '', cleaned_text)
-                cleaned_text = re.sub(r't\.me/[^\s]+', '', cleaned_text)
-                cleaned_text = re.sub(r'www\.[^\s]+', '', cleaned_text)
-                cleaned_text = re.sub(r'\b[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.([a-zA-Z]{2,6}\.?)+(/[^\s]*)?', '', cleaned_text)
-                # Cleanup any leftover empty brackets
-                cleaned_text = re.sub(r'\[\s*\]', '', cleaned_text)
-                cleaned_text = re.sub(r'\(\s*\)', '', cleaned_text)
-                logger.debug(f"🧹 تم حذف الروابط من المهمة {task_id}")
-
-            # 2. Remove emojis
-            if settings.get('remove_emojis', False):
-                # Remove emojis using Unicode ranges
-                emoji_pattern = re.compile(
-                    "["
-                    "\U0001F600-\U0001F64F"  # emoticons
-                    "\U0001F300-\U0001F5FF"  # symbols & pictographs
-                    "\U0001F680-\U0001F6FF"  # transport & map symbols
-                    "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-                    "\U00002700-\U000027BF"  # dingbats
-                    "\U0001f926-\U0001f937"  # supplemental symbols
-                    "\U00010000-\U0010ffff"  # supplemental characters
-                    "\u2640-\u2642"          # gender symbols
-                    "\u2600-\u2B55"          # misc symbols
-                    "\u200d"                 # zero width joiner
-                    "\u23cf"                 # various symbols
-                    "\u23e9-\u23f3"          # symbol range
-                    "\u23f8-\u23f9"          # symbol range
-                    "\u3030"                 # wavy dash
-                    "]+",
-                    flags=re.UNICODE
-                )
-                cleaned_text = emoji_pattern.sub('', cleaned_text)
-                logger.debug(f"🧹 تم حذف الايموجيات من المهمة {task_id}")
-
-            # 3. Remove hashtags
-            if settings.get('remove_hashtags', False):
-                # Remove hashtags (# followed by word characters)
-                cleaned_text = re.sub(r'#\w+', '', cleaned_text)
-                logger.debug(f"🧹 تم حذف الهاشتاقات من المهمة {task_id}")
-
-            # 4. Remove phone numbers (improved patterns to avoid years like 2025)
-            if settings.get('remove_phone_numbers', False):
-                # Remove various phone number formats (more specific patterns)
-                phone_patterns = [
-                    r'\+\d{1,4}[-.\s]?\(?\d{1,4}\)?[-.\s]?\d{1,4}[-.\s]?\d{4,9}',  # International with +
-                    r'\b\d{3}[-.\s]\d{3}[-.\s]\d{4}\b',  # US format with separators
-                    r'\b\d{4}[-.\s]\d{3}[-.\s]\d{3}\b',  # Some international with separators
-                    r'\b\d{2}[-.\s]\d{4}[-.\s]\d{4}\b',  # Another format with separators
-                    r'\b\d{10,15}\b',  # Long sequences of digits (10-15 digits) likely phone numbers
-                    r'\(\d{3}\)\s?\d{3}[-.\s]?\d{4}',  # Format like (123) 456-7890
-                ]
-                for pattern in phone_patterns:
-                    cleaned_text = re.sub(pattern, '', cleaned_text)
-                logger.debug(f"🧹 تم حذف أرقام الهواتف من المهمة {task_id}")
-
-            # 5. Remove lines with specific keywords
-            if settings.get('remove_lines_with_keywords', False):
-                keywords = self.db.get_text_cleaning_keywords(task_id)
-                if keywords:
-                    lines = cleaned_text.split('\n')
-                    filtered_lines = []
-                    for line in lines:
-                        should_remove = False
-                        for keyword in keywords:
-                            if keyword.lower() in line.lower():
-                                should_remove = True
-                                break
-                        if not should_remove:
-                            filtered_lines.append(line)
-                    cleaned_text = '\n'.join(filtered_lines)
-                    logger.debug(f"🧹 تم حذف الأسطر التي تحتوي على الكلمات المحددة من المهمة {task_id}")
-
-            # Clean up extra whitespace within lines first
-            lines = cleaned_text.split('\n')
-            cleaned_lines = []
-            for line in lines:
-                # Clean whitespace within each line but preserve the line structure
-                cleaned_line = re.sub(r'[ \t]+', ' ', line.strip())
-                cleaned_lines.append(cleaned_line)
-            cleaned_text = '\n'.join(cleaned_lines)
-
-            # 6. Remove empty lines AFTER all other cleaning operations
-            if settings.get('remove_empty_lines', False):
-                # Split by lines and filter empty ones while preserving structure
-                lines = cleaned_text.split('\n')
-                filtered_lines = []
-
-                for i, line in enumerate(lines):
-                    if line.strip():  # Line has content
-                        filtered_lines.append(line)
-                    else:  # Empty line
-                        # Only keep empty line if it's between two content lines
-                        if (i > 0 and i < len(lines) - 1 and
-                            lines[i-1].strip() and lines[i+1].strip()):
-                            filtered_lines.append('')
-
-                cleaned_text = '\n'.join(filtered_lines)
-                logger.debug(f"🧹 تم حذف الأسطر الفارغة الزائدة من المهمة {task_id} (في النهاية)")
+            cleaned_text = plan.apply(message_text)
 
             if cleaned_text != message_text:
                 logger.info(f"🧹 تم تنظيف النص للمهمة {task_id} - الطول الأصلي: {len(message_text)}, بعد التنظيف: {len(cleaned_text)}")
@@ -578,30 +512,44 @@ class UserbotService:
                     logger.warning(f"⚠️ تجاهل الرسالة - العميل لا ينتمي للمستخدم {user_id}")
                     return
 
-                # Use lock to prevent concurrent processing for this user
-                if user_id not in self.user_locks:
-                    self.user_locks[user_id] = asyncio.Lock()
+                # Route by source chat first: chats without tasks are rejected in O(1)
+                # before any logging or filter work is done
+                source_chat_id = event.chat_id
+                routes = self.task_routes.get(user_id)
+                if not routes:
+                    logger.debug(f"⚠️ لا توجد مهام للمستخدم {user_id}")
+                    return
 
-                async with self.user_locks[user_id]:
-                    # Log incoming message with client's user ID
-                    logger.warning(f"🔔 *** رسالة جديدة عبر عميل المستخدم {user_id} ***")
-                    logger.warning(f"📍 Chat ID: {event.chat_id}, Message: {event.text[:50] if event.text else 'رسالة بدون نص'}...")
-
-                    # Special monitoring for important chats
-                    if event.chat_id == -1002289754739:
-                        logger.error(f"🎯 *** رسالة من محادثة Hidar! Chat ID: {event.chat_id} (عميل {user_id}) ***")
-                        logger.error(f"🎯 *** بدء معالجة الرسالة للتوجيه... ***")
-                    elif event.chat_id == -1002403180244:
-                        logger.error(f"🎯 *** رسالة من محادثة Nuha! Chat ID: {event.chat_id} (عميل {user_id}) ***")
-                        logger.error(f"🎯 *** بدء معالجة الرسالة للتوجيه... ***")
-                    
-                    # Get user tasks for this specific user (the owner of this client)
-                    tasks = self.user_tasks.get(user_id, [])
+                source_username = getattr(event.chat, 'username', None) if routes.has_username_routes else None
+                tasks = routes.lookup(source_chat_id, source_username)
+                if not tasks:
+                    return
+
+                # Queue per (user, source chat): messages from one source keep their order,
+                # different sources are processed concurrently, and a full queue makes us wait
+                await self.message_dispatcher.submit(
+                    (user_id, source_chat_id),
+                    lambda: process_message(event, source_chat_id, source_username, routes, tasks)
+                )
 
+            except Exception as e:
+                logger.error(f"خطأ في معالج الرسائل للمستخدم {user_id}: {e}")
 
-                # Get source chat ID and username first
-                source_chat_id = event.chat_id
-                source_username = getattr(event.chat, 'username', None)
+        async def process_message(event, source_chat_id, source_username, routes, tasks, replay=False):
+            """Apply filters and forward one routed message to its targets
+            replay=True resends a FloodWait retry from the durable queue (limits and delay already applied)"""
+            try:
+                # Log incoming message with client's user ID
+                logger.warning(f"🔔 *** رسالة جديدة عبر عميل المستخدم {user_id} ***")
+                logger.warning(f"📍 Chat ID: {event.chat_id}, Message: {event.text[:50] if event.text else 'رسالة بدون نص'}...")
+
+                # Special monitoring for important chats
+                if event.chat_id == -1002289754739:
+                    logger.error(f"🎯 *** رسالة من محادثة Hidar! Chat ID: {event.chat_id} (عميل {user_id}) ***")
+                    logger.error(f"🎯 *** بدء معالجة الرسالة للتوجيه... ***")
+                elif event.chat_id == -1002403180244:
+                    logger.error(f"🎯 *** رسالة من محادثة Nuha! Chat ID: {event.chat_id} (عميل {user_id}) ***")
+                    logger.error(f"🎯 *** بدء معالجة الرسالة للتوجيه... ***")
 
                 # Special monitoring for the specific chat mentioned by user
                 # Enhanced logging for the specific task
@@ -610,95 +558,79 @@ class UserbotService:
                     logger.warning(f"🎯 *** بدء معالجة الرسالة للتوجيه ***")
                     logger.warning(f"🎯 *** عدد المهام المتاحة: {len(tasks)} ***")
 
-                if not tasks:
-                    logger.warning(f"⚠️ لا توجد مهام للمستخدم {user_id}")
-                    return
-
-                logger.info(f"📋 عدد المهام المتاحة للمستخدم {user_id}: {len(tasks)}")
-
-                # Log all tasks for debugging
-                for i, task in enumerate(tasks, 1):
-                    task_name = task.get('task_name', f"مهمة {task['id']}")
-                    logger.info(f"📋 مهمة {i}: '{task_name}' - مصدر='{task['source_chat_id']}' → هدف='{task['target_chat_id']}'")
-                    if str(task['source_chat_id']) == '-1002289754739':
-                        logger.warning(f"🎯 تم العثور على المهمة المطلوبة: {task_name}")
+                logger.info(f"📋 عدد المهام المطابقة للمحادثة {source_chat_id} (username: {source_username}): {len(tasks)} من أصل {len(routes)}")
 
                 # Check media filters first
                 message_media_type = self.get_message_media_type(event.message)
                 has_text_caption = bool(event.message.text)  # Check if message has text/caption
                 logger.info(f"🎬 نوع الوسائط للرسالة: {message_media_type}, يحتوي على نص/caption: {has_text_caption}")
 
-                # Find matching tasks for this source chat
+                # Load stale settings snapshots off the event loop; the sync checks below then hit the cache
+                await asyncio.gather(*(self.load_task_settings(task['id']) for task in tasks))
+
+                # Apply per-task filters to the tasks routed to this source chat
                 matching_tasks = []
-                logger.info(f"🔍 البحث عن مهام مطابقة للمحادثة {source_chat_id} (username: {source_username})")
+                source_chat_id_str = str(source_chat_id)
 
                 for task in tasks:
-                    task_source_id = str(task['source_chat_id'])
                     task_name = task.get('task_name', f"مهمة {task['id']}")
                     task_id = task.get('id')
 
-                    logger.info(f"🔍 فحص المهمة '{task_name}': مصدر='{task_source_id}' ضد '{source_chat_id}', هدف='{task['target_chat_id']}'")
+                    logger.info(f"✅ مهمة مطابقة '{task_name}': مصدر='{task['source_chat_id']}', هدف='{task['target_chat_id']}'")
 
-                    # Convert both IDs to string and compare
-                    source_chat_id_str = str(source_chat_id)
-                    if task_source_id == source_chat_id_str:
-                        logger.info(f"✅ تطابق مباشر: '{task_source_id}' == '{source_chat_id_str}' (types: {type(task_source_id)}, {type(source_chat_id_str)})")
+                    # Check admin filter first (if enabled) - now based on post_author
+                    logger.error(f"🚨 === بدء فحص فلتر المشرفين للمهمة {task_id} والمرسل {event.sender_id} ===")
 
-                        # Check admin filter first (if enabled) - now based on post_author
-                        logger.error(f"🚨 === بدء فحص فلتر المشرفين للمهمة {task_id} والمرسل {event.sender_id} ===")
-                        
-                        # Log message details for debugging
-                        author_signature = getattr(event.message, 'post_author', None)
-                        logger.error(f"🚨 === تفاصيل الرسالة: sender_id={event.sender_id}, post_author='{author_signature}' ===")
-                        
-                        admin_allowed = await self.is_admin_allowed_by_signature(task_id, event.message, source_chat_id_str)
-                        logger.error(f"🚨 === نتيجة فحص فلتر المشرفين للمهمة {task_id}: {admin_allowed} ===")
-
-                        # Check media filter
-                        media_allowed = self.is_media_allowed(task_id, message_media_type)
-
-                        # Check word filters
-                        message_text = event.message.text or ""
-                        word_filter_allowed = self.is_message_allowed_by_word_filter(task_id, message_text)
-
-                        # Decision is based on the primary media type, not the caption
-                        # For text messages with media, we check the media type
-                        # For pure text messages, we check text filter
-                        if message_media_type == 'text':
-                            # Pure text message - check admin, text filter and word filter
-                            is_message_allowed = admin_allowed and self.is_media_allowed(task_id, 'text') and word_filter_allowed
-                            filter_type = "النص"
-                            logger.error(f"🚨 === فحص رسالة نصية: admin={admin_allowed}, media={self.is_media_allowed(task_id, 'text')}, word={word_filter_allowed}, نتيجة نهائية={is_message_allowed} ===")
-                        else:
-                            # Media message (photo, video, etc.) - check admin, media filter and word filter for caption
-                            is_message_allowed = admin_allowed and media_allowed and word_filter_allowed
-                            filter_type = f"الوسائط ({message_media_type})"
+                    # Log message details for debugging
+                    author_signature = getattr(event.message, 'post_author', None)
+                    logger.error(f"🚨 === تفاصيل الرسالة: sender_id={event.sender_id}, post_author='{author_signature}' ===")
 
-                        logger.error(f"🚨 === قرار نهائي: is_message_allowed = {is_message_allowed} ===")
+                    admin_allowed = await self.is_admin_allowed_by_signature(task_id, event.message, source_chat_id_str)
+                    logger.error(f"🚨 === نتيجة فحص فلتر المشرفين للمهمة {task_id}: {admin_allowed} ===")
 
-                        if is_message_allowed:
-                            logger.error(f"🚨 === إضافة المهمة للقائمة المطابقة ===")
-                            matching_tasks.append(task)
-                            if has_text_caption and message_media_type != 'text':
-                                logger.info(f"✅ الرسالة مسموحة - {filter_type} مسموح مع caption وفلاتر الكلمات")
-                            else:
-                                logger.info(f"✅ {filter_type} مسموح لهذه المهمة وفلاتر الكلمات")
+                    # Check media filter
+                    media_allowed = self.is_media_allowed(task_id, message_media_type)
+
+                    # Check word filters
+                    message_text = event.message.text or ""
+                    word_filter_allowed = self.is_message_allowed_by_word_filter(task_id, message_text)
+
+                    # Decision is based on the primary media type, not the caption
+                    # For text messages with media, we check the media type
+                    # For pure text messages, we check text filter
+                    if message_media_type == 'text':
+                        # Pure text message - check admin, text filter and word filter
+                        is_message_allowed = admin_allowed and media_allowed and word_filter_allowed
+                        filter_type = "النص"
+                        logger.error(f"🚨 === فحص رسالة نصية: admin={admin_allowed}, media={media_allowed}, word={word_filter_allowed}, نتيجة نهائية={is_message_allowed} ===")
+                    else:
+                        # Media message (photo, video, etc.) - check admin, media filter and word filter for caption
+                        is_message_allowed = admin_allowed and media_allowed and word_filter_allowed
+                        filter_type = f"الوسائط ({message_media_type})"
+
+                    logger.error(f"🚨 === قرار نهائي: is_message_allowed = {is_message_allowed} ===")
+
+                    if is_message_allowed:
+                        logger.error(f"🚨 === إضافة المهمة للقائمة المطابقة ===")
+                        matching_tasks.append(task)
+                        if has_text_caption and message_media_type != 'text':
+                            logger.info(f"✅ الرسالة مسموحة - {filter_type} مسموح مع caption وفلاتر الكلمات")
                         else:
-                            logger.error(f"🚨 === رفض المهمة - الرسالة محظورة ===")
-                            # Check which filter blocked the message
-                            if not admin_allowed:
-                                logger.error(f"🚫 الرسالة محظورة بواسطة فلتر المشرفين - المرسل {event.sender_id} غير مسموح")
-                            elif not media_allowed:
-                                logger.error(f"🚫 {filter_type} محظور لهذه المهمة (فلتر الوسائط)")
-                            elif not word_filter_allowed:
-                                logger.error(f"🚫 الرسالة محظورة بواسطة فلتر الكلمات")
-                            else:
-                                if has_text_caption and message_media_type != 'text':
-                                    logger.error(f"🚫 {filter_type} محظور لهذه المهمة (مع caption)")
-                                else:
-                                    logger.error(f"🚫 {filter_type} محظور لهذه المهمة")
+                            logger.info(f"✅ {filter_type} مسموح لهذه المهمة وفلاتر الكلمات")
                     else:
-                        logger.info(f"❌ لا يوجد تطابق للمهمة '{task_name}': '{task_source_id}' != '{source_chat_id_str}' (types: {type(task_source_id)}, {type(source_chat_id_str)})")
+                        logger.error(f"🚨 === رفض المهمة - الرسالة محظورة ===")
+                        # Check which filter blocked the message
+                        if not admin_allowed:
+                            logger.error(f"🚫 الرسالة محظورة بواسطة فلتر المشرفين - المرسل {event.sender_id} غير مسموح")
+                        elif not media_allowed:
+                            logger.error(f"🚫 {filter_type} محظور لهذه المهمة (فلتر الوسائط)")
+                        elif not word_filter_allowed:
+                            logger.error(f"🚫 الرسالة محظورة بواسطة فلتر الكلمات")
+                        else:
+                            if has_text_caption and message_media_type != 'text':
+                                logger.error(f"🚫 {filter_type} محظور لهذه المهمة (مع caption)")
+                            else:
+                                logger.error(f"🚫 {filter_type} محظور لهذه المهمة")
 
                 if not matching_tasks:
                     logger.debug(f"لا توجد مهام مطابقة للمحادثة {source_chat_id} للمستخدم {user_id}")
@@ -709,17 +641,22 @@ class UserbotService:
                 # Check advanced features once per message (using first matching task for settings)
                 first_task = matching_tasks[0]
                 original_text = event.message.text or ""
-                cleaned_text = self.apply_text_cleaning(original_text, first_task['id']) if original_text else original_text
-                modified_text = self.apply_text_replacements(first_task['id'], cleaned_text) if cleaned_text else cleaned_text
+                # Each text stage runs once per (task, stage, input) for this message
+                transforms = TextTransformCache()
+                cleaned_text = transforms.apply(first_task['id'], 'cleaning', original_text,
+                                                lambda text: self.apply_text_cleaning(text, first_task['id']))
+                modified_text = transforms.apply(first_task['id'], 'replacements', cleaned_text,
+                                                 lambda text: self.apply_text_replacements(first_task['id'], text))
                 text_for_limits = modified_text or original_text
 
-                # Check advanced features before processing any targets
-                if not await self._check_advanced_features(first_task['id'], text_for_limits, user_id):
-                    logger.info(f"🚫 الرسالة محظورة بواسطة إحدى الميزات المتقدمة - تم رفضها لجميع الأهداف")
-                    return
+                if not replay:
+                    # Check advanced features before processing any targets
+                    if not await self._check_advanced_features(first_task['id'], text_for_limits, user_id):
+                        logger.info(f"🚫 الرسالة محظورة بواسطة إحدى الميزات المتقدمة - تم رفضها لجميع الأهداف")
+                        return
 
-                # Apply global forwarding delay once per message
-                await self._apply_forwarding_delay(first_task['id'])
+                    # Apply global forwarding delay once per message
+                    await self._apply_forwarding_delay(first_task['id'])
 
                 # Initialize album collector for this user if needed
                 if user_id not in self.album_collectors:
@@ -732,6 +669,8 @@ class UserbotService:
                 # وإعادة استخدامها لكل الأهداف لتحسين الأداء وتقليل استهلاك الموارد
                 processed_media = None
                 processed_filename = None
+                # الوسائط المعالجة ترفع مرة واحدة ويعاد استخدامها لكل الأهداف
+                upload_cache = MediaUploadCache()
                 
                 if event.message.media:
                     # ===== معالجة الوسائط مرة واحدة =====
@@ -752,21 +691,30 @@ class UserbotService:
                         processed_media = event.message.media
                         processed_filename = None
 
-                # Forward message to all target chats
-                for i, task in enumerate(matching_tasks):
+                # Advanced filter results per task: a FloodWait retry must not run the
+                # duplicate filter again (it would match the message stored by the first try)
+                filter_results = {}
+
+                # Forward message to all target chats concurrently; the send scheduler
+                # keeps per-target order/spacing and caps in-flight sends per client.
+                # Returns the FloodWait seconds when Telegram asked to slow down.
+                async def forward_to_target(i, task):
+                    send_slot = None
+                    target_chat_id = str(task['target_chat_id']).strip()
                     try:
-                        target_chat_id = str(task['target_chat_id']).strip()
                         task_name = task.get('task_name', f"مهمة {task['id']}")
 
                         # Check advanced filters for this specific task
                         message = event.message
-                        should_block, should_remove_buttons, should_remove_forward = await self._check_message_advanced_filters(
-                            task['id'], message
-                        )
+                        if task['id'] not in filter_results:
+                            filter_results[task['id']] = await self._check_message_advanced_filters(
+                                task['id'], message, check_duplicates=not replay
+                            )
+                        should_block, should_remove_buttons, should_remove_forward = filter_results[task['id']]
                         
                         if should_block:
                             logger.info(f"🚫 الرسالة محظورة بواسطة فلاتر متقدمة للمهمة {task_name} - تجاهل هذه المهمة")
-                            continue
+                            return
 
                         # Get task forward mode and forwarding settings
                         forward_mode = task.get('forward_mode', 'forward')
@@ -788,7 +736,7 @@ class UserbotService:
                             group_id = event.message.grouped_id
                             if album_collector.is_album_processed(group_id):
                                 logger.info(f"📸 تجاهل رسالة الألبوم - تم معالجتها بالفعل: {group_id}")
-                                continue
+                                return
                             
                             # Add to album collection
                             album_collector.add_message(event.message, {
@@ -810,7 +758,7 @@ class UserbotService:
                                 self._process_album_delayed(user_id, group_id, client)
                             )
                             
-                            continue  # Skip individual processing
+                            return  # Skip individual processing
 
                         # Parse target chat ID
                         if target_chat_id.startswith('@'):
@@ -820,25 +768,29 @@ class UserbotService:
                             target_entity = int(target_chat_id)
                             logger.info(f"🎯 استخدام معرف رقمي كهدف: {target_entity}")
 
-                        # Get target chat info before forwarding
+                        # Get target chat info before forwarding (cached InputPeer: no round-trip)
                         try:
-                            target_chat = await client.get_entity(target_entity)
-                            target_title = getattr(target_chat, 'title', getattr(target_chat, 'first_name', str(target_entity)))
-                            logger.info(f"✅ تم العثور على المحادثة الهدف: {target_title} ({target_entity})")
+                            target_chat = await self.entity_cache.resolve(user_id, client, target_entity)
+                            logger.info(f"✅ تم العثور على المحادثة الهدف: {target_chat.title} ({target_entity})")
+                            target_entity = target_chat.input_peer
+                            target_chat_type = target_chat.chat_type
                         except Exception as entity_error:
                             logger.error(f"❌ لا يمكن الوصول للمحادثة الهدف {target_entity}: {entity_error}")
-                            continue
+                            return
 
                         # Get message formatting settings for this task
                         message_settings = self.get_message_settings(task['id'])
 
                         # Apply text cleaning and replacements (use same as checked above)
-                        cleaned_text = self.apply_text_cleaning(original_text, task['id']) if original_text else original_text
-                        modified_text = self.apply_text_replacements(task['id'], cleaned_text) if cleaned_text else cleaned_text
+                        cleaned_text = transforms.apply(task['id'], 'cleaning', original_text,
+                                                        lambda text: self.apply_text_cleaning(text, task['id']))
+                        modified_text = transforms.apply(task['id'], 'replacements', cleaned_text,
+                                                         lambda text: self.apply_text_replacements(task['id'], text))
 
                         # Apply translation if enabled AND forward mode is copy (skip translation in forward mode)
                         if forward_mode == 'copy':
-                            translated_text = await self.apply_translation(task['id'], modified_text) if modified_text else modified_text
+                            translated_text = await transforms.apply_async(task['id'], 'translation', modified_text,
+                                                                           lambda text: self.apply_translation(task['id'], text))
                             if modified_text != translated_text and modified_text:
                                 logger.info(f"🌐 تم تطبيق الترجمة في وضع النسخ: '{modified_text}' → '{translated_text}'")
                         else:
@@ -846,10 +798,13 @@ class UserbotService:
                             logger.info(f"⏭️ تم تجاهل الترجمة في وضع التوجيه - إرسال الرسالة كما هي")
 
                         # Apply text formatting
-                        formatted_text = self.apply_text_formatting(task['id'], translated_text) if translated_text else translated_text
+                        formatted_text = transforms.apply(task['id'], 'formatting', translated_text,
+                                                          lambda text: self.apply_text_formatting(task['id'], text))
 
                         # Apply header and footer formatting
-                        final_text = self.apply_message_formatting(formatted_text, message_settings)
+                        final_text = transforms.apply(task['id'], 'message_formatting', formatted_text,
+                                                      lambda text: self.apply_message_formatting(text, message_settings),
+                                                      skip_empty=False)
                         
                         # Check if we need to use copy mode due to formatting
                         requires_copy_mode = (
@@ -895,11 +850,38 @@ class UserbotService:
                         if publishing_mode == 'manual':
                             logger.info(f"⏸️ وضع النشر اليدوي - إرسال الرسالة للمراجعة (المهمة: {task_name})")
                             await self._handle_manual_approval(event.message, task, user_id, client)
-                            continue  # Skip automatic forwarding
-                        
-                        # Apply sending interval before each target (except first)
-                        if i > 0:
-                            await self._apply_sending_interval(task['id'])
+                            return  # Skip automatic forwarding
+
+                        # Media that forward mode has to copy (caption removal, album splitting)
+                        text_cleaning_settings = self.get_task_settings(task['id']).text_cleaning_settings
+                        needs_copy_for_caption, needs_copy_for_album = media_copy_flags(
+                            event.message, text_cleaning_settings, forwarding_settings
+                        )
+
+                        sending_interval = self._get_sending_interval(task['id'])
+                        batch_key = (user_id, task['id'], source_chat_id, target_chat_id)
+                        if (self.forward_batcher.enabled and not replay
+                                and can_batch(event.message, forward_mode, requires_copy_mode, text_cleaning_settings,
+                                              forwarding_settings, sending_interval)):
+                            # Pure forward: coalesce with the next messages of this source into one
+                            # forward_messages(target, [ids]) call sent in the background
+                            logger.info(f"📦 إضافة الرسالة {event.message.id} لدفعة التوجيه إلى {target_chat_id}")
+                            self.forward_batcher.add(batch_key, event.message.id, functools.partial(
+                                self._send_forward_batch, user_id, client, task, source_chat_id,
+                                target_chat_id, target_chat, forwarding_settings
+                            ))
+                            return
+
+                        # Anything else sent to this target goes after its pending forward batches
+                        await self.forward_batcher.flush(
+                            lambda key: key[0] == user_id and key[3] == target_chat_id
+                        )
+
+                        # Wait for this target's turn: sending interval (or the interval learned
+                        # from flood waits for this chat type) is the minimum spacing per target
+                        send_slot = await self.send_scheduler.acquire(
+                            user_id, target_chat_id, sending_interval, target_chat_type
+                        )
 
                         # Send message based on forward mode
                         logger.info(f"📨 جاري إرسال الرسالة (وضع تلقائي)...")
@@ -950,7 +932,7 @@ class UserbotService:
                                     # Regular media message with caption handling
                                     # Check if caption should be removed
                                     caption_text = final_text
-                                    text_cleaning_settings = self.db.get_text_cleaning_settings(task['id'])
+                                    text_cleaning_settings = self.get_task_settings(task['id']).text_cleaning_settings
                                     if text_cleaning_settings and text_cleaning_settings.get('remove_caption', False):
                                         caption_text = None
                                         logger.info(f"🗑️ تم حذف التسمية التوضيحية للمهمة {task['id']}")
@@ -976,6 +958,7 @@ class UserbotService:
                                             target_entity,
                                             media_to_send,
                                             filename_to_send,
+                                            upload_cache=upload_cache,
                                             caption=caption_text,
                                             silent=forwarding_settings['silent_notifications'],
                                             parse_mode='HTML' if caption_text else None,
@@ -999,6 +982,7 @@ class UserbotService:
                                             target_entity,
                                             media_to_send,
                                             filename_to_send,
+                                            upload_cache=upload_cache,
                                             caption=caption_text,
                                             silent=forwarding_settings['silent_notifications'],
                                             parse_mode='HTML' if caption_text else None,
@@ -1078,7 +1062,7 @@ class UserbotService:
                                         # Regular media message with caption handling
                                         # Check if caption should be removed
                                         caption_text = final_text
-                                        text_cleaning_settings = self.db.get_text_cleaning_settings(task['id'])
+                                        text_cleaning_settings = self.get_task_settings(task['id']).text_cleaning_settings
                                         if text_cleaning_settings and text_cleaning_settings.get('remove_caption', False):
                                             caption_text = None
                                             logger.info(f"🗑️ تم حذف التسمية التوضيحية للمهمة {task['id']}")
@@ -1104,6 +1088,7 @@ class UserbotService:
                                                 target_entity,
                                                 media_to_send,
                                                 filename_to_send,
+                                                upload_cache=upload_cache,
                                                 caption=caption_text,
                                                 silent=forwarding_settings['silent_notifications'],
                                                 parse_mode='HTML' if caption_text else None,
@@ -1128,6 +1113,7 @@ class UserbotService:
                                                 target_entity,
                                                 media_to_send,
                                                 filename_to_send,
+                                                upload_cache=upload_cache,
                                                 caption=caption_text,
                                                 silent=forwarding_settings['silent_notifications'],
                                                 parse_mode='HTML' if caption_text else None,
@@ -1160,14 +1146,7 @@ class UserbotService:
                                             buttons=original_reply_markup or inline_buttons,
                                         )
                             else:
-                                # Check if we need copy mode for caption removal or album splitting on media
-                                text_cleaning_settings = self.db.get_text_cleaning_settings(task['id'])
-                                needs_copy_for_caption = (event.message.media and 
-                                                        text_cleaning_settings and 
-                                                        text_cleaning_settings.get('remove_caption', False))
-                                needs_copy_for_album = (event.message.media and 
-                                                      forwarding_settings.get('split_album_enabled', False))
-                                
+                                # Copy mode for caption removal or album splitting on media (flags computed above)
                                 if needs_copy_for_caption or needs_copy_for_album:
                                     # Use copy mode for media modifications
                                     if event.message.media:
@@ -1209,6 +1188,7 @@ class UserbotService:
                                                         target_entity,
                                                         media_to_send,
                                                         filename_to_send,
+                                                        upload_cache=upload_cache,
                                                         caption=caption_text,
                                                         silent=forwarding_settings['silent_notifications'],
                                                         force_document=False,
@@ -1222,6 +1202,7 @@ class UserbotService:
                                                         target_entity,
                                                         media_to_send,
                                                         filename_to_send,
+                                                        upload_cache=upload_cache,
                                                         caption=caption_text,
                                                         silent=forwarding_settings['silent_notifications'],
                                                         force_document=False,
@@ -1258,6 +1239,7 @@ class UserbotService:
                                                             target_entity,
                                                             media_to_send,
                                                             filename_to_send,
+                                                            upload_cache=upload_cache,
                                                             caption=caption_text,
                                                             silent=forwarding_settings['silent_notifications'],
                                                             force_document=False,
@@ -1271,6 +1253,7 @@ class UserbotService:
                                                             target_entity,
                                                             media_to_send,
                                                             filename_to_send,
+                                                            upload_cache=upload_cache,
                                                             caption=caption_text,
                                                             silent=forwarding_settings['silent_notifications'],
                                                             force_document=False,
@@ -1299,13 +1282,8 @@ class UserbotService:
 
                             # Save message mapping for synchronization
                             try:
-                                self.db.save_message_mapping(
-                                    task_id=task['id'],
-                                    source_chat_id=str(source_chat_id),
-                                    source_message_id=event.message.id,
-                                    target_chat_id=str(target_chat_id),
-                                    target_message_id=msg_id
-                                )
+                                self.mapping_store.add(task['id'], source_chat_id, event.message.id,
+                                                       target_chat.chat_id or target_chat_id, msg_id)
                                 logger.info(f"💾 تم حفظ تطابق الرسالة للمزامنة: {source_chat_id}:{event.message.id} → {target_chat_id}:{msg_id}")
                             except Exception as mapping_error:
                                 logger.error(f"❌ فشل في حفظ تطابق الرسالة: {mapping_error}")
@@ -1313,17 +1291,20 @@ class UserbotService:
                             # Apply post-forwarding settings
                             await self.apply_post_forwarding_settings(client, target_entity, msg_id, forwarding_settings, task['id'])
 
-                            # Apply sending interval if there are more targets to process
-                            current_index = matching_tasks.index(task)
-                            if current_index < len(matching_tasks) - 1:  # Not the last task
-                                await self._apply_sending_interval(task['id'])
-
                             # If inline buttons are enabled, notify bot to add them
                             if inline_buttons and message_settings['inline_buttons_enabled']:
                                 await self.notify_bot_to_add_buttons(target_chat_id, msg_id, task['id'])
                         else:
                             logger.warning(f"⚠️ تم التوجيه لكن لم يتم الحصول على معرف الرسالة")
 
+                    except (FloodWaitError, SlowModeWaitError) as flood_error:
+                        # Park only this target; the other targets keep sending
+                        if send_slot is not None:
+                            send_slot.report_flood(flood_error.seconds)
+                        else:
+                            self.send_scheduler.report_flood(user_id, target_chat_id, None, flood_error.seconds)
+                        return flood_error.seconds
+
                     except Exception as forward_error:
                         task_name = task.get('task_name', f"مهمة {task['id']}")
                         logger.error(f"❌ فشل في توجيه الرسالة (المهمة: {task_name}) للمستخدم {user_id}")
@@ -1338,16 +1319,57 @@ class UserbotService:
                             logger.error(f"🚫 UserBot محظور في {target_chat_id}")
                         elif "CHANNEL_PRIVATE" in error_str:
                             logger.error(f"🚫 لا يمكن الوصول إلى {target_chat_id} - قناة خاصة")
+                            self.entity_cache.invalidate(user_id, target_chat_id)
                         elif "PEER_ID_INVALID" in error_str:
                             logger.error(f"🚫 معرف المحادثة {target_chat_id} غير صالح أو غير متاح")
+                            self.entity_cache.invalidate(user_id, target_chat_id)
                         elif "CHAT_WRITE_FORBIDDEN" in error_str:
                             logger.error(f"🚫 لا يُسمح للـ UserBot بالكتابة في {target_chat_id}")
                         else:
                             logger.error(f"🚫 خطأ غير معروف: {error_str}")
+                    finally:
+                        if send_slot is not None:
+                            send_slot.release()
+
+                async def retry_after_flood(i, task, flood_seconds):
+                    """Keep retrying a parked target from the durable queue until it goes through"""
+                    target_chat_id = str(task['target_chat_id']).strip()
+                    retry_key = (task['id'], str(source_chat_id), event.message.id, target_chat_id)
+                    try:
+                        for attempt in range(1, FLOOD_RETRY_ATTEMPTS + 1):
+                            await self._send_retry_queue('save_send_retry', user_id, *retry_key, flood_seconds,
+                                                         attempt, f"FloodWait {flood_seconds}s")
+                            logger.info(f"🔁 إعادة محاولة الإرسال إلى {target_chat_id} بعد {flood_seconds} ثانية "
+                                        f"(محاولة {attempt}/{FLOOD_RETRY_ATTEMPTS})")
+                            flood_seconds = await forward_to_target(i, task)
+                            if not flood_seconds:
+                                break
+                        else:
+                            logger.error(f"❌ تجاوز عدد محاولات إعادة الإرسال إلى {target_chat_id} - تم التخلي عن الرسالة {event.message.id}")
+                        await self._send_retry_queue('delete_send_retry', *retry_key)
+                    except Exception as e:
+                        logger.error(f"❌ خطأ في إعادة الإرسال إلى {target_chat_id} (الرسالة {event.message.id}): {e}")
+
+                async def deliver(i, task):
+                    target_chat_id = str(task['target_chat_id']).strip()
+                    parked = self.send_scheduler.parked_for(user_id, target_chat_id)
+                    if parked > 0 or replay:
+                        # Target already parked (or a queued retry): wait behind the flood wait
+                        flood_seconds = parked
+                    else:
+                        flood_seconds = await forward_to_target(i, task)
+                        if not flood_seconds:
+                            return
+                    # Wait in the background so the source queue and other targets keep moving
+                    self._track_send_retry(asyncio.create_task(retry_after_flood(i, task, flood_seconds)))
+
+                await asyncio.gather(*(deliver(i, task) for i, task in enumerate(matching_tasks)))
 
             except Exception as e:
                 logger.error(f"خطأ في معالج الرسائل للمستخدم {user_id}: {e}")
 
+        self.message_processors[user_id] = process_message
+
         @client.on(events.MessageEdited)
         async def message_edit_handler(event):
             """Handle message edit synchronization"""
@@ -1358,12 +1380,14 @@ class UserbotService:
                 logger.info(f"🔄 تم تعديل رسالة: Chat={source_chat_id}, Message={source_message_id}")
 
                 # Get tasks that match this source chat
-                tasks = self.user_tasks.get(user_id, [])
-                matching_tasks = [task for task in tasks if str(task['source_chat_id']) == str(source_chat_id)]
+                routes = self.task_routes.get(user_id)
+                matching_tasks = routes.lookup(source_chat_id) if routes else []
 
                 if not matching_tasks:
                     return
 
+                await asyncio.gather(*(self.load_task_settings(task['id']) for task in matching_tasks))
+
                 # Check sync settings for each matching task
                 for task in matching_tasks:
                     task_id = task['id']
@@ -1375,15 +1399,10 @@ class UserbotService:
                     logger.info(f"🔄 مزامنة التعديل مفعلة للمهمة {task_id}")
 
                     # Find all target messages that were forwarded from this source message
-                    message_mappings = self.db.get_message_mappings_by_source(task_id, source_chat_id, source_message_id)
-
-                    for mapping in message_mappings:
-                        target_chat_id = mapping['target_chat_id']
-                        target_message_id = mapping['target_message_id']
-
+                    for target_chat_id, target_message_id in self.mapping_store.get_targets(task_id, source_chat_id, source_message_id):
                         try:
                             # Get target entity
-                            target_entity = await client.get_entity(int(target_chat_id))
+                            target_entity = (await self.entity_cache.resolve(user_id, client, target_chat_id)).input_peer
 
                             # Update the target message with the edited content
                             await client.edit_message(
@@ -1414,12 +1433,14 @@ class UserbotService:
                 logger.info(f"🗑️ تم حذف رسائل: Chat={source_chat_id}, IDs={deleted_ids}")
 
                 # Get tasks that match this source chat
-                tasks = self.user_tasks.get(user_id, [])
-                matching_tasks = [task for task in tasks if str(task['source_chat_id']) == str(source_chat_id)]
+                routes = self.task_routes.get(user_id)
+                matching_tasks = routes.lookup(source_chat_id) if routes else []
 
                 if not matching_tasks:
                     return
 
+                await asyncio.gather(*(self.load_task_settings(task['id']) for task in matching_tasks))
+
                 # Check sync settings for each matching task and deleted message
                 for task in matching_tasks:
                     task_id = task['id']
@@ -1430,28 +1451,29 @@ class UserbotService:
 
                     logger.info(f"🗑️ مزامنة الحذف مفعلة للمهمة {task_id}")
 
-                    for source_message_id in deleted_ids:
-                        # Find all target messages that were forwarded from this source message
-                        message_mappings = self.db.get_message_mappings_by_source(task_id, source_chat_id, source_message_id)
+                    # Target messages of all deleted ids in one lookup, deleted with one call per target chat
+                    targets_by_source = self.mapping_store.get_targets_bulk(task_id, source_chat_id, deleted_ids)
+                    messages_by_target = defaultdict(list)
+                    for targets in targets_by_source.values():
+                        for target_chat_id, target_message_id in targets:
+                            messages_by_target[target_chat_id].append(target_message_id)
 
-                        for mapping in message_mappings:
-                            target_chat_id = mapping['target_chat_id']
-                            target_message_id = mapping['target_message_id']
-
-                            try:
-                                # Get target entity
-                                target_entity = await client.get_entity(int(target_chat_id))
+                    for target_chat_id, target_message_ids in messages_by_target.items():
+                        try:
+                            # Get target entity
+                            target_entity = (await self.entity_cache.resolve(user_id, client, target_chat_id)).input_peer
 
-                                # Delete the target message
-                                await client.delete_messages(target_entity, target_message_id)
+                            # Delete the target messages
+                            await client.delete_messages(target_entity, target_message_ids)
 
-                                logger.info(f"✅ تم حذف الرسالة المتزامنة: {target_chat_id}:{target_message_id}")
+                            logger.info(f"✅ تم حذف {len(target_message_ids)} رسالة متزامنة من {target_chat_id}")
 
-                                # Remove the mapping from database since message is deleted
-                                self.db.delete_message_mapping(mapping['id'])
+                        except Exception as sync_error:
+                            logger.error(f"❌ فشل في مزامنة حذف الرسالة: {sync_error}")
 
-                            except Exception as sync_error:
-                                logger.error(f"❌ فشل في مزامنة حذف الرسالة: {sync_error}")
+                    # Remove the mappings since the source messages are deleted
+                    if targets_by_source:
+                        self.mapping_store.delete_sources(task_id, source_chat_id, targets_by_source.keys())
 
             except Exception as e:
                 logger.error(f"خطأ في معالج حذف الرسائل للمستخدم {user_id}: {e}")
@@ -1460,10 +1482,22 @@ class UserbotService:
         """Refresh user tasks from database"""
         try:
             tasks = self.db.get_active_user_tasks(user_id)
-            self.user_tasks[user_id] = tasks
+
+            # Build the routing index before publishing it so handlers never
+            # see a half-built table (single reference swap)
+            routes = TaskRoutingIndex(tasks)
+            self.user_tasks[user_id] = routes.tasks
+            self.task_routes[user_id] = routes
+
+            # Resolve targets and sources ahead of the first message
+            client = self.clients.get(user_id)
+            if client is not None:
+                self.entity_cache.schedule_prewarm(user_id, client, [
+                    chat for task in tasks for chat in (task['target_chat_id'], task['source_chat_id'])
+                ])
 
             # Log detailed task information
-            logger.info(f"🔄 تم تحديث {len(tasks)} مهمة للمستخدم {user_id}")
+            logger.info(f"🔄 تم تحديث {len(tasks)} مهمة للمستخدم {user_id} ({routes.source_count()} مصدر)")
 
             if tasks:
                 logger.info(f"📋 تفاصيل المهام المُحدثة للمستخدم {user_id}:")
@@ -1542,12 +1576,30 @@ class UserbotService:
         else:
             return 'text'  # Default fallback
 
+    async def db_call(self, method_name: str, *args, **kwargs):
+        """Call a per-message DB method, preferring the backend's async variant (pooled asyncpg)
+
+        Backends without one are called in the default executor so the sync
+        driver never blocks the event loop shared by every client.
+        """
+        async_method = getattr(self.db, f'async_{method_name}', None)
+        if async_method is not None:
+            return await async_method(*args, **kwargs)
+        method = getattr(self.db, method_name)
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(method, *args, **kwargs))
+
+    def get_task_settings(self, task_id: int) -> TaskSettingsSnapshot:
+        """Cached snapshot of every settings table for a task (no DB reads on cache hit)"""
+        return settings_cache.get(self.db, task_id)
+
+    async def load_task_settings(self, task_id: int) -> TaskSettingsSnapshot:
+        """get_task_settings() for handlers: a reload uses the async DB variants or an executor"""
+        return await settings_cache.get_async(self.db, task_id)
+
     def is_media_allowed(self, task_id, media_type):
         """Check if media type is allowed for this task"""
         try:
-            from database.database import Database
-            db = Database()
-            filters = db.get_task_media_filters(task_id)
+            filters = self.get_task_settings(task_id).media_filters
 
             # Default is allowed if no filter is set
             is_allowed = filters.get(media_type, True)
@@ -1560,8 +1612,7 @@ class UserbotService:
     async def is_admin_allowed_by_signature(self, task_id: int, message, source_chat_id: str) -> bool:
         """Check if admin is allowed based on message post_author signature"""
         try:
-            from database.database import Database
-            db = Database()
+            db = self.db
             
             # Check if admin filter is enabled for this task
             admin_filter_enabled = db.is_advanced_filter_enabled(task_id, 'admin')
@@ -1616,8 +1667,7 @@ class UserbotService:
     async def is_admin_allowed(self, task_id, sender_id):
         """Check if message sender is allowed by admin filters using new logic"""
         try:
-            from database.database import Database
-            db = Database()
+            db = self.db
 
             logger.info(f"👮‍♂️ [ADMIN FILTER] فحص المهمة: {task_id}, المرسل: {sender_id}")
 
@@ -1651,10 +1701,11 @@ class UserbotService:
     def is_message_allowed_by_word_filter(self, task_id, message_text):
         """Check if message is allowed by word filters"""
         try:
-            from database.database import Database
-            db = Database()
-            is_allowed = db.is_message_allowed_by_word_filter(task_id, message_text)
-            logger.info(f"🔍 فحص فلتر الكلمات: المهمة {task_id}, مسموح: {is_allowed}")
+            is_allowed, matched_phrase = check_word_filters(self.get_task_settings(task_id), message_text)
+            if matched_phrase:
+                logger.info(f"🔍 فحص فلتر الكلمات: المهمة {task_id}, مسموح: {is_allowed}, العبارة المطابقة: '{matched_phrase}'")
+            else:
+                logger.info(f"🔍 فحص فلتر الكلمات: المهمة {task_id}, مسموح: {is_allowed}")
             return is_allowed
         except Exception as e:
             logger.error(f"خطأ في فحص فلتر الكلمات: {e}")
@@ -1663,9 +1714,9 @@ class UserbotService:
     def apply_text_replacements(self, task_id, message_text):
         """Apply text replacements to message text"""
         try:
-            from database.database import Database
-            db = Database()
-            modified_text = db.apply_text_replacements(task_id, message_text)
+            modified_text, replacement_count = apply_replacement_rules(self.get_task_settings(task_id), message_text)
+            if replacement_count:
+                logger.info(f"✅ تم تطبيق {replacement_count} استبدال على الرسالة للمهمة {task_id}")
             return modified_text
         except Exception as e:
             logger.error(f"خطأ في تطبيق الاستبدالات النصية: {e}")
@@ -1673,12 +1724,12 @@ class UserbotService:
 
     async def apply_translation(self, task_id: int, message_text: str) -> str:
         """Apply translation to message text if enabled using deep-translator"""
-        if not message_text or not TRANSLATION_AVAILABLE:
+        if not message_text or not self.translation_service:
             return message_text
 
         try:
             # Get translation settings for this task
-            settings = self.db.get_translation_settings(task_id)
+            settings = self.get_task_settings(task_id).translation_settings
             
             if not settings or not settings.get('enabled', False):
                 return message_text
@@ -1694,9 +1745,8 @@ class UserbotService:
             logger.info(f"🌐 بدء ترجمة النص من {source_lang} إلى {target_lang} للمهمة {task_id}")
             
             try:
-                # Use deep-translator for more reliable translation
-                translator = GoogleTranslator(source=source_lang, target=target_lang)
-                translated_text = translator.translate(message_text)
+                # Batched, cached and run in a thread pool (never blocks the event loop)
+                translated_text = await self.translation_service.translate(message_text, source_lang, target_lang)
                 
                 if translated_text and translated_text != message_text:
                     logger.info(f"🌐 تم ترجمة النص بنجاح للمهمة {task_id}: '{message_text[:30]}...' → '{translated_text[:30]}...'")
@@ -1741,12 +1791,8 @@ class UserbotService:
             for target_chat_id, target_items in targets.items():
                 try:
                     # Get target entity
-                    if target_chat_id.startswith('@'):
-                        target_entity = target_chat_id
-                    else:
-                        target_entity = int(target_chat_id)
-                        
-                    target_chat = await client.get_entity(target_entity)
+                    target_chat = await self.entity_cache.resolve(user_id, client, target_chat_id)
+                    target_entity = target_chat.input_peer
                     task_info = target_items[0]['task_info']  # Use first item's task info
                     task = task_info['task']
                     
@@ -1765,7 +1811,7 @@ class UserbotService:
                     final_text = self.apply_message_formatting(formatted_text, message_settings)
                     
                     # Check if caption should be removed
-                    text_cleaning_settings = self.db.get_text_cleaning_settings(task['id'])
+                    text_cleaning_settings = self.get_task_settings(task['id']).text_cleaning_settings
                     if text_cleaning_settings and text_cleaning_settings.get('remove_caption', False):
                         final_text = None
                         logger.info(f"🗑️ تم حذف التسمية التوضيحية للألبوم {task['id']}")
@@ -1797,19 +1843,14 @@ class UserbotService:
                     
                     # Save message mappings for all items
                     if isinstance(forwarded_msg, list):
-                        for i, item in enumerate(target_items):
-                            if i < len(forwarded_msg):
-                                msg_id = forwarded_msg[i].id
-                                try:
-                                    self.db.save_message_mapping(
-                                        task_id=task['id'],
-                                        source_chat_id=str(item['message'].peer_id.channel_id if hasattr(item['message'].peer_id, 'channel_id') else item['message'].chat_id),
-                                        source_message_id=item['message'].id,
-                                        target_chat_id=str(target_chat_id),
-                                        target_message_id=msg_id
-                                    )
-                                except Exception as mapping_error:
-                                    logger.error(f"❌ فشل في حفظ تطابق رسالة الألبوم: {mapping_error}")
+                        try:
+                            self.mapping_store.add_many(
+                                (task['id'], item['message'].chat_id, item['message'].id,
+                                 target_chat.chat_id or target_chat_id, sent.id)
+                                for item, sent in zip(target_items, forwarded_msg)
+                            )
+                        except Exception as mapping_error:
+                            logger.error(f"❌ فشل في حفظ تطابق رسالة الألبوم: {mapping_error}")
                     
                 except Exception as target_error:
                     logger.error(f"❌ فشل في إرسال ألبوم إلى {target_chat_id}: {target_error}")
@@ -1826,9 +1867,7 @@ class UserbotService:
     def get_message_settings(self, task_id: int) -> dict:
         """Get message formatting settings for a task"""
         try:
-            from database.database import Database
-            db = Database()
-            settings = db.get_message_settings(task_id)
+            settings = self.get_task_settings(task_id).message_settings
             logger.info(f"🔧 إعدادات الرسالة للمهمة {task_id}: أزرار إنلاين={settings.get('inline_buttons_enabled', False)}")
             return settings
         except Exception as e:
@@ -1844,9 +1883,7 @@ class UserbotService:
     def get_forwarding_settings(self, task_id: int) -> dict:
         """Get forwarding settings for a task"""
         try:
-            from database.database import Database
-            db = Database()
-            settings = db.get_forwarding_settings(task_id)
+            settings = self.get_task_settings(task_id).forwarding_settings
             logger.info(f"🔧 إعدادات التوجيه للمهمة {task_id}: معاينة الرابط={settings.get('link_preview_enabled', True)}, تثبيت={settings.get('pin_message_enabled', False)}")
             return settings
         except Exception as e:
@@ -1859,6 +1896,59 @@ class UserbotService:
                 'auto_delete_time': 3600
             }
 
+    async def process_watermark_in_worker(self, media_bytes: bytes, file_name: str,
+                                          watermark_settings: dict, task_id: int) -> bytes:
+        """Watermark media once for all targets in the media worker pool (cached per content + settings)"""
+        processor = self.watermark_processor
+        # Hashing the full media and the disk tier both block: keep them off the event loop
+        cache_key = await asyncio.get_running_loop().run_in_executor(
+            None, processor._generate_cache_key, media_bytes, file_name, watermark_settings
+        )
+        cached_media = await processor.media_cache.get_async(cache_key)
+        if cached_media is not None:
+            logger.info(f"🔄 إعادة استخدام الوسائط المعالجة مسبقاً للمهمة {task_id}")
+            return cached_media
+
+        media_type = 'video' if processor.get_media_type_from_file(file_name) == 'video' else 'image'
+        try:
+            result = await self.media_workers.run(media_type, run_watermark_job,
+                                                  media_bytes, file_name, watermark_settings)
+        except Exception as e:
+            logger.error(f"خطأ في معالجة العلامة المائية في العامل للمهمة {task_id}: {e}")
+            return media_bytes
+
+        if result != media_bytes:
+            await processor.media_cache.put_async(cache_key, result)
+        return result
+
+    async def process_audio_in_worker(self, audio_bytes: bytes, file_name: str, metadata_template: Dict[str, str],
+                                      album_art_path: Optional[str] = None, apply_art_to_all: bool = False,
+                                      audio_intro_path: Optional[str] = None, audio_outro_path: Optional[str] = None,
+                                      intro_position: str = 'start', task_id: int = 0) -> bytes:
+        """Process audio tags once for all targets in the media worker pool (cached)"""
+        processor = self.audio_processor
+        cache_key = await asyncio.get_running_loop().run_in_executor(
+            None, processor._generate_cache_key, audio_bytes, file_name, metadata_template, album_art_path,
+            apply_art_to_all, audio_intro_path, audio_outro_path, intro_position
+        )
+        cached_audio = await processor.media_cache.get_async(cache_key)
+        if cached_audio is not None:
+            logger.info(f"🎵 استخدام المقطع الصوتي المعالج من cache للمهمة {task_id}")
+            return cached_audio
+
+        try:
+            result = await self.media_workers.run(
+                'audio', run_audio_job, audio_bytes, file_name, metadata_template, album_art_path,
+                apply_art_to_all, audio_intro_path, audio_outro_path, intro_position
+            )
+        except Exception as e:
+            logger.error(f"خطأ في معالجة الوسوم الصوتية في العامل للمهمة {task_id}: {e}")
+            return audio_bytes
+
+        if result != audio_bytes:
+            await processor.media_cache.put_async(cache_key, result)
+        return result
+
     async def apply_watermark_to_media(self, event, task_id: int):
         """
         Apply watermark to media if enabled for the task - محسن لمعالجة الوسائط مرة واحدة
@@ -1877,7 +1967,7 @@ class UserbotService:
         """
         try:
             # Get watermark settings
-            watermark_settings = self.db.get_watermark_settings(task_id)
+            watermark_settings = self.get_task_settings(task_id).watermark_settings
             logger.info(f"🏷️ فحص إعدادات العلامة المائية للمهمة {task_id}: {watermark_settings}")
             
             if not watermark_settings.get('enabled', False):
@@ -1975,9 +2065,9 @@ class UserbotService:
             # ===== تطبيق العلامة المائية باستخدام الوظيفة المحسنة =====
             # استخدام الوظيفة الجديدة التي تعالج الوسائط مرة واحدة
             # وتحفظها في الذاكرة المؤقتة لإعادة الاستخدام
-            watermarked_media = self.watermark_processor.process_media_once_for_all_targets(
-                media_bytes, 
-                full_file_name, 
+            watermarked_media = await self.process_watermark_in_worker(
+                media_bytes,
+                full_file_name,
                 watermark_settings,
                 task_id
             )
@@ -2014,7 +2104,7 @@ class UserbotService:
         """
         try:
             # Load audio metadata settings from database
-            audio_settings = self.db.get_audio_metadata_settings(task_id)
+            audio_settings = self.get_task_settings(task_id).audio_metadata_settings
             
             if not audio_settings.get('enabled', False):
                 logger.info(f"🎵 الوسوم الصوتية معطلة للمهمة {task_id}")
@@ -2036,7 +2126,7 @@ class UserbotService:
             logger.info(f"🎵 بدء معالجة الوسوم الصوتية للملف {file_name} في المهمة {task_id}")
             
             # Get template settings from the new system
-            template_settings = self.db.get_audio_template_settings(task_id)
+            template_settings = self.get_task_settings(task_id).audio_template_settings
             
             # Convert template settings to metadata template format
             metadata_template = {
@@ -2062,7 +2152,7 @@ class UserbotService:
             outro_path = audio_settings.get('outro_audio_path') if audio_settings.get('audio_merge_enabled') else None
             intro_position = audio_settings.get('intro_position', 'start')
 
-            processed_audio = self.audio_processor.process_audio_once_for_all_targets(
+            processed_audio = await self.process_audio_in_worker(
                 media_bytes,
                 file_name,
                 metadata_template,
@@ -2120,11 +2210,9 @@ class UserbotService:
     def build_inline_buttons(self, task_id: int):
         """Build inline buttons for a task"""
         try:
-            from database.database import Database
             from telethon import Button
 
-            db = Database()
-            buttons_data = db.get_inline_buttons(task_id)
+            buttons_data = self.get_task_settings(task_id).inline_buttons
 
             logger.info(f"🔍 فحص أزرار إنلاين للمهمة {task_id}: تم العثور على {len(buttons_data) if buttons_data else 0} زر")
 
@@ -2216,7 +2304,7 @@ class UserbotService:
     async def _check_character_limits(self, task_id: int, message_text: str) -> bool:
         """Check if message meets character limit requirements"""
         try:
-            settings = self.db.get_character_limit_settings(task_id)
+            settings = self.get_task_settings(task_id).character_limit_settings
             logger.info(f"🔍 إعدادات حد الأحرف للمهمة {task_id}: {settings}")
             
             if not settings or not settings.get('enabled', False):
@@ -2285,7 +2373,7 @@ class UserbotService:
     async def _check_rate_limits(self, task_id: int, user_id: int) -> bool:
         """Check if message meets rate limit requirements"""
         try:
-            settings = self.db.get_rate_limit_settings(task_id)
+            settings = self.get_task_settings(task_id).rate_limit_settings
             if not settings or not settings.get('enabled', False):
                 return True
 
@@ -2295,15 +2383,11 @@ class UserbotService:
             if max_messages <= 0 or time_period_seconds <= 0:
                 return True
 
-            # Check if rate limit is exceeded
-            is_rate_limited = self.db.check_rate_limit(task_id)
-            
-            if is_rate_limited:
+            # In-memory sliding window: checks and records the message in O(1)
+            if not self.rate_limiter.allow(task_id, max_messages, time_period_seconds):
                 logger.info(f"⏰ تم الوصول لحد المعدل: {max_messages} رسالة في {time_period_seconds} ثانية")
                 return False
 
-            # Track this message for rate limiting
-            self.db.track_message_for_rate_limit(task_id)
             logger.debug(f"✅ حد المعدل مقبول: أقل من {max_messages} رسالة في {time_period_seconds} ثانية")
             return True
 
@@ -2314,7 +2398,7 @@ class UserbotService:
     async def _apply_forwarding_delay(self, task_id: int):
         """Apply forwarding delay before sending message"""
         try:
-            settings = self.db.get_forwarding_delay_settings(task_id)
+            settings = self.get_task_settings(task_id).forwarding_delay_settings
             if not settings or not settings.get('enabled', False):
                 return
 
@@ -2329,31 +2413,129 @@ class UserbotService:
         except Exception as e:
             logger.error(f"خطأ في تطبيق تأخير التوجيه: {e}")
 
-    async def _apply_sending_interval(self, task_id: int):
-        """Apply sending interval between messages to different targets"""
+    async def _send_forward_batch(self, user_id: int, client: TelegramClient, task: Dict, source_chat_id: int,
+                                  target_chat_id: str, target_chat: CachedEntity,
+                                  forwarding_settings: Dict, message_ids: List[int]):
+        """Forward a batch of source messages with one API call and record their mappings"""
+        task_name = task.get('task_name', f"مهمة {task['id']}")
         try:
-            settings = self.db.get_sending_interval_settings(task_id)
-            if not settings or not settings.get('enabled', False):
+            source_peer = (await self.entity_cache.resolve(user_id, client, source_chat_id)).input_peer
+
+            forwarded = None
+            for attempt in range(FLOOD_RETRY_ATTEMPTS + 1):
+                send_slot = await self.send_scheduler.acquire(user_id, target_chat_id, 0, target_chat.chat_type)
+                try:
+                    forwarded = await client.forward_messages(
+                        target_chat.input_peer,
+                        message_ids,
+                        from_peer=source_peer,
+                        silent=forwarding_settings['silent_notifications']
+                    )
+                    break
+                except (FloodWaitError, SlowModeWaitError) as flood_error:
+                    send_slot.report_flood(flood_error.seconds)
+                finally:
+                    send_slot.release()
+
+            if forwarded is None:
+                logger.error(f"❌ تجاوز عدد محاولات توجيه دفعة {len(message_ids)} رسالة إلى {target_chat_id} (المهمة: {task_name})")
                 return
 
-            interval_seconds = settings.get('interval_seconds', 0)
-            if interval_seconds <= 0:
+            logger.info(f"📦 تم توجيه {len(message_ids)} رسالة باستدعاء واحد من {source_chat_id} إلى {target_chat_id} (المهمة: {task_name})")
+
+            # forward_messages returns the new messages in the order of the ids (None if one failed)
+            sent = [(source_message_id, forwarded_msg) for source_message_id, forwarded_msg
+                    in zip(message_ids, forwarded) if forwarded_msg]
+            if len(sent) < len(message_ids):
+                logger.warning(f"⚠️ لم يتم توجيه {len(message_ids) - len(sent)} رسالة ضمن الدفعة")
+            try:
+                self.mapping_store.add_many(
+                    (task['id'], source_chat_id, source_message_id, target_chat.chat_id or target_chat_id, forwarded_msg.id)
+                    for source_message_id, forwarded_msg in sent
+                )
+            except Exception as mapping_error:
+                logger.error(f"❌ فشل في حفظ تطابق الرسالة: {mapping_error}")
+
+            for _, forwarded_msg in sent:
+                await self.apply_post_forwarding_settings(client, target_chat.input_peer, forwarded_msg.id, forwarding_settings, task['id'])
+
+        except Exception as e:
+            logger.error(f"❌ فشل في توجيه دفعة الرسائل (المهمة: {task_name}) إلى {target_chat_id}: {e}")
+
+    def _track_send_retry(self, retry_task: asyncio.Task):
+        """Keep a reference to a background retry until it finishes"""
+        self.send_retry_tasks.add(retry_task)
+        retry_task.add_done_callback(self.send_retry_tasks.discard)
+
+    async def _send_retry_queue(self, method_name: str, *args):
+        """Durable FloodWait retry queue call; without it (PostgreSQL backend) retries stay in memory only"""
+        if not hasattr(self.db, method_name):
+            return None
+        try:
+            return await self.db_call(method_name, *args)
+        except Exception as e:
+            logger.error(f"خطأ في طابور إعادة الإرسال ({method_name}): {e}")
+            return None
+
+    async def _replay_send_retries(self, user_id: int, client: TelegramClient):
+        """Resend the FloodWait retries that were queued when the userbot stopped"""
+        try:
+            retries = await self._send_retry_queue('get_send_retries', user_id)
+            if not retries:
                 return
+            logger.info(f"🔁 استئناف {len(retries)} إرسال متوقف بسبب FloodWait للمستخدم {user_id}")
+
+            for retry in retries:
+                retry_key = (retry['task_id'], retry['source_chat_id'], retry['source_message_id'], retry['target_chat_id'])
+                task = next((t for t in self.user_tasks.get(user_id, []) if t['id'] == retry['task_id']
+                             and str(t['target_chat_id']).strip() == retry['target_chat_id']), None)
+                process_message = self.message_processors.get(user_id)
+                # The retry re-queues itself if Telegram still asks to wait
+                await self._send_retry_queue('delete_send_retry', *retry_key)
+                if task is None or process_message is None:
+                    continue
+
+                source_chat_id = int(retry['source_chat_id'])
+                message = await client.get_messages(source_chat_id, ids=retry['source_message_id'])
+                if message is None:
+                    logger.warning(f"⚠️ الرسالة {retry['source_message_id']} لم تعد موجودة - تجاهل إعادة الإرسال")
+                    continue
 
-            logger.info(f"⏱️ تطبيق فاصل الإرسال: {interval_seconds} ثانية للمهمة {task_id}")
-            await asyncio.sleep(interval_seconds)
-            logger.debug(f"✅ انتهى فاصل الإرسال للمهمة {task_id}")
+                self.send_scheduler.park(user_id, retry['target_chat_id'], retry['wait_seconds'])
+                event = events.NewMessage.Event(message)
+                event._set_client(client)
+                await process_message(event, source_chat_id, None, [task], [task], replay=True)
 
         except Exception as e:
-            logger.error(f"خطأ في تطبيق فاصل الإرسال: {e}")
+            logger.error(f"خطأ في استئناف إعادة الإرسال للمستخدم {user_id}: {e}")
 
-    async def _check_message_advanced_filters(self, task_id: int, message) -> tuple:
+    def get_send_backoff_state(self) -> Dict:
+        """FloodWait backoff state of every client plus the durable retry queue size"""
+        state = self.send_scheduler.get_backoff_state()
+        state['pending_retries'] = len(self.send_retry_tasks)
+        state['queued_retries'] = len(self.db.get_send_retries()) if hasattr(self.db, 'get_send_retries') else 0
+        return state
+
+    def _get_sending_interval(self, task_id: int) -> float:
+        """Minimum spacing in seconds between sends of this task to the same target"""
+        try:
+            settings = self.get_task_settings(task_id).sending_interval_settings
+            if not settings or not settings.get('enabled', False):
+                return 0
+
+            return max(0, settings.get('interval_seconds', 0))
+
+        except Exception as e:
+            logger.error(f"خطأ في قراءة فاصل الإرسال: {e}")
+            return 0
+
+    async def _check_message_advanced_filters(self, task_id: int, message, check_duplicates: bool = True) -> tuple:
         """Check advanced filters for forwarded messages and inline buttons
         Returns: (should_block, should_remove_buttons, should_remove_forward)
         """
         try:
             # Get advanced filter settings
-            advanced_settings = self.db.get_advanced_filters_settings(task_id)
+            advanced_settings = self.get_task_settings(task_id).advanced_filters_settings
             
             should_block = False
             should_remove_buttons = False  
@@ -2361,7 +2543,7 @@ class UserbotService:
             
             # Check forwarded message filter
             if advanced_settings.get('forwarded_message_filter_enabled', False):
-                forwarded_setting = self.db.get_forwarded_message_filter_setting(task_id)
+                forwarded_setting = self.get_task_settings(task_id).forwarded_message_filter_setting
                 
                 # Check if message is forwarded
                 is_forwarded = (hasattr(message, 'forward') and message.forward is not None)
@@ -2377,7 +2559,7 @@ class UserbotService:
             # Check inline button filter 
             if not should_block:
                 inline_button_filter_enabled = advanced_settings.get('inline_button_filter_enabled', False)
-                inline_button_setting = self.db.get_inline_button_filter_setting(task_id)
+                inline_button_setting = self.get_task_settings(task_id).inline_button_filter_setting
                 
                 logger.debug(f"🔍 فحص فلتر الأزرار الشفافة: المهمة {task_id}, فلتر مفعل={inline_button_filter_enabled}, إعداد الحظر={inline_button_setting}")
                 
@@ -2406,7 +2588,7 @@ class UserbotService:
                         logger.debug(f"✅ فلتر الأزرار الشفافة غير مفعل - تمرير الرسالة كما هي")
             
             # Check duplicate filter
-            if not should_block and advanced_settings.get('duplicate_filter_enabled', False):
+            if not should_block and check_duplicates and advanced_settings.get('duplicate_filter_enabled', False):
                 duplicate_detected = await self._check_duplicate_message(task_id, message)
                 if duplicate_detected:
                     logger.info(f"🔄 رسالة مكررة - سيتم حظرها (فلتر التكرار)")
@@ -2449,28 +2631,12 @@ class UserbotService:
     def _check_day_filter(self, task_id: int) -> bool:
         """Check if current day is allowed by day filter"""
         try:
-            import datetime
-            
-            # Get current day (0=Monday, 1=Tuesday, ..., 6=Sunday)
-            today = datetime.datetime.now().weekday()
-            
-            # Get day filter settings
-            day_filters = self.db.get_day_filters(task_id)
-            if not day_filters:
-                logger.debug(f"📅 لا توجد إعدادات فلتر الأيام للمهمة {task_id}")
-                return False
+            # Precompiled 7×24 mask, evaluated in the task owner's timezone
+            schedule = get_task_schedule(self.get_task_settings(task_id))
+            now = schedule.local_now()
+            today_name = DAY_NAMES[now.weekday()]
             
-            # Find today's setting
-            today_allowed = True  # Default is allowed
-            for day in day_filters:
-                if day['day_number'] == today:
-                    today_allowed = day['is_allowed']
-                    break
-            
-            day_names = ['الإثنين', 'الثلاثاء', 'الأربعاء', 'الخميس', 'الجمعة', 'السبت', 'الأحد']
-            today_name = day_names[today] if today < len(day_names) else f"يوم {today}"
-            
-            if not today_allowed:
+            if not schedule.day_allowed(now):
                 logger.info(f"📅 فلتر الأيام: اليوم {today_name} محظور - سيتم حظر الرسالة")
                 return True
             else:
@@ -2539,7 +2705,7 @@ class UserbotService:
         """Check admin filter by Telegram Author Signature"""
         try:
             # Get all admin filters for this task
-            admin_filters = self.db.get_admin_filters(task_id)
+            admin_filters = self.get_task_settings(task_id).admin_filters
             if not admin_filters:
                 logger.debug(f"👮‍♂️ لا توجد فلاتر مشرفين للمهمة {task_id}")
                 return False
@@ -2622,7 +2788,7 @@ class UserbotService:
         """Check admin filter by sender ID"""
         try:
             # Check if this sender is in the admin filter list
-            admin_setting = self.db.get_admin_filter_setting(task_id, sender_id)
+            admin_setting = await self.db_call('get_admin_filter_setting', task_id, sender_id)
             if admin_setting is None:
                 # Admin not in filter list - ALLOW by default
                 logger.debug(f"👮‍♂️ المرسل {sender_id} غير موجود في قائمة فلتر المشرفين - سيتم السماح (الافتراضي)")
@@ -2645,45 +2811,20 @@ class UserbotService:
     def _check_working_hours_filter(self, task_id: int) -> bool:
         """Check if current time is within working hours configuration"""
         try:
-            import datetime
-            
-            # Get working hours configuration
-            working_hours = self.db.get_working_hours(task_id)
-            if not working_hours:
-                logger.debug(f"⏰ لا توجد إعدادات ساعات العمل للمهمة {task_id}")
-                return False
-            
-            mode = working_hours.get('mode', 'work_hours')  # 'work_hours' or 'sleep_hours'
-            enabled_hours = working_hours.get('enabled_hours', [])
-            
-            # For now, use UTC+3 (Riyadh timezone) as default
-            timezone_offset = 3
-            
-            # If no hours are configured, don't block
-            if not enabled_hours:
-                logger.debug(f"⏰ لا توجد ساعات محددة في فلتر ساعات العمل للمهمة {task_id}")
-                return False
-            
-            # Get current time with timezone offset (Riyadh = UTC+3)
-            now = datetime.datetime.now() + datetime.timedelta(hours=timezone_offset)
+            # Precompiled 7×24 mask, evaluated in the task owner's timezone
+            schedule = get_task_schedule(self.get_task_settings(task_id))
+            now = schedule.local_now()
             current_hour = now.hour
             
-            logger.info(f"⏰ فحص ساعات العمل للمهمة {task_id}: الساعة الحالية={current_hour:02d} (الرياض), الوضع={mode}")
-            logger.info(f"⏰ الساعات المُحددة: {sorted(enabled_hours)}")
+            logger.info(f"⏰ فحص ساعات العمل للمهمة {task_id}: الساعة الحالية={current_hour:02d} ({schedule.timezone_name}), الوضع={schedule.mode}")
             
-            # Check if current hour is in enabled hours
-            is_in_enabled_hours = current_hour in enabled_hours
-            
-            if mode == 'work_hours':
-                # Work hours mode: Block if NOT in working hours
-                should_block = not is_in_enabled_hours
+            should_block = not schedule.hour_allowed(now)
+            if schedule.mode == 'work_hours':
                 if should_block:
                     logger.info(f"⏰ وضع ساعات العمل: الساعة الحالية {current_hour:02d} خارج ساعات العمل - سيتم حظر الرسالة")
                 else:
                     logger.info(f"⏰ وضع ساعات العمل: الساعة الحالية {current_hour:02d} في ساعات العمل - سيتم توجيه الرسالة")
             else:  # sleep_hours
-                # Sleep hours mode: Block if IN sleep hours
-                should_block = is_in_enabled_hours
                 if should_block:
                     logger.info(f"⏰ وضع ساعات النوم: الساعة الحالية {current_hour:02d} في ساعات النوم - سيتم حظر الرسالة")
                 else:
@@ -2699,7 +2840,7 @@ class UserbotService:
         """Check if message is duplicate based on settings"""
         try:
             # Get duplicate filter settings
-            settings = self.db.get_duplicate_settings(task_id)
+            settings = self.get_task_settings(task_id).duplicate_settings
             
             if not settings:
                 logger.debug(f"❌ لا توجد إعدادات فلتر التكرار للمهمة {task_id}")
@@ -2743,54 +2884,36 @@ class UserbotService:
                         media_hash = str(message.media.document.id)
                         message_media = 'document'
             
-            logger.info(f"📝 محتوى الرسالة للفحص: نص='{message_text[:50]}...', وسائط={message_media}, hash={media_hash}")
+            # Optional perceptual hash of the thumbnail: catches the same image re-uploaded elsewhere
+            media_phash = None
+            if check_media and media_hash and PERCEPTUAL_HASH_ENABLED:
+                media_phash = await self._compute_media_phash(message, media_hash)
             
-            # Check for duplicates in database
-            import time
-            current_time = int(time.time())
-            time_window_seconds = time_window_hours * 3600
-            cutoff_time = current_time - time_window_seconds
-            
-            # Get recent messages from database
-            recent_messages = self.db.get_recent_messages_for_duplicate_check(task_id, cutoff_time)
-            logger.info(f"📊 تم العثور على {len(recent_messages)} رسالة حديثة للمقارنة")
-            
-            for stored_msg in recent_messages:
-                is_duplicate = False
-                stored_text = stored_msg.get('message_text', '')
-                stored_media = stored_msg.get('media_hash', '')
-                
-                # Check text similarity if enabled
-                if check_text and message_text and stored_text:
-                    similarity = self._calculate_text_similarity(message_text, stored_text)
-                    logger.info(f"🔍 مقارنة النص: '{message_text}' مع '{stored_text}' - تشابه={similarity*100:.1f}%")
-                    if similarity >= threshold:
-                        logger.warning(f"🔄 نص مكرر وجد! تشابه={similarity*100:.1f}% >= {threshold*100:.0f}%")
-                        is_duplicate = True
-                
-                # Check media similarity if enabled
-                if check_media and media_hash and stored_media:
-                    logger.info(f"🔍 مقارنة الوسائط: '{media_hash}' مع '{stored_media}'")
-                    if media_hash == stored_media:
-                        logger.warning(f"🔄 وسائط مكررة وجدت: {media_hash}")
-                        is_duplicate = True
-                
-                if is_duplicate:
-                    logger.warning(f"🚫 رسالة مكررة - سيتم رفضها!")
-                    # Update stored message timestamp to current time
-                    self.db.update_message_timestamp_for_duplicate(stored_msg['id'], current_time)
-                    return True
+            logger.info(f"📝 محتوى الرسالة للفحص: نص='{message_text[:50]}...', وسائط={message_media}, hash={media_hash}, phash={media_phash}")
             
-            # Store this message for future duplicate checks
-            logger.info(f"💾 حفظ الرسالة للمراقبة المستقبلية")
-            self.db.store_message_for_duplicate_check(
+            # Look up near-duplicates in the task's in-memory MinHash/LSH index
+            match = self.duplicate_index.check_and_store(
                 task_id=task_id,
                 message_text=message_text,
                 media_hash=media_hash or "",
                 media_type=message_media or "",
-                timestamp=current_time
+                threshold=threshold,
+                window_hours=time_window_hours,
+                check_text=check_text,
+                check_media=check_media,
+                media_phash=media_phash
             )
             
+            if match:
+                if match['reason'] == 'text':
+                    logger.warning(f"🔄 نص مكرر وجد! تشابه={match['similarity']*100:.1f}% >= {threshold*100:.0f}%")
+                elif match['reason'] == 'phash':
+                    logger.warning(f"🔄 وسائط مشابهة بصرياً وجدت: مسافة Hamming={match['distance']}")
+                else:
+                    logger.warning(f"🔄 وسائط مكررة وجدت: {media_hash}")
+                logger.warning(f"🚫 رسالة مكررة - سيتم رفضها!")
+                return True
+            
             logger.info(f"✅ رسالة غير مكررة للمهمة {task_id}")
             return False
             
@@ -2800,36 +2923,32 @@ class UserbotService:
             logger.error(f"تفاصيل الخطأ: {traceback.format_exc()}")
             return False  # Allow message if check fails
             
-    def _calculate_text_similarity(self, text1: str, text2: str) -> float:
-        """Calculate similarity between two texts"""
+    async def _compute_media_phash(self, message, media_hash: str) -> Optional[int]:
+        """Perceptual hash of the media thumbnail (the full media is never downloaded)"""
+        if media_hash in self.media_phash_cache:
+            return self.media_phash_cache[media_hash]
+        media_phash = None
         try:
-            if not text1 or not text2:
-                return 0.0
-                
-            # Simple similarity based on common words
-            words1 = set(text1.lower().split())
-            words2 = set(text2.lower().split())
-            
-            if not words1 and not words2:
-                return 1.0
-            if not words1 or not words2:
-                return 0.0
-                
-            intersection = len(words1.intersection(words2))
-            union = len(words1.union(words2))
-            
-            similarity = intersection / union if union > 0 else 0.0
-            return similarity
-            
+            # Photos: smallest usable size; videos/documents: the cover frame thumbnail
+            sizes = message.photo.sizes if message.photo else getattr(message.document, 'thumbs', None)
+            thumb = select_thumbnail(sizes)
+            if thumb is not None:
+                data = await message.download_media(file=bytes, thumb=thumb)
+                if data:
+                    media_phash = await asyncio.get_running_loop().run_in_executor(None, image_hash, data)
         except Exception as e:
-            logger.error(f"خطأ في حساب تشابه النص: {e}")
-            return 0.0
+            logger.warning(f"⚠️ تعذر حساب البصمة الإدراكية للوسائط {media_hash}: {e}")
+
+        self.media_phash_cache[media_hash] = media_phash
+        while len(self.media_phash_cache) > 1024:
+            self.media_phash_cache.pop(next(iter(self.media_phash_cache)))
+        return media_phash
 
     async def _check_language_filter(self, task_id: int, message) -> bool:
         """Check if message should be blocked by language filter"""
         try:
             # Get language filter data
-            language_data = self.db.get_language_filters(task_id)
+            language_data = self.get_task_settings(task_id).language_filters
             filter_mode = language_data['mode']  # 'allow' or 'block'
             languages = language_data['languages']
             
@@ -2844,7 +2963,7 @@ class UserbotService:
                 logger.debug(f"🌍 رسالة بدون نص - لن يتم فلترتها")
                 return False
             
-            # Simple language detection based on script/characters
+            # Script-based language detection
             detected_language = self._detect_message_language(message_text)
             logger.info(f"🌍 لغة الرسالة المكتشفة: {detected_language}")
             
@@ -2873,50 +2992,9 @@ class UserbotService:
             return False
 
     def _detect_message_language(self, text: str) -> str:
-        """Simple language detection based on character analysis"""
+        """Script-based language detection (cached per text)"""
         try:
-            # Remove spaces and punctuation for analysis
-            clean_text = ''.join(c for c in text if c.isalpha())
-            
-            if not clean_text:
-                return 'unknown'
-            
-            # Count character types
-            arabic_chars = sum(1 for c in clean_text if '\u0600' <= c <= '\u06FF' or '\u0750' <= c <= '\u077F')
-            latin_chars = sum(1 for c in clean_text if 'a' <= c.lower() <= 'z')
-            cyrillic_chars = sum(1 for c in clean_text if '\u0400' <= c <= '\u04FF')
-            
-            total_chars = len(clean_text)
-            
-            # Calculate percentages
-            arabic_ratio = arabic_chars / total_chars if total_chars > 0 else 0
-            latin_ratio = latin_chars / total_chars if total_chars > 0 else 0
-            cyrillic_ratio = cyrillic_chars / total_chars if total_chars > 0 else 0
-            
-            logger.debug(f"🔍 تحليل النص: عربي={arabic_ratio:.2f}, لاتيني={latin_ratio:.2f}, كيريلي={cyrillic_ratio:.2f}")
-            
-            # Determine primary language (threshold: 30%)
-            if arabic_ratio > 0.3:
-                return 'ar'
-            elif latin_ratio > 0.3:
-                # Additional check for common English patterns
-                english_words = ['the', 'and', 'or', 'is', 'are', 'was', 'were', 'to', 'of', 'in', 'on', 'at', 'for']
-                text_lower = text.lower()
-                english_count = sum(1 for word in english_words if word in text_lower)
-                if english_count >= 2 or 'english' in text_lower:
-                    return 'en'
-                return 'en'  # Default to English for Latin script
-            elif cyrillic_ratio > 0.3:
-                return 'ru'
-            else:
-                # For mixed or unclear text, try to detect by common patterns
-                text_lower = text.lower()
-                if any(word in text_lower for word in ['hello', 'hi', 'good', 'yes', 'no', 'thank']):
-                    return 'en'
-                elif any(word in text_lower for word in ['مرحبا', 'أهلا', 'نعم', 'لا', 'شكرا']):
-                    return 'ar'
-                return 'unknown'
-                
+            return language_detector.detect(text)
         except Exception as e:
             logger.error(f"خطأ في كشف اللغة: {e}")
             return 'unknown'
@@ -2929,8 +3007,8 @@ class UserbotService:
             task_name = task.get('task_name', f"مهمة {task_id}")
             
             # Check if approval already sent for this message (prevent duplicates)
-            existing_approval = self.db.get_pending_message_by_source(
-                task_id, str(message.chat_id), message.id
+            existing_approval = await self.db_call(
+                'get_pending_message_by_source', task_id, str(message.chat_id), message.id
             )
             if existing_approval:
                 logger.info(f"⏭️ تم تجاهل رسالة مكررة - موافقة موجودة مسبقاً (ID: {existing_approval['id']})")
@@ -2947,7 +3025,8 @@ class UserbotService:
             }
             
             # Store pending message in database
-            pending_id = self.db.add_pending_message(
+            pending_id = await self.db_call(
+                'add_pending_message',
                 task_id=task_id,
                 user_id=user_id,
                 source_chat_id=str(message.chat_id),
@@ -2958,8 +3037,7 @@ class UserbotService:
             
             # Get source chat info
             try:
-                source_chat = await client.get_entity(message.chat_id)
-                source_name = getattr(source_chat, 'title', getattr(source_chat, 'first_name', 'غير معروف'))
+                source_name = (await self.entity_cache.resolve(user_id, client, message.chat_id)).title
             except:
                 source_name = str(message.chat_id)
             
@@ -3071,6 +3149,9 @@ class UserbotService:
     async def stop_user(self, user_id: int):
         """Stop userbot for specific user"""
         try:
+            # Send the forward batches still waiting for their window
+            await self.forward_batcher.flush(lambda key: key[0] == user_id)
+
             if user_id in self.clients:
                 client = self.clients[user_id]
                 await client.disconnect()
@@ -3078,6 +3159,11 @@ class UserbotService:
 
             if user_id in self.user_tasks:
                 del self.user_tasks[user_id]
+            self.task_routes.pop(user_id, None)
+
+            # Drop queued messages of this user's sources
+            await self.message_dispatcher.stop(lambda key: key[0] == user_id)
+            self.entity_cache.forget_client(user_id)
 
             logger.info(f"تم إيقاف UserBot للمستخدم {user_id}")
 
@@ -3092,6 +3178,19 @@ class UserbotService:
             for user_id in list(self.clients.keys()):
                 await self.stop_user(user_id)
 
+            self.media_workers.shutdown()
+            if self.translation_service:
+                self.translation_service.shutdown()
+            self.rate_limiter.snapshot()
+            self.mapping_store.flush()
+            # Parked sends stay in send_retry_queue and are replayed on the next start
+            for retry_task in list(self.send_retry_tasks):
+                retry_task.cancel()
+
+            # Close the async DB pool bound to this event loop (PostgreSQL only)
+            if hasattr(self.db, 'close_async_pool'):
+                await self.db.close_async_pool()
+
             logger.info("تم إيقاف جميع UserBot clients")
 
         except Exception as e:
@@ -3465,10 +3564,12 @@ class UserbotService:
                 # Clean up data structures
                 if user_id in self.user_tasks:
                     del self.user_tasks[user_id]
+                self.task_routes.pop(user_id, None)
                 if user_id in self.album_collectors:
                     del self.album_collectors[user_id]
                 if user_id in self.session_health_status:
                     del self.session_health_status[user_id]
+                await self.message_dispatcher.stop(lambda key: key[0] == user_id)
                 
                 # Release session lock
                 if user_id in self.session_locks:
@@ -3602,7 +3703,7 @@ class UserbotService:
                 return message_text
 
             # Get text formatting settings
-            formatting_settings = self.db.get_text_formatting_settings(task_id)
+            formatting_settings = self.get_task_settings(task_id).text_formatting_settings
 
             if not formatting_settings or not formatting_settings.get('text_formatting_enabled', False):
                 return message_text
@@ -8,6 +8,7 @@
 3. تحسين ضغط الفيديو لتقليل الحجم
 4. إصلاح مشاكل الذاكرة المؤقتة
 5. تحسين معالجة الأخطاء
+6. محرك FFmpeg بتمريرة overlay واحدة للفيديو (OpenCV كبديل)
 
 المتطلبات:
 - FFmpeg لتحسين الفيديو
@@ -23,8 +24,8 @@ from typing import Optional, Tuple, Union, Dict, Any
 import tempfile
 import subprocess
 import json
-import hashlib
 import time
+from media_cache import get_media_cache
 
 logger = logging.getLogger(__name__)
 
@@ -36,10 +37,8 @@ class WatermarkProcessor:
         self.supported_image_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
         self.supported_video_formats = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm']
         
-        # Cache للملفات المعالجة مسبقاً مع تحسين
-        self.processed_media_cache = {}
-        self.cache_max_size = 100  # زيادة حجم الذاكرة المؤقتة
-        self.cache_cleanup_threshold = 80
+        # Cache مشترك للملفات المعالجة مسبقاً (محدود بالبايتات مع طبقة قرص اختيارية)
+        self.media_cache = get_media_cache()
         
         # التحقق من توفر FFmpeg
         self.ffmpeg_available = self._check_ffmpeg_availability()
@@ -53,6 +52,11 @@ class WatermarkProcessor:
         self.default_video_quality = 'medium'
         self.default_video_crf = 23
         self.default_audio_bitrate = '128k'
+
+        # محرك الفيديو: 'ffmpeg' (تمريرة overlay واحدة) أو 'opencv' (المعالجة القديمة إطاراً بإطار)
+        self.video_engine = os.getenv('WATERMARK_VIDEO_ENGINE', 'ffmpeg').lower()
+        self.video_preset = os.getenv('WATERMARK_VIDEO_PRESET', 'veryfast')
+        self.video_crf = int(os.getenv('WATERMARK_VIDEO_CRF', str(self.default_video_crf)))
         
         logger.info("🚀 تم تهيئة معالج العلامة المائية بنجاح")
     
@@ -69,24 +73,12 @@ class WatermarkProcessor:
         except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired):
             return False
     
-    def _generate_cache_key(self, media_bytes: bytes, file_name: str, watermark_settings: dict, task_id: int) -> str:
-        """إنشاء مفتاح فريد للذاكرة المؤقتة"""
-        # إنشاء hash من البيانات والإعدادات
-        content_hash = hashlib.md5(media_bytes).hexdigest()
-        settings_hash = hashlib.md5(json.dumps(watermark_settings, sort_keys=True).encode()).hexdigest()
-        return f"{task_id}_{content_hash}_{settings_hash}_{file_name}"
-    
-    def _cleanup_cache(self):
-        """تنظيف الذاكرة المؤقتة إذا أصبحت كبيرة جداً"""
-        if len(self.processed_media_cache) > self.cache_cleanup_threshold:
-            # حذف أقدم 20% من العناصر
-            items_to_remove = int(len(self.processed_media_cache) * 0.2)
-            oldest_keys = list(self.processed_media_cache.keys())[:items_to_remove]
-            
-            for key in oldest_keys:
-                del self.processed_media_cache[key]
-            
-            logger.info(f"🧹 تم تنظيف الذاكرة المؤقتة: حذف {items_to_remove} عنصر")
+    def _generate_cache_key(self, media_bytes: bytes, file_name: str, watermark_settings: dict) -> str:
+        """إنشاء مفتاح فريد للذاكرة المؤقتة (hash المحتوى + بصمة الإعدادات)
+
+        لا يتضمن رقم المهمة، فالمهام ذات الإعدادات المتطابقة تشارك نفس النتيجة
+        """
+        return self.media_cache.make_key('watermark', media_bytes, file_name, watermark_settings)
     
     def calculate_position(self, base_size: Tuple[int, int], watermark_size: Tuple[int, int], position: str, offset_x: int = 0, offset_y: int = 0) -> Tuple[int, int]:
         """حساب موقع العلامة المائية على الصورة/الفيديو مع الإزاحة اليدوية"""
@@ -827,6 +819,135 @@ class WatermarkProcessor:
                         pass
             return None
     
+    def _probe_display_size(self, video_path: str) -> Optional[Tuple[int, int]]:
+        """أبعاد الفيديو كما تُعرض (مع مراعاة الدوران) باستخدام ffprobe"""
+        try:
+            cmd = [
+                'ffprobe', '-v', 'quiet', '-print_format', 'json',
+                '-select_streams', 'v:0', '-show_streams', video_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=30)
+            streams = json.loads(result.stdout).get('streams', [])
+            if not streams:
+                return None
+
+            stream = streams[0]
+            width, height = int(stream.get('width', 0)), int(stream.get('height', 0))
+            rotation = stream.get('tags', {}).get('rotate')
+            for side_data in stream.get('side_data_list', []):
+                if 'rotation' in side_data:
+                    rotation = side_data['rotation']
+            if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+                width, height = height, width
+            return (width, height) if width and height else None
+        except Exception as e:
+            logger.warning(f"فشل في قراءة أبعاد الفيديو باستخدام ffprobe: {e}")
+            return None
+
+    def render_video_watermark_png(self, watermark_settings: dict, frame_size: Tuple[int, int]) -> Optional[Tuple[str, Tuple[int, int]]]:
+        """رسم العلامة المائية مرة واحدة كملف PNG شفاف، يعيد (المسار، الحجم)"""
+        watermark_pil = None
+        if watermark_settings.get('watermark_type') == 'text' and watermark_settings.get('watermark_text'):
+            color = watermark_settings.get('text_color', '#FFFFFF')
+            if watermark_settings.get('use_original_color', False):
+                color = '#FFFFFF'
+            watermark_pil = self.create_text_watermark(
+                watermark_settings['watermark_text'],
+                watermark_settings.get('font_size', 32),
+                color,
+                watermark_settings.get('opacity', 70),
+                frame_size
+            )
+        elif watermark_settings.get('watermark_type') == 'image' and watermark_settings.get('watermark_image_path'):
+            watermark_pil = self.load_image_watermark(
+                watermark_settings['watermark_image_path'],
+                watermark_settings.get('size_percentage', 20),
+                watermark_settings.get('opacity', 70),
+                frame_size,
+                watermark_settings.get('position', 'bottom_right')
+            )
+
+        if watermark_pil is None:
+            return None
+
+        png_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
+        png_file.close()
+        watermark_pil.save(png_file.name, 'PNG')
+        return png_file.name, watermark_pil.size
+
+    def apply_watermark_to_video_ffmpeg(self, video_path: str, watermark_settings: dict) -> Optional[str]:
+        """تطبيق العلامة المائية على الفيديو في تمريرة FFmpeg واحدة
+
+        العلامة المائية تُرسم مرة واحدة كـ PNG ثم تُدمج بفلتر overlay،
+        مع نسخ الصوت كما هو (stream copy) وترميز واحد فقط للفيديو.
+        """
+        if not self.ffmpeg_available:
+            return None
+
+        watermark_png = None
+        output_path = None
+        try:
+            frame_size = self._probe_display_size(video_path)
+            if not frame_size:
+                return None
+
+            rendered = self.render_video_watermark_png(watermark_settings, frame_size)
+            if not rendered:
+                logger.warning("⚠️ لا توجد علامة مائية صالحة للفيديو")
+                return None
+            watermark_png, watermark_size = rendered
+
+            x, y = self.calculate_position(
+                frame_size,
+                watermark_size,
+                watermark_settings.get('position', 'bottom_right'),
+                watermark_settings.get('offset_x', 0),
+                watermark_settings.get('offset_y', 0)
+            )
+
+            preset = watermark_settings.get('video_preset') or self.video_preset
+            crf = watermark_settings.get('video_crf') or self.video_crf
+            output_path = tempfile.mktemp(suffix='.mp4')
+
+            # libx264 + yuv420p requires even dimensions
+            filter_graph = f"[0:v][1:v]overlay={x}:{y}:format=auto,scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p[v]"
+            base_cmd = [
+                'ffmpeg', '-y', '-v', 'error',
+                '-i', video_path,
+                '-i', watermark_png,
+                '-filter_complex', filter_graph,
+                '-map', '[v]', '-map', '0:a?',
+                '-c:v', 'libx264', '-preset', str(preset), '-crf', str(crf),
+                '-movflags', '+faststart',
+            ]
+
+            start = time.time()
+            result = subprocess.run(base_cmd + ['-c:a', 'copy', output_path], capture_output=True, text=True)
+            if result.returncode != 0:
+                # The source audio codec cannot be stored in MP4 as-is
+                logger.info("🔊 تعذر نسخ الصوت مباشرة، إعادة ترميزه إلى AAC")
+                result = subprocess.run(base_cmd + ['-c:a', 'aac', '-b:a', self.default_audio_bitrate, output_path],
+                                        capture_output=True, text=True)
+
+            if result.returncode != 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+                logger.warning(f"فشل محرك FFmpeg للعلامة المائية: {result.stderr[-500:]}")
+                if os.path.exists(output_path):
+                    os.unlink(output_path)
+                return None
+
+            logger.info(f"✅ تم تطبيق العلامة المائية بتمريرة FFmpeg واحدة في {time.time() - start:.1f} ثانية "
+                        f"(preset={preset}, crf={crf})")
+            return output_path
+
+        except Exception as e:
+            logger.error(f"خطأ في محرك FFmpeg للعلامة المائية: {e}")
+            if output_path and os.path.exists(output_path):
+                os.unlink(output_path)
+            return None
+        finally:
+            if watermark_png and os.path.exists(watermark_png):
+                os.unlink(watermark_png)
+
     def should_apply_watermark(self, media_type: str, watermark_settings: dict) -> bool:
         """تحديد ما إذا كان يجب تطبيق العلامة المائية على نوع الوسائط - مُصلح"""
         if not watermark_settings.get('enabled', False):
@@ -887,6 +1008,18 @@ class WatermarkProcessor:
                 temp_input.close()
                 
                 try:
+                    # المحرك السريع: تمريرة FFmpeg واحدة بدون إعادة ضغط لاحقة
+                    if self.video_engine == 'ffmpeg' and self.ffmpeg_available:
+                        fast_path = self.apply_watermark_to_video_ffmpeg(temp_input.name, watermark_settings)
+                        if fast_path:
+                            with open(fast_path, 'rb') as f:
+                                watermarked_bytes = f.read()
+                            os.unlink(fast_path)
+                            os.unlink(temp_input.name)
+                            logger.info(f"✅ تم معالجة الفيديو بنجاح (FFmpeg): {file_name}")
+                            return watermarked_bytes
+                        logger.warning("⚠️ فشل محرك FFmpeg، استخدام OpenCV كبديل")
+
                     # تطبيق العلامة المائية
                     watermarked_path = self.apply_watermark_to_video(temp_input.name, watermark_settings)
                     
@@ -936,19 +1069,19 @@ class WatermarkProcessor:
         """معالجة الوسائط مرة واحدة وإعادة استخدامها لكل الأهداف - مُصلح"""
         try:
             # إنشاء مفتاح فريد للملف
-            cache_key = self._generate_cache_key(media_bytes, file_name, watermark_settings, task_id)
-            
-            # التحقق من وجود الملف في الذاكرة المؤقتة
-            if cache_key in self.processed_media_cache:
-                logger.info(f"🔄 إعادة استخدام الوسائط المعالجة مسبقاً للمهمة {task_id}")
-                return self.processed_media_cache[cache_key]
-            
-            # التحقق من أن العلامة المائية مفعلة
+            # التحقق من أن العلامة المائية مفعلة (لا حاجة لتخزين الملف الأصلي)
             if not watermark_settings.get('enabled', False):
                 logger.info(f"🏷️ العلامة المائية معطلة للمهمة {task_id}")
-                self.processed_media_cache[cache_key] = media_bytes
                 return media_bytes
             
+            cache_key = self._generate_cache_key(media_bytes, file_name, watermark_settings)
+            
+            # التحقق من وجود الملف في الذاكرة المؤقتة
+            cached_media = self.media_cache.get(cache_key)
+            if cached_media is not None:
+                logger.info(f"🔄 إعادة استخدام الوسائط المعالجة مسبقاً للمهمة {task_id}")
+                return cached_media
+            
             # تحديد نوع الوسائط
             media_type = self.get_media_type_from_file(file_name)
             logger.info(f"🎬 نوع الوسائط: {media_type}, اسم الملف: {file_name}")
@@ -956,7 +1089,6 @@ class WatermarkProcessor:
             # التحقق من تطبيق العلامة المائية على نوع الوسائط
             if not self.should_apply_watermark(media_type, watermark_settings):
                 logger.info(f"🏷️ العلامة المائية لا تطبق على {media_type} للمهمة {task_id}")
-                self.processed_media_cache[cache_key] = media_bytes
                 return media_bytes
             
             # معالجة الوسائط
@@ -964,17 +1096,11 @@ class WatermarkProcessor:
             
             if processed_media and processed_media != media_bytes:
                 # حفظ النتيجة في الذاكرة المؤقتة
-                self.processed_media_cache[cache_key] = processed_media
+                self.media_cache.put(cache_key, processed_media)
                 logger.info(f"✅ تم معالجة الوسائط وحفظها في الذاكرة المؤقتة للمهمة {task_id}")
-                
-                # تنظيف الذاكرة المؤقتة إذا أصبحت كبيرة جداً
-                self._cleanup_cache()
-                
                 return processed_media
             else:
-                # إذا لم يتم تطبيق العلامة المائية، احفظ الملف الأصلي
                 logger.warning(f"⚠️ فشل في معالجة الوسائط للمهمة {task_id}")
-                self.processed_media_cache[cache_key] = media_bytes
                 return media_bytes
                 
         except Exception as e:
@@ -983,18 +1109,13 @@ class WatermarkProcessor:
     
     def clear_cache(self):
         """مسح الذاكرة المؤقتة"""
-        cache_size = len(self.processed_media_cache)
-        self.processed_media_cache.clear()
+        cache_size = self.media_cache.get_stats('watermark')['entries']
+        self.media_cache.clear('watermark')
         logger.info(f"🧹 تم مسح الذاكرة المؤقتة للعلامة المائية ({cache_size} عنصر)")
     
     def get_cache_stats(self):
         """الحصول على إحصائيات الذاكرة المؤقتة"""
-        return {
-            'cache_size': len(self.processed_media_cache),
-            'cache_keys': list(self.processed_media_cache.keys()),
-            'cache_max_size': self.cache_max_size,
-            'cleanup_threshold': self.cache_cleanup_threshold
-        }
+        return self.media_cache.get_stats('watermark')
 
     def compress_video_preserve_quality(self, input_path: str, output_path: str, target_size_mb: float = None) -> bool:
         """ضغط الفيديو مع الحفاظ على الدقة والجودة - محسن لحل مشكلة الحجم الكبير"""